@@ -0,0 +1,46 @@
+"""gunicorn.conf.py: Gunicorn configuration for the web server"""
+
+import gc
+import os
+
+from src.web.cpu import apply_thread_env, get_thread_budget
+
+# Split the container's CPU quota between the workers and their inference threads
+budget = get_thread_budget(
+    workers=int(os.environ.get("WEB_CONCURRENCY", 0)) or None,
+    threads_per_worker=int(os.environ.get("OCR_CPU_THREADS", 0)) or None,
+)
+os.environ["OCR_CPU_THREADS"] = str(budget.threads_per_worker)
+apply_thread_env(budget.threads_per_worker)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = budget.workers
+worker_class = "uvicorn.workers.UvicornWorker"
+worker_tmp_dir = "/dev/shm"
+timeout = 200
+
+# Recycle the workers after a number of requests (0 disables it), the jitter staggers
+# the restarts of the workers. The workers also recycle themselves when their RSS is
+# over WORKER_MAX_RSS_MB. A recycled worker finishes its in-flight requests first.
+max_requests = int(os.environ.get("MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", max_requests // 10))
+graceful_timeout = timeout
+
+# Load the app (and the OCR model weights) in the master process before forking,
+# so that the workers share the weights' memory pages copy-on-write. This is only the
+# default for the ONNX backend, whose sessions are created lazily in the workers: the
+# Paddle predictors create their thread pools with the weights, which would be
+# inherited through the fork
+default_preload = os.environ.get("OCR_ENGINE", "paddle").lower() == "onnx"
+os.environ.setdefault("PRELOAD_MODELS", "1" if default_preload else "0")
+preload_app = os.environ["PRELOAD_MODELS"] == "1"
+
+
+def when_ready(server):
+    server.log.info(
+        f"CPU quota: {budget.cpus:.2f}, workers: {budget.workers}, "
+        f"threads per worker: {budget.threads_per_worker}"
+    )
+    # Move the preloaded objects out of the garbage collector's reach, so that the
+    # collections in the workers do not touch (and copy) the shared pages
+    gc.freeze()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""batching.py: Contains the cross-request micro-batching scheduler for text recognition"""
+
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .engine import RecognitionResultType
+
+
+class _BatchRequest:
+    """The text crops submitted by a single request and their recognition results."""
+
+    def __init__(self, crops: List[np.ndarray]):
+        self.crops = crops
+        self.results: Optional[RecognitionResultType] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class RecognitionBatcher:
+    """Collects the text crops of concurrent requests into a single recognition pass.
+
+    The first request to arrive opens a batch window of `max_wait_ms`. Crops from the
+    requests that arrive within the window are appended to the batch until it holds at
+    least `max_batch_size` crops, at which point it is dispatched early. The crops of a
+    single request are never split across batches, and each request receives exactly its
+    own results in the order it submitted them. `recognize` is called with all the crops
+    of a batch, and should run them in a single forward pass (see
+    `OCREngine.enable_recognition_batching`). A sheet has around a hundred text crops,
+    so the default `max_batch_size` lets a batch combine the crops of a few requests.
+    """
+
+    def __init__(
+        self,
+        recognize: Callable[[List[np.ndarray]], RecognitionResultType],
+        max_batch_size: Optional[int] = 128,
+        max_wait_ms: Optional[float] = 5.0,
+    ):
+        self.recognize = recognize
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.num_batches = 0
+        self.num_crops = 0
+
+        self._queue: "queue.Queue[_BatchRequest]" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="recognition-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, crops: List[np.ndarray]) -> RecognitionResultType:
+        """Submits the text crops of a request and blocks until they are recognized.
+
+        Args:
+            crops (List[np.ndarray]): The text crops
+
+        Returns:
+            RecognitionResultType: The recognized text and confidence score for each crop
+        """
+        if not crops:
+            return []
+
+        request = _BatchRequest(crops)
+        self._queue.put(request)
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _collect(self) -> List[_BatchRequest]:
+        """Blocks until a request arrives, then collects requests until the batch is full
+        or the batch window closes."""
+        requests = [self._queue.get()]
+        num_crops = len(requests[0].crops)
+        deadline = time.monotonic() + self.max_wait
+
+        while num_crops < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            num_crops += len(request.crops)
+
+        return requests
+
+    def _run(self) -> None:
+        while True:
+            requests = self._collect()
+            crops = [crop for request in requests for crop in request.crops]
+
+            try:
+                results = self.recognize(crops)
+            except Exception as e:
+                for request in requests:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            self.num_batches += 1
+            self.num_crops += len(crops)
+
+            # Route the results back to their requests
+            offset = 0
+            for request in requests:
+                request.results = results[offset : offset + len(request.crops)]
+                offset += len(request.crops)
+                request.done.set()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""benchmark.py: Contains the speed/accuracy benchmark of the OCR engine presets"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from .common import compute_votes_accuracy, get_corpus_images
+from .engine import get_det_input_size, load_image
+from .ocr import ENGINE_PRESETS, OCR_ENGINE_BACKENDS, get_ocr_engine
+from .pipeline import parse_ocr_results
+from .types import ResultsMap
+
+
+def benchmark_preset(
+    backend: str, preset: str, image_paths: List[Path], cpu_threads: int
+) -> Dict[str, Any]:
+    """Runs the OCR pipeline with the engine of a preset on the benchmark images.
+
+    Args:
+        backend (str): The OCR engine backend, one of `OCR_ENGINE_BACKENDS`
+        preset (str): The preset, one of `ENGINE_PRESETS`
+        image_paths (List[Path]): The benchmark images
+        cpu_threads (int): The number of CPU threads used by the inference runtime
+
+    Returns:
+        dict: The latencies (in seconds) and the party vote results of each image
+    """
+    engine = get_ocr_engine(backend, cpu_threads, preset=preset)
+    # Warm up the engine, the first inference initializes the runtime
+    engine.ocr(load_image(str(image_paths[0])))
+
+    latencies, results = [], {}
+    for p in image_paths:
+        image = load_image(str(p))
+        start = time.perf_counter()
+        bboxes, texts, scores = engine.ocr(image)
+        latencies.append(time.perf_counter() - start)
+        results[p.name] = parse_ocr_results(bboxes, texts, scores)[0]
+
+    return {
+        "mean_latency_s": float(np.mean(latencies)),
+        "p95_latency_s": float(np.percentile(latencies, 95)),
+        "results": results,
+    }
+
+
+def get_det_input_sizes(preset: str, image_paths: List[Path]) -> Dict[str, List[int]]:
+    """Returns the size of the detector's input for the benchmark images with a preset.
+
+    The sizes are computed from the image sizes, the models are not run.
+
+    Args:
+        preset (str): The preset, one of `ENGINE_PRESETS`
+        image_paths (List[Path]): The benchmark images
+
+    Returns:
+        dict: Map of the image names to the height and width of the detector's input
+    """
+    params = ENGINE_PRESETS[preset]
+    sizes = {}
+    for p in image_paths:
+        h, w = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE).shape
+        sizes[p.name] = list(
+            get_det_input_size(h, w, params.det_limit_side_len, params.det_limit_type)
+        )
+    return sizes
+
+
+def benchmark_presets(
+    backend: str,
+    image_paths: List[Path],
+    cpu_threads: Optional[int] = 4,
+    ground_truth: Optional[Dict[str, ResultsMap]] = None,
+    run_models: Optional[bool] = True,
+) -> Dict[str, Any]:
+    """Benchmarks the speed and the party vote extraction accuracy of all the presets.
+
+    The accuracy is only measured against a ground truth: the presets' results are not
+    a reference for each other.
+
+    Args:
+        backend (str): The OCR engine backend, one of `OCR_ENGINE_BACKENDS`
+        image_paths (List[Path]): The benchmark images
+        cpu_threads (Optional[int]): The number of CPU threads used by the inference runtime
+        ground_truth (Optional[dict]): Map of the image names to their party vote results
+        run_models (Optional[bool]): Whether the presets' engines are run, otherwise only the sizes of the detector's input are reported
+
+    Returns:
+        dict: The report of each preset
+    """
+    presets = {}
+    for preset, params in ENGINE_PRESETS.items():
+        presets[preset] = {
+            "params": params._asdict(),
+            "det_input_sizes": get_det_input_sizes(preset, image_paths),
+        }
+        if not run_models:
+            continue
+        run = benchmark_preset(backend, preset, image_paths, cpu_threads)
+        presets[preset].update(
+            mean_latency_s=run["mean_latency_s"],
+            p95_latency_s=run["p95_latency_s"],
+            accuracy=(
+                compute_votes_accuracy(ground_truth, run["results"])
+                if ground_truth is not None
+                else None
+            ),
+        )
+
+    return {
+        "backend": backend,
+        "run_models": run_models,
+        "ground_truth": ground_truth is not None,
+        "num_images": len(image_paths),
+        "presets": presets,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the speed and accuracy of the OCR engine presets"
+    )
+    parser.add_argument("--corpus", default="./test-images")
+    parser.add_argument("--backend", default="paddle", choices=OCR_ENGINE_BACKENDS)
+    parser.add_argument("--cpu-threads", type=int, default=4)
+    parser.add_argument(
+        "--ground-truth",
+        help="JSON file mapping the image names to their party vote results, "
+        "the accuracy is only reported with a ground truth",
+    )
+    parser.add_argument(
+        "--det-input-sizes-only",
+        action="store_true",
+        help="Only report the sizes of the detector's input, without running the models",
+    )
+    parser.add_argument("--report", help="Write the report to this file")
+    args = parser.parse_args()
+
+    ground_truth = None
+    if args.ground_truth:
+        with open(args.ground_truth) as f:
+            ground_truth = json.load(f)
+
+    report = benchmark_presets(
+        args.backend,
+        get_corpus_images(args.corpus),
+        args.cpu_threads,
+        ground_truth,
+        run_models=not args.det_input_sizes_only,
+    )
+    print(json.dumps(report, indent=2))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ __credits__ = [
     "Adrian Rosebrock (for suggesting the agglomerative clustering algorithm)"
 ]
 
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 from sklearn.cluster import AgglomerativeClustering
@@ -14,7 +14,9 @@ from sklearn.cluster import AgglomerativeClustering
 from .types import AllColumns, OCRBBoxesResultType, OCRTextsResultType
 
 
-def get_clustering_model() -> AgglomerativeClustering:
+def get_clustering_model(
+    distance_threshold: Optional[float] = 30,
+) -> AgglomerativeClustering:
     """Returns the agglomerative clustering model.
 
     Agglomerative clustering is a hierarchical clustering method.
@@ -22,16 +24,24 @@ def get_clustering_model() -> AgglomerativeClustering:
     merges the most similar clusters together until a particular stopping criterion is met.
     The agglomerative clustering algorithm will be used to cluster the bounding boxes for the extracted text
     into their respective columns
+
+    Args:
+        distance_threshold (Optional[float]): The linkage distance above which clusters are not merged
     """
     model = AgglomerativeClustering(
-        n_clusters=None, affinity="manhattan", linkage="complete", distance_threshold=30
+        n_clusters=None,
+        affinity="manhattan",
+        linkage="complete",
+        distance_threshold=distance_threshold,
     )
 
     return model
 
 
 def cluster_ocr_results(
-    bboxes: OCRBBoxesResultType, texts: OCRTextsResultType,
+    bboxes: OCRBBoxesResultType,
+    texts: OCRTextsResultType,
+    distance_threshold: Optional[float] = 30,
 ) -> AllColumns:
     """Returns the results of clustering the bounding boxes.
 
@@ -42,6 +52,7 @@ def cluster_ocr_results(
     Args:
         bboxes (OCRBBoxesResultType): The bounding boxes associated with the extracted texts
         texts (OCRTextsResultType): The extracted texts
+        distance_threshold (Optional[float]): The maximum distance between the starting x-coordinates of the texts in a column
 
     Returns:
         list: A list containing the clustered columns.
@@ -50,7 +61,7 @@ def cluster_ocr_results(
     # A tuple containing the starting x-coordinate and a trivial y dimension
     input = [(c[0], 0) for c in bboxes]
 
-    model = get_clustering_model()
+    model = get_clustering_model(distance_threshold)
 
     # Fit the HAC model
     model.fit(input)
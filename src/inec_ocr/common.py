@@ -4,11 +4,17 @@
 
 import re
 from difflib import SequenceMatcher
-from typing import Any, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
 
 import cv2
 import numpy as np
 
+from .types import ResultsMap
+
+# The extensions of the image files in the test corpus
+IMAGE_EXTENSIONS = [".jpeg", ".jpg", ".png"]
+
 
 def is_near(a: int, b: int, min_dist: Optional[int] = 5) -> bool:
     """Checks if two points are near each other.
@@ -62,3 +68,47 @@ def show_image(img: np.ndarray, name: Optional[str] = "image") -> None:
     cv2.imshow(name, resized_img)
     cv2.waitKey(0)
     cv2.destroyAllWindows()
+
+
+def get_corpus_images(corpus_dir: Union[str, Path]) -> List[Path]:
+    """Returns the paths to all the images in the corpus directory (recursively)."""
+    return sorted(
+        p for p in Path(corpus_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def compute_votes_accuracy(
+    reference: Dict[str, Union[ResultsMap, None]],
+    candidate: Dict[str, Union[ResultsMap, None]],
+) -> float:
+    """Returns the fraction of the reference party vote counts that the candidate reproduces.
+
+    Only the parties with a (non-null) vote count in the reference are scored.
+
+    Args:
+        reference (dict): Map of the image names to the reference party vote results
+        candidate (dict): Map of the image names to the candidate party vote results
+
+    Returns:
+        float: The accuracy, 1.0 if the reference contains no vote counts
+    """
+    total, correct = 0, 0
+    for name, ref_results in reference.items():
+        cand_results = candidate.get(name) or {}
+        for party, votes in (ref_results or {}).items():
+            if votes is None:
+                continue
+            total += 1
+            correct += int(cand_results.get(party) == votes)
+
+    return correct / total if total else 1.0
+
+
+def count_scored_votes(reference: Dict[str, Union[ResultsMap, None]]) -> int:
+    """Returns the number of party vote counts `compute_votes_accuracy` scores, i.e. the
+    non-null vote counts of the reference."""
+    return sum(
+        votes is not None
+        for ref_results in reference.values()
+        for votes in (ref_results or {}).values()
+    )
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""dedup.py: Contains the perceptual hashing and the near-duplicate cache of the result sheets"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .document import rectify_document
+
+
+def phash(image: np.ndarray, hash_size: Optional[int] = 8) -> int:
+    """Computes the (DCT-based) perceptual hash of an image.
+
+    The hash only keeps the low frequencies of the image, so it is robust to small changes
+    in scale, exposure, noise and JPEG compression.
+
+    Args:
+        image (np.ndarray): The input image
+        hash_size (Optional[int]): The size of the hash, the hash has hash_size ** 2 bits
+
+    Returns:
+        int: The perceptual hash
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    size = hash_size * 4
+    resized = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(resized.astype("float32"))[:hash_size, :hash_size]
+
+    # Compare the low frequencies against their median, ignoring the DC term
+    median = np.median(dct.flatten()[1:])
+    bits = (dct > median).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def document_phash(image: np.ndarray) -> int:
+    """Computes the perceptual hash of the rectified result sheet in an image.
+
+    Rectifying the sheet first makes the hash robust to the angle the sheet was photographed from.
+
+    Args:
+        image (np.ndarray): The input image
+
+    Returns:
+        int: The perceptual hash
+    """
+    return phash(rectify_document(image))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Returns the number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """A BK-tree for finding the hashes within a hamming distance of a query hash.
+
+    Each node's children are keyed by their distance to the node, so by the triangle
+    inequality a search only descends into the children whose key is within
+    `max_distance` of the query's distance to the node.
+    """
+
+    def __init__(self):
+        self.root: Optional[Tuple[int, Dict[int, Any]]] = None
+        self.size = 0
+
+    def add(self, item: int) -> None:
+        if self.root is None:
+            self.root = (item, {})
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(item, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (item, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, item: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Returns the (distance, hash) pairs within max_distance of the item, nearest first."""
+        if self.root is None:
+            return []
+
+        results = []
+        candidates = [self.root]
+        while candidates:
+            node_item, children = candidates.pop()
+            distance = hamming_distance(item, node_item)
+            if distance <= max_distance:
+                results.append((distance, node_item))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+
+        return sorted(results)
+
+
+class NearDuplicateCache:
+    """A thread-safe LRU cache keyed by perceptual hashes, with near-duplicate lookups.
+
+    A lookup hits if a cached hash is within `max_distance` bits of the query hash.
+    Entries are evicted in least-recently-used order once the cache holds `max_size`
+    entries, and expire `ttl` seconds after they were stored. Evicted hashes stay in
+    the BK-tree (which does not support removals) until it is rebuilt, which happens
+    once more than half of its hashes are stale.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = 256,
+        max_distance: Optional[int] = 6,
+        ttl: Optional[float] = 3600.0,
+    ):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Tuple[float, Any]]" = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: int) -> Any:
+        """Returns the value of the nearest cached hash within max_distance of the key, or None."""
+        with self._lock:
+            now = time.monotonic()
+            for _, item in self._tree.search(key, self.max_distance):
+                entry = self._entries.get(item)
+                if entry is None:
+                    continue
+                if self.ttl and now - entry[0] > self.ttl:
+                    del self._entries[item]
+                    continue
+                self._entries.move_to_end(item)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: int, value: Any) -> None:
+        """Stores a value under a hash."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            self._tree.add(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+            # Rebuild the tree without the evicted hashes
+            if self._tree.size > 2 * max(len(self._entries), 1):
+                self._tree = BKTree()
+                for item in self._entries:
+                    self._tree.add(item)
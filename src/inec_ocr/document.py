@@ -17,7 +17,13 @@ from .constants import (
     POLLING_UNIT_DATA_FIELDS,
     POLLING_UNIT_REGISTRATION_INFO_FIELDS,
 )
-from .types import AllColumns, ColumnData, ColumnTuple, ResultsMap
+from .types import (
+    AllColumns,
+    ColumnData,
+    ColumnTuple,
+    DocumentParserConfig,
+    ResultsMap,
+)
 
 
 def get_political_parties_column(
@@ -101,7 +107,11 @@ def get_polling_unit_data_fields_column(
 
 
 def get_political_parties_results_column(
-    all_cols: AllColumns, pol_parties_column: ColumnTuple, thresh: Optional[int] = 3,
+    all_cols: AllColumns,
+    pol_parties_column: ColumnTuple,
+    thresh: Optional[int] = 3,
+    row_tolerance: Optional[int] = 10,
+    col_tolerance: Optional[int] = 60,
 ) -> Union[ColumnTuple, None]:
     """Returns the column containing the political parties vote results.
 
@@ -109,6 +119,8 @@ def get_political_parties_results_column(
         all_cols (AllColumns): All the columns extracted from the OCR'd image
         pol_parties_column (ColumnTuple): Tuple containing the political parties and its column index
         thresh (Optional[int]): A heuristic value denoting the minimum number of OCR'd texts that must be in the column
+        row_tolerance (Optional[int]): The maximum distance between the starting y-coordinates of a party name and its result
+        col_tolerance (Optional[int]): The maximum distance between the end of a party name and the start of its result
 
     Returns:
         tuple: A tuple containing
@@ -135,8 +147,8 @@ def get_political_parties_results_column(
                 lambda bbox: any(
                     [
                         (
-                            is_near(bbox[1], pp_bbox[1], 10)
-                            and is_near(bbox[0], pp_bbox[2], 60)
+                            is_near(bbox[1], pp_bbox[1], row_tolerance)
+                            and is_near(bbox[0], pp_bbox[2], col_tolerance)
                             and pp_bbox[2] < bbox[0]
                         )
                         for pp_bbox in pp_bboxes
@@ -154,13 +166,18 @@ def get_political_parties_results_column(
 
 
 def get_political_parties_results(
-    pol_parties_column: ColumnTuple, pol_parties_results_column: ColumnTuple,
+    pol_parties_column: ColumnTuple,
+    pol_parties_results_column: ColumnTuple,
+    row_tolerance: Optional[int] = 8,
+    col_tolerance: Optional[int] = 60,
 ) -> ResultsMap:
     """Returns a dictionary mapping the political parties to their vote count.
 
     Args:
         pol_parties_column (ColumnTuple): Tuple containing the political parties names column data and its index
         pol_parties_results_column (ColumnTuple): Tuple containing the political parties results column and its index
+        row_tolerance (Optional[int]): The maximum distance between the starting y-coordinates of a party name and its result
+        col_tolerance (Optional[int]): The maximum distance between the end of a party name and the start of its result
 
     Returns:
         dict: A dictionary mapping the political parties names to their corresponding results (vote count)
@@ -183,8 +200,10 @@ def get_political_parties_results(
         # Loop through all the bboxes associated with the pol. parties results column data
         for idx in range(len(pol_parties_results_column_bboxes)):
             if is_near(
-                bbox[1], pol_parties_results_column_bboxes[idx][1], 8
-            ) and is_near(bbox[2], pol_parties_results_column_bboxes[idx][0], 60):
+                bbox[1], pol_parties_results_column_bboxes[idx][1], row_tolerance
+            ) and is_near(
+                bbox[2], pol_parties_results_column_bboxes[idx][0], col_tolerance
+            ):
                 # Check if the bbox of the pol. party name is opposite the bbox of the result
                 value = pol_parties_results_column_values[idx]
                 results[name] = int(float(value)) if is_number(value) else None
@@ -200,6 +219,8 @@ def get_polling_unit_data_values_column(
     all_cols: AllColumns,
     polling_unit_data_fields_column: ColumnTuple,
     thresh: Optional[int] = 2,
+    row_tolerance: Optional[int] = 10,
+    col_tolerance: Optional[int] = 180,
 ) -> Union[ColumnTuple, None]:
     """Returns the column containing the polling unit data values.
 
@@ -207,6 +228,8 @@ def get_polling_unit_data_values_column(
         all_cols (AllColumns): All the columns extracted from the OCR'd image
         polling_unit_data_fields_column (ColumnTuple): Tuple containing the polling unit data fields column data and its index
         thresh (Optional[int]): A heuristic value denoting the minimum number of OCR'd results that must be in the column
+        row_tolerance (Optional[int]): The maximum distance between the starting y-coordinates of a field and its value
+        col_tolerance (Optional[int]): The maximum distance between the end of a field and the start of its value
 
     Returns:
         tuple: A tuple containing
@@ -234,8 +257,8 @@ def get_polling_unit_data_values_column(
                 lambda bbox: any(
                     [
                         (
-                            is_near(bbox[1], pp_bbox[1], 10)
-                            and is_near(bbox[0], pp_bbox[2], 180)
+                            is_near(bbox[1], pp_bbox[1], row_tolerance)
+                            and is_near(bbox[0], pp_bbox[2], col_tolerance)
                             and pp_bbox[2] < bbox[0]
                         )
                         for pp_bbox in pu_bboxes
@@ -255,12 +278,16 @@ def get_polling_unit_data_values_column(
 def get_polling_unit_data_results(
     polling_unit_data_fields_column: ColumnTuple,
     polling_unit_data_values_column: ColumnTuple,
+    row_tolerance: Optional[int] = 10,
+    col_tolerance: Optional[int] = 180,
 ) -> ResultsMap:
     """Returns a dictionary mapping the polling unit (PU) data fields to their values.
 
     Args:
         polling_unit_data_fields_column (ColumnTuple): Tuple containing the polling unit data fields column data and its index
         polling_unit_data_values_column (ColumnTuple): Tuple containing the polling unit data values column and its index
+        row_tolerance (Optional[int]): The maximum distance between the starting y-coordinates of a field and its value
+        col_tolerance (Optional[int]): The maximum distance between the end of a field and the start of its value
 
     Returns:
         dict: A dictionary mapping the PU data fields to their corresponding values
@@ -278,9 +305,9 @@ def get_polling_unit_data_results(
 
         # Loop through all the bboxes associated with the PU data values
         for idx in range(len(pu_data_values_column_bboxes)):
-            if is_near(bbox[1], pu_data_values_column_bboxes[idx][1], 10) and is_near(
-                bbox[2], pu_data_values_column_bboxes[idx][0], 180
-            ):
+            if is_near(
+                bbox[1], pu_data_values_column_bboxes[idx][1], row_tolerance
+            ) and is_near(bbox[2], pu_data_values_column_bboxes[idx][0], col_tolerance):
                 # Check if the bbox of the PU data field name is opposite the bbox of the result
                 value = pu_data_values_column_results[idx]
                 results[name] = int(float(value)) if is_number(value) else None
@@ -370,6 +397,8 @@ def get_pu_reg_info_values_column(
     all_cols: AllColumns,
     pu_reg_info_fields_column: ColumnTuple,
     thresh: Optional[int] = 2,
+    row_tolerance: Optional[int] = 10,
+    col_tolerance: Optional[int] = 180,
 ) -> Union[ColumnTuple, None]:
     """Returns the column containing the pu registration info values and its index.
 
@@ -377,6 +406,8 @@ def get_pu_reg_info_values_column(
         all_cols (AllColumns): All the columns extracted from the OCR'd image
         pu_reg_fields_column (ColumnTuple): A tuple containing the PU registration fields column and its index
         thresh (Optional[int]): A heuristic threshold value  specifying the minimum number of texts in the column
+        row_tolerance (Optional[int]): The maximum distance between the starting y-coordinates of a field and its value
+        col_tolerance (Optional[int]): The maximum distance between the end of a field and the start of its value
 
     Returns:
         tuple: A tuple containing
@@ -404,8 +435,8 @@ def get_pu_reg_info_values_column(
                 lambda bbox: any(
                     [
                         (
-                            is_near(bbox[1], pu_reg_info_bbox[1], 10)
-                            and is_near(bbox[0], pu_reg_info_bbox[2], 180)
+                            is_near(bbox[1], pu_reg_info_bbox[1], row_tolerance)
+                            and is_near(bbox[0], pu_reg_info_bbox[2], col_tolerance)
                             and pu_reg_info_bbox[2] < bbox[0]
                         )
                         for pu_reg_info_bbox in pu_reg_info_bboxes
@@ -423,13 +454,18 @@ def get_pu_reg_info_values_column(
 
 
 def get_pu_reg_info_results(
-    pu_reg_info_fields_column: ColumnTuple, pu_reg_info_values_column: ColumnTuple,
+    pu_reg_info_fields_column: ColumnTuple,
+    pu_reg_info_values_column: ColumnTuple,
+    row_tolerance: Optional[int] = 10,
+    col_tolerance: Optional[int] = 180,
 ) -> ResultsMap:
     """Returns a dictionary mapping the PU registration info fields to their values.
 
     Args:
         pu_reg_info_fields_column (ColumnTuple): Tuple containing the PU registration info column data and its index
         pu_reg_info_values_column (ColumnTuple): Tuple column containing the PU registration info values column data and its index
+        row_tolerance (Optional[int]): The maximum distance between the starting y-coordinates of a field and its value
+        col_tolerance (Optional[int]): The maximum distance between the end of a field and the start of its value
 
     Returns:
         dict: A dictionary mapping the PU registration info fields to their values
@@ -452,8 +488,10 @@ def get_pu_reg_info_results(
         # Loop through all the bboxes associated with the PU reg info results column data
         for idx in range(len(pu_reg_info_values_column_bboxes)):
             if is_near(
-                bbox[1], pu_reg_info_values_column_bboxes[idx][1], 10
-            ) and is_near(bbox[2], pu_reg_info_values_column_bboxes[idx][0], 180):
+                bbox[1], pu_reg_info_values_column_bboxes[idx][1], row_tolerance
+            ) and is_near(
+                bbox[2], pu_reg_info_values_column_bboxes[idx][0], col_tolerance
+            ):
                 # Check if the bbox of the PU reg info field name is opposite the bbox of the result
                 value = pu_reg_info_values_column_results[idx]
                 results[name] = value
@@ -466,7 +504,7 @@ def get_pu_reg_info_results(
 
 
 def get_document_data(
-    all_cols: AllColumns,
+    all_cols: AllColumns, config: Optional[DocumentParserConfig] = None
 ) -> Tuple[
     Union[ResultsMap, None], Union[ResultsMap, None], str, Union[ResultsMap, None],
 ]:
@@ -474,6 +512,7 @@ def get_document_data(
 
     Args:
         all_cols: All the columns extracted from the image
+        config (Optional[DocumentParserConfig]): The parser's thresholds and tolerances, defaults to `DocumentParserConfig()`
 
     Returns:
         tuple: A tuple containing
@@ -482,45 +521,77 @@ def get_document_data(
         - str: Election type
         - ResultsMap: Polling unit registration info results
     """
+    if config is None:
+        config = DocumentParserConfig()
+
     # Get the political parties results data
-    political_parties_column = get_political_parties_column(all_cols)
+    political_parties_column = get_political_parties_column(
+        all_cols, config.pol_parties_thresh
+    )
     pol_parties_results_column = get_political_parties_results_column(
-        all_cols, political_parties_column
+        all_cols,
+        political_parties_column,
+        config.pol_parties_results_thresh,
+        config.row_tolerance,
+        config.pol_parties_col_tolerance,
     )
     pol_parties_results = (
         get_political_parties_results(
-            political_parties_column, pol_parties_results_column
+            political_parties_column,
+            pol_parties_results_column,
+            config.pol_parties_row_tolerance,
+            config.pol_parties_col_tolerance,
         )
         if pol_parties_results_column
         else None
     )
 
     # Get the polling unit data
-    polling_unit_data_fields_column = get_polling_unit_data_fields_column(all_cols)
+    polling_unit_data_fields_column = get_polling_unit_data_fields_column(
+        all_cols, config.fields_values_thresh, config.fields_similarity_thresh
+    )
     pu_data_values_column = get_polling_unit_data_values_column(
-        all_cols, polling_unit_data_fields_column
+        all_cols,
+        polling_unit_data_fields_column,
+        config.values_thresh,
+        config.row_tolerance,
+        config.fields_col_tolerance,
     )
     pu_data_results = (
         get_polling_unit_data_results(
-            polling_unit_data_fields_column, pu_data_values_column
+            polling_unit_data_fields_column,
+            pu_data_values_column,
+            config.row_tolerance,
+            config.fields_col_tolerance,
         )
         if pu_data_values_column
         else None
     )
 
     # Get the PU reg info data
-    pu_reg_info_fields_column = get_pu_reg_info_fields_column(all_cols)
+    pu_reg_info_fields_column = get_pu_reg_info_fields_column(
+        all_cols, config.fields_values_thresh, config.fields_similarity_thresh
+    )
     pu_reg_info_values_column = get_pu_reg_info_values_column(
-        all_cols, pu_reg_info_fields_column
+        all_cols,
+        pu_reg_info_fields_column,
+        config.values_thresh,
+        config.row_tolerance,
+        config.fields_col_tolerance,
     )
     pu_reg_info_results = (
-        get_pu_reg_info_results(pu_reg_info_fields_column, pu_reg_info_values_column)
+        get_pu_reg_info_results(
+            pu_reg_info_fields_column,
+            pu_reg_info_values_column,
+            config.row_tolerance,
+            config.fields_col_tolerance,
+        )
         if pu_reg_info_values_column
         else None
     )
 
     # Get the election type
-    election_type = get_election_type(all_cols)
+    election_type = get_election_type(all_cols, config.election_type_similarity_thresh)
 
     return (pol_parties_results, pu_data_results, election_type, pu_reg_info_results)
 
@@ -607,3 +678,53 @@ def four_point_transform(image: np.ndarray, points: np.ndarray) -> np.ndarray:
 
     # Return the warped/transformed image
     return warped
+
+
+def find_document_contour(
+    image: np.ndarray, min_area_ratio: Optional[float] = 0.2
+) -> Union[np.ndarray, None]:
+    """Finds the four points of the document (result sheet) in an image.
+
+    Args:
+        image (np.ndarray): The input image
+        min_area_ratio (Optional[float]): The minimum fraction of the image area the document must cover
+
+    Returns:
+        np.ndarray: The four points of the document, or None if no document was found
+    """
+    # Detect the edges on a downscaled copy of the image, for speed
+    h, w = image.shape[:2]
+    scale = min(1.0, 500.0 / max(h, w))
+    small = cv2.resize(image, (int(w * scale), int(h * scale)))
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edged = cv2.dilate(cv2.Canny(gray, 75, 200), None)
+
+    contours, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
+
+    # The document is the largest contour that can be approximated by four points
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area_ratio * small.shape[0] * small.shape[1]:
+            break
+        perimeter = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
+        if len(approx) == 4:
+            return (approx.reshape(4, 2) / scale).astype("float32")
+
+    return None
+
+
+def rectify_document(image: np.ndarray) -> np.ndarray:
+    """Returns a bird's eye view of the document in an image, or the image itself if no document was found.
+
+    Args:
+        image (np.ndarray): The input image
+
+    Returns:
+        np.ndarray: The rectified document
+    """
+    points = find_document_contour(image)
+    if points is None:
+        return image
+    return four_point_transform(image, points)
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+
+"""engine.py: Contains the pluggable OCR engine interface and the PaddleOCR backend"""
+
+__credits__ = ["PaddleOCR (for the box sorting and rotated crop algorithms)"]
+
+import threading
+from typing import Callable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .tiling import TiledDetector
+from .types import OCRResultType
+
+# Paths to the bundled PP-OCRv3 (Paddle inference format) models
+PADDLE_DET_MODEL_DIR = "./models/det/en/en_PP-OCRv3_det_infer"
+PADDLE_REC_MODEL_DIR = "./models/rec/en/en_PP-OCRv3_rec_infer"
+PADDLE_CLS_MODEL_DIR = "./models/cls/ch_ppocr_mobile_v2.0_cls_infer"
+
+# Recognition results (text, confidence score) for a batch of text crops
+RecognitionResultType = List[Tuple[str, float]]
+
+# The characters the numeric cells (votes and counts) are decoded to
+DIGITS = "0123456789"
+
+
+def load_image(img: Union[str, np.ndarray]) -> np.ndarray:
+    """Loads an image as a 3-channel BGR array.
+
+    Args:
+        img (Union[str, np.ndarray]): The path to the image file or an already decoded image
+
+    Returns:
+        np.ndarray: The loaded image
+    """
+    if isinstance(img, str):
+        img = cv2.imread(img, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Unable to read the image file")
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def sorted_boxes(dt_boxes: np.ndarray) -> List[np.ndarray]:
+    """Sorts the detected text boxes from top to bottom and left to right.
+
+    Args:
+        dt_boxes (np.ndarray): The detected text boxes, with shape (N, 4, 2)
+
+    Returns:
+        list: The sorted text boxes
+    """
+    num_boxes = len(dt_boxes)
+    _boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
+
+    # Boxes on (roughly) the same line are re-ordered by their starting x-coordinate
+    for i in range(num_boxes - 1):
+        for j in range(i, -1, -1):
+            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and (
+                _boxes[j + 1][0][0] < _boxes[j][0][0]
+            ):
+                _boxes[j], _boxes[j + 1] = _boxes[j + 1], _boxes[j]
+            else:
+                break
+
+    return _boxes
+
+
+def get_rotate_crop_image(img: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Crops a (possibly rotated) text box out of an image using a perspective transform.
+
+    Args:
+        img (np.ndarray): The input image
+        points (np.ndarray): The four points of the text box
+
+    Returns:
+        np.ndarray: The cropped text image
+    """
+    points = np.array(points, dtype="float32")
+    crop_width = int(
+        max(
+            np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])
+        )
+    )
+    crop_height = int(
+        max(
+            np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])
+        )
+    )
+    pts_std = np.float32(
+        [[0, 0], [crop_width, 0], [crop_width, crop_height], [0, crop_height]]
+    )
+    M = cv2.getPerspectiveTransform(points, pts_std)
+    crop = cv2.warpPerspective(
+        img,
+        M,
+        (crop_width, crop_height),
+        borderMode=cv2.BORDER_REPLICATE,
+        flags=cv2.INTER_CUBIC,
+    )
+
+    # Vertical text boxes are rotated so that the text reads horizontally
+    crop_height, crop_width = crop.shape[0:2]
+    if crop_height * 1.0 / crop_width >= 1.5:
+        crop = np.rot90(crop)
+
+    return crop
+
+
+def get_charset_mask(character: List[str], charset: str) -> np.ndarray:
+    """Returns the mask of the recognizer's classes that are kept when decoding to a charset.
+
+    The CTC blank (class 0) is always kept.
+
+    Args:
+        character (list): The recognizer's character list, indexed by class index
+        charset (str): The characters to keep
+
+    Returns:
+        np.ndarray: A float mask of shape (num_classes,)
+    """
+    mask = np.array([char in charset for char in character], dtype="float32")
+    mask[0] = 1.0
+    return mask
+
+
+def get_det_input_size(
+    h: int, w: int, det_limit_side_len: int, det_limit_type: Optional[str] = "max"
+) -> Tuple[int, int]:
+    """Returns the size of the detector's input for an image (PaddleOCR's resizing).
+
+    With the "max" limit type, images whose longest side exceeds the limit are
+    downscaled. With the "min" limit type, images whose shortest side is below the
+    limit are upscaled. Both sides are then rounded to multiples of 32.
+
+    Args:
+        h (int): The image height
+        w (int): The image width
+        det_limit_side_len (int): The length limit of a side of the detector's input
+        det_limit_type (Optional[str]): The limit type, "max" or "min"
+
+    Returns:
+        Tuple[int, int]: The height and width of the detector's input
+    """
+    ratio = 1.0
+    if det_limit_type == "max":
+        if max(h, w) > det_limit_side_len:
+            ratio = float(det_limit_side_len) / max(h, w)
+    elif det_limit_type == "min":
+        if min(h, w) < det_limit_side_len:
+            ratio = float(det_limit_side_len) / min(h, w)
+    else:
+        raise ValueError(f"Unknown detector limit type: {det_limit_type}")
+    resize_h = max(int(round(h * ratio / 32) * 32), 32)
+    resize_w = max(int(round(w * ratio / 32) * 32), 32)
+    return resize_h, resize_w
+
+
+class OCREngine:
+    """Base class for the OCR engine backends.
+
+    A backend only implements the three model stages (text detection, text angle
+    classification and text recognition). The full pipeline, i.e. cropping the detected
+    text boxes and filtering weak recognition results, is shared by all the backends so
+    that they all produce the same `(bboxes, texts, scores)` output.
+    """
+
+    # Whether `detect` can be called from several threads at once
+    concurrent_detection = False
+    # Whether `recognize` and `recognize_digits` can be called from several threads at
+    # once, the calls are serialized otherwise
+    concurrent_recognition = False
+
+    def __init__(
+        self, use_angle_cls: Optional[bool] = True, drop_score: Optional[float] = 0.5
+    ):
+        self.use_angle_cls = use_angle_cls
+        self.drop_score = drop_score
+        self.recognition_batcher = None
+        self.tiled_detector = None
+        self._recognition_lock = threading.Lock()
+
+    def detect(self, img: np.ndarray) -> np.ndarray:
+        """Returns the detected text boxes, with shape (N, 4, 2)."""
+        raise NotImplementedError
+
+    def classify(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        """Returns the text crops, rotated upright where necessary."""
+        raise NotImplementedError
+
+    def recognize(
+        self, crops: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> RecognitionResultType:
+        """Returns the recognized text and confidence score for each text crop.
+
+        The crops are run through the model in batches of `batch_size` crops, the
+        backend's configured batch size by default.
+        """
+        raise NotImplementedError
+
+    def recognize_digits(
+        self, crops: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> RecognitionResultType:
+        """Returns the recognized digits and confidence score for each numeric text crop."""
+        raise NotImplementedError
+
+    def _run_recognition(
+        self,
+        recognize: Callable[..., RecognitionResultType],
+        crops: List[np.ndarray],
+        batch_size: Optional[int] = None,
+    ) -> RecognitionResultType:
+        """Runs a recognition method, holding the recognition lock unless the backend
+        supports concurrent recognition."""
+        if self.concurrent_recognition:
+            return recognize(crops, batch_size)
+        with self._recognition_lock:
+            return recognize(crops, batch_size)
+
+    def _recognize_batch(self, crops: List[np.ndarray]) -> RecognitionResultType:
+        """Recognizes the crops collected by the batcher in a single forward pass."""
+        return self._run_recognition(self.recognize, crops, len(crops))
+
+    def enable_recognition_batching(
+        self, max_batch_size: Optional[int] = 128, max_wait_ms: Optional[float] = 5.0
+    ) -> None:
+        """Routes the text recognition through a cross-request micro-batching scheduler.
+
+        Each batch of crops is recognized in a single forward pass. On the backends that
+        do not support concurrent recognition, the batches and the direct (digits-only)
+        recognitions are serialized by the recognition lock.
+
+        Args:
+            max_batch_size (Optional[int]): The number of crops that dispatches a batch early
+            max_wait_ms (Optional[float]): The maximum time a batch waits for more requests
+        """
+        # Imported here to avoid a circular import
+        from .batching import RecognitionBatcher
+
+        self.recognition_batcher = RecognitionBatcher(
+            self._recognize_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+        )
+
+    def enable_tiled_detection(
+        self,
+        tile_size: Optional[int] = 960,
+        overlap: Optional[int] = 160,
+        min_side: Optional[int] = 2000,
+        max_workers: Optional[int] = 2,
+    ) -> None:
+        """Detects the text of the large images on overlapping tiles, see `TiledDetector`.
+
+        Args:
+            tile_size (Optional[int]): The side of the tiles, the detector's input size
+            overlap (Optional[int]): The minimum overlap of the neighbouring tiles, longer than the texts that cross the seams
+            min_side (Optional[int]): The longest side above which an image is tiled
+            max_workers (Optional[int]): The number of tiles detected in parallel, if the backend supports it
+        """
+        self.tiled_detector = TiledDetector(
+            self.detect,
+            tile_size=tile_size,
+            overlap=overlap,
+            min_side=min_side,
+            max_workers=max_workers if self.concurrent_detection else 1,
+        )
+
+    def recognize_crops(
+        self, crops: List[np.ndarray], digits: Optional[bool] = False
+    ) -> RecognitionResultType:
+        """Recognizes text crops, in a batch shared with the concurrent requests if enabled.
+
+        Args:
+            crops (list): The text crops
+            digits (Optional[bool]): Whether the crops are numeric cells, decoded to digits only
+
+        Returns:
+            RecognitionResultType: The recognized text and confidence score of each crop
+        """
+        if digits:
+            return self._run_recognition(self.recognize_digits, crops)
+        if self.recognition_batcher is not None:
+            return self.recognition_batcher.submit(crops)
+        return self._run_recognition(self.recognize, crops)
+
+    def ocr(
+        self,
+        img: Union[str, np.ndarray],
+        checkpoint: Optional[Callable[[str], None]] = None,
+    ) -> OCRResultType:
+        """Runs the full OCR pipeline on an image.
+
+        Args:
+            img (Union[str, np.ndarray]): The path to the image file or an already decoded image
+            checkpoint (Optional[Callable]): Called with the name of the stage ("detect") that ended, it may raise to abandon the recognition
+
+        Returns:
+            OCRResultType: The bounding boxes, texts and confidence scores of the extracted texts
+        """
+        img = load_image(img)
+
+        # Detect (on tiles, if enabled) and sort the text boxes
+        detect = self.tiled_detector or self.detect
+        dt_boxes = sorted_boxes(detect(img))
+        if not dt_boxes:
+            return OCRResultType([], [], [])
+
+        # Crop the text boxes out of the image
+        crops = [get_rotate_crop_image(img, box) for box in dt_boxes]
+        if self.use_angle_cls:
+            crops = self.classify(crops)
+
+        if checkpoint is not None:
+            checkpoint("detect")
+
+        rec_res = self.recognize_crops(crops)
+
+        bboxes, texts, scores = [], [], []
+        for box, (text, score) in zip(dt_boxes, rec_res):
+            # Filter out texts with weak recognition scores
+            if score >= self.drop_score:
+                bboxes.append(np.asarray(box).tolist())
+                texts.append(text)
+                scores.append(float(score))
+
+        return OCRResultType(bboxes, texts, scores)
+
+
+class _MaskedCTCLabelDecode:
+    """Wraps PaddleOCR's CTC decoder to optionally mask the classes outside a charset.
+
+    The mask is set per thread, so the digits-only and the general recognition can share
+    the same recognizer (and model weights) concurrently.
+    """
+
+    def __init__(self, decode, mask: np.ndarray):
+        self.decode = decode
+        self.mask = mask
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.decode, name)
+
+    def __call__(self, preds, *args, **kwargs):
+        if getattr(self.local, "masked", False):
+            preds = np.asarray(preds) * self.mask
+        return self.decode(preds, *args, **kwargs)
+
+
+class PaddleOCREngine(OCREngine):
+    """OCR engine backed by PaddleOCR and the bundled Paddle inference models."""
+
+    def __init__(
+        self,
+        cpu_threads: Optional[int] = 10,
+        use_angle_cls: Optional[bool] = True,
+        show_log: Optional[bool] = True,
+        det_limit_side_len: Optional[int] = 960,
+        det_limit_type: Optional[str] = "max",
+        det_db_unclip_ratio: Optional[float] = 1.5,
+        rec_batch_num: Optional[int] = 6,
+        enable_mkldnn: Optional[bool] = False,
+    ):
+        # paddleocr is imported lazily so that it is not required by the other backends
+        from paddleocr import PaddleOCR
+
+        super().__init__(use_angle_cls=use_angle_cls)
+        self._ocr = PaddleOCR(
+            use_angle_cls=use_angle_cls,
+            lang="en",
+            det_model_dir=PADDLE_DET_MODEL_DIR,
+            rec_model_dir=PADDLE_REC_MODEL_DIR,
+            cls_model_dir=PADDLE_CLS_MODEL_DIR,
+            cpu_threads=cpu_threads,
+            show_log=show_log,
+            det_limit_side_len=det_limit_side_len,
+            det_limit_type=det_limit_type,
+            det_db_unclip_ratio=det_db_unclip_ratio,
+            rec_batch_num=rec_batch_num,
+            enable_mkldnn=enable_mkldnn,
+        )
+        self.drop_score = self._ocr.drop_score
+
+        text_recognizer = self._ocr.text_recognizer
+        text_recognizer.postprocess_op = _MaskedCTCLabelDecode(
+            text_recognizer.postprocess_op,
+            get_charset_mask(text_recognizer.postprocess_op.character, DIGITS),
+        )
+
+    def detect(self, img: np.ndarray) -> np.ndarray:
+        dt_boxes, _ = self._ocr.text_detector(img)
+        return dt_boxes if dt_boxes is not None else np.zeros((0, 4, 2))
+
+    def classify(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        crops, _, _ = self._ocr.text_classifier(crops)
+        return crops
+
+    def _run_text_recognizer(
+        self, crops: List[np.ndarray], batch_size: Optional[int]
+    ) -> RecognitionResultType:
+        # The batch size is an attribute of the recognizer, the calls are serialized by
+        # the recognition lock so it can be overridden for the duration of a call
+        text_recognizer = self._ocr.text_recognizer
+        rec_batch_num = text_recognizer.rec_batch_num
+        text_recognizer.rec_batch_num = batch_size or rec_batch_num
+        try:
+            rec_res, _ = text_recognizer(crops)
+        finally:
+            text_recognizer.rec_batch_num = rec_batch_num
+        return rec_res
+
+    def recognize(
+        self, crops: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> RecognitionResultType:
+        return self._run_text_recognizer(crops, batch_size)
+
+    def recognize_digits(
+        self, crops: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> RecognitionResultType:
+        postprocess_op = self._ocr.text_recognizer.postprocess_op
+        postprocess_op.local.masked = True
+        try:
+            return self._run_text_recognizer(crops, batch_size)
+        finally:
+            postprocess_op.local.masked = False
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+"""equivalence.py: Contains the differential harness that checks alternative implementations against the reference pipeline"""
+
+import argparse
+import importlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .clustering import cluster_ocr_results
+from .common import get_corpus_images
+from .document import get_document_data
+from .engine import OCREngine, load_image
+from .ocr import OCR_ENGINE_BACKENDS, filter_text_predictions, get_ocr_engine
+from .pipeline import DocumentDataType
+from .types import AllColumns, OCRResultType
+
+# The names of the outputs of `get_document_data`
+DOCUMENT_DATA_FIELDS = [
+    "pol_parties_results",
+    "pu_data_results",
+    "election_type",
+    "pu_reg_info_results",
+]
+
+
+class Implementation(NamedTuple):
+    """The stages of a pipeline implementation, the engine is only used on images."""
+
+    cluster: Callable[..., AllColumns] = cluster_ocr_results
+    parse: Callable[[AllColumns], DocumentDataType] = get_document_data
+    engine: Optional[OCREngine] = None
+
+
+class StageTimes(NamedTuple):
+    ocr: float
+    cluster: float
+    parse: float
+
+
+class SampleReport(NamedTuple):
+    name: str
+    column_diffs: List[str]
+    results_diffs: List[str]
+    reference_times: StageTimes
+    candidate_times: StageTimes
+
+
+def load_callable(path: str) -> Callable:
+    """Imports a callable from its "package.module:name" path."""
+    module_name, _, name = path.partition(":")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def load_raw_ocr_results(path: Union[str, Path]) -> OCRResultType:
+    """Loads raw OCR results, as returned by `/inec-ocr?full=1` or written by `record`."""
+    with open(path) as f:
+        raw = json.load(f)
+    raw = raw.get("raw_ocr_results", raw)
+    texts, scores = raw["texts"], raw["scores"]
+    # The OCR endpoint used to return the texts under "scores" and the scores under "texts"
+    if any(isinstance(score, str) for score in scores):
+        texts, scores = scores, texts
+    return OCRResultType(
+        raw["bboxes"], [str(text) for text in texts], [float(s) for s in scores]
+    )
+
+
+def diff_columns(reference: AllColumns, candidate: AllColumns) -> List[str]:
+    """Returns the differences between two clusterings, column by column.
+
+    The columns are compared in order (the parser picks the first matching column), and
+    their cells are compared by text and bbox.
+
+    Args:
+        reference (AllColumns): The reference columns
+        candidate (AllColumns): The candidate columns
+
+    Returns:
+        list: The human-readable differences, empty if the clusterings are identical
+    """
+    diffs = []
+    if len(reference) != len(candidate):
+        diffs.append(f"columns: {len(reference)} != {len(candidate)}")
+
+    for idx, (ref_col, cand_col) in enumerate(zip(reference, candidate)):
+        ref_cells = [(cell[0], tuple(int(x) for x in cell[1])) for cell in ref_col]
+        cand_cells = [(cell[0], tuple(int(x) for x in cell[1])) for cell in cand_col]
+        if len(ref_cells) != len(cand_cells):
+            diffs.append(
+                f"column {idx}: {[c[0] for c in ref_cells]} != "
+                f"{[c[0] for c in cand_cells]}"
+            )
+            continue
+        for cell_idx, (ref_cell, cand_cell) in enumerate(zip(ref_cells, cand_cells)):
+            if ref_cell != cand_cell:
+                diffs.append(
+                    f"column {idx}, cell {cell_idx}: {ref_cell} != {cand_cell}"
+                )
+
+    return diffs
+
+
+def _diff_values(field: str, reference: Any, candidate: Any) -> List[str]:
+    if isinstance(reference, dict) and isinstance(candidate, dict):
+        return [
+            f"{field}.{key}: {reference.get(key)!r} != {candidate.get(key)!r}"
+            for key in {**reference, **candidate}
+            if key not in reference
+            or key not in candidate
+            or reference[key] != candidate[key]
+        ]
+    if reference != candidate:
+        return [f"{field}: {reference!r} != {candidate!r}"]
+    return []
+
+
+def diff_document_data(
+    reference: DocumentDataType, candidate: DocumentDataType
+) -> List[str]:
+    """Returns the differences between two parsed documents, field by field.
+
+    Args:
+        reference (DocumentDataType): The reference `get_document_data` output
+        candidate (DocumentDataType): The candidate `get_document_data` output
+
+    Returns:
+        list: The human-readable differences, empty if the documents are identical
+    """
+    diffs = []
+    for field, ref_value, cand_value in zip(DOCUMENT_DATA_FIELDS, reference, candidate):
+        diffs.extend(_diff_values(field, ref_value, cand_value))
+    return diffs
+
+
+def run_implementation(
+    implementation: Implementation,
+    raw_ocr_results: Optional[OCRResultType] = None,
+    image_path: Optional[Path] = None,
+    repeat: Optional[int] = 1,
+) -> Tuple[AllColumns, DocumentDataType, StageTimes]:
+    """Runs an implementation on an image (OCR included) or on raw OCR results.
+
+    Args:
+        implementation (Implementation): The implementation
+        raw_ocr_results (Optional[OCRResultType]): The raw OCR results
+        image_path (Optional[Path]): The image, used when there are no raw OCR results
+        repeat (Optional[int]): The number of timed runs of the clustering and parsing, the best time is kept
+
+    Returns:
+        tuple: A tuple containing
+        - AllColumns: The clustered columns
+        - DocumentDataType: The parsed document
+        - StageTimes: The time spent in each stage, in seconds
+    """
+    ocr_time = 0.0
+    if raw_ocr_results is None:
+        image = load_image(str(image_path))
+        start = time.perf_counter()
+        raw_ocr_results = (implementation.engine or get_ocr_engine()).ocr(image)
+        ocr_time = time.perf_counter() - start
+
+    bboxes, texts = filter_text_predictions(*raw_ocr_results)
+    if len(bboxes) < 2:
+        return [], (None, None, None, None), StageTimes(ocr_time, 0.0, 0.0)
+
+    cluster_time = parse_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        columns = implementation.cluster(bboxes, texts)
+        cluster_time = min(cluster_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        document_data = implementation.parse(columns)
+        parse_time = min(parse_time, time.perf_counter() - start)
+
+    return columns, document_data, StageTimes(ocr_time, cluster_time, parse_time)
+
+
+def compare_implementations(
+    name: str,
+    candidate: Implementation,
+    reference: Optional[Implementation] = None,
+    raw_ocr_results: Optional[OCRResultType] = None,
+    image_path: Optional[Path] = None,
+    repeat: Optional[int] = 1,
+) -> SampleReport:
+    """Runs the reference and the candidate implementations side by side on a sample.
+
+    When the candidate has its own OCR engine, each implementation runs its own engine on
+    the image, so the inference optimizations are checked end to end.
+
+    Args:
+        name (str): The name of the sample
+        candidate (Implementation): The candidate implementation
+        reference (Optional[Implementation]): The reference implementation, defaults to `Implementation()`
+        raw_ocr_results (Optional[OCRResultType]): The recorded raw OCR results of the sample
+        image_path (Optional[Path]): The image of the sample, used when there are no raw OCR results
+        repeat (Optional[int]): The number of timed runs of the clustering and parsing
+
+    Returns:
+        SampleReport: The differences and the stage times of both implementations
+    """
+    if reference is None:
+        reference = Implementation()
+
+    ref_columns, ref_data, ref_times = run_implementation(
+        reference, raw_ocr_results, image_path, repeat
+    )
+    cand_columns, cand_data, cand_times = run_implementation(
+        candidate, raw_ocr_results, image_path, repeat
+    )
+    return SampleReport(
+        name,
+        diff_columns(ref_columns, cand_columns),
+        diff_document_data(ref_data, cand_data),
+        ref_times,
+        cand_times,
+    )
+
+
+def summarize(reports: List[SampleReport]) -> Dict[str, Any]:
+    """Returns the divergent samples and the per-stage speedups over all the samples."""
+    summary = {
+        "samples": len(reports),
+        "divergent_samples": [
+            report._asdict()
+            for report in reports
+            if report.column_diffs or report.results_diffs
+        ],
+        "speedup": {},
+    }
+    for stage in StageTimes._fields:
+        ref_time = sum(getattr(report.reference_times, stage) for report in reports)
+        cand_time = sum(getattr(report.candidate_times, stage) for report in reports)
+        summary["speedup"][stage] = {
+            "reference_s": ref_time,
+            "candidate_s": cand_time,
+            "speedup": ref_time / cand_time if cand_time else None,
+        }
+    return summary
+
+
+def record_raw_ocr_results(
+    image_paths: List[Path], output_dir: Union[str, Path], engine: OCREngine
+) -> None:
+    """Records the raw OCR results of the images, to compare implementations without OCR.
+
+    Args:
+        image_paths (List[Path]): The images
+        output_dir (Union[str, Path]): The directory the "<image name>.json" files are written to
+        engine (OCREngine): The OCR engine
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for path in image_paths:
+        raw_ocr_results = engine.ocr(load_image(str(path)))
+        with open(output_dir / f"{path.stem}.json", "w") as f:
+            json.dump(raw_ocr_results._asdict(), f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check alternative implementations against the reference pipeline"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser(
+        "record", help="Record the raw OCR results of the corpus images"
+    )
+    record_parser.add_argument("--corpus", default="./test-images")
+    record_parser.add_argument("--output", default="./test-images/raw-ocr-results")
+    record_parser.add_argument(
+        "--engine", default="paddle", choices=OCR_ENGINE_BACKENDS
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare a candidate implementation against the reference"
+    )
+    compare_parser.add_argument(
+        "--raw", help="Directory of recorded raw OCR results (skips the OCR)"
+    )
+    compare_parser.add_argument(
+        "--corpus", default="./test-images", help="Used when --raw is not set"
+    )
+    compare_parser.add_argument(
+        "--cluster", help='The candidate clustering, as "package.module:function"'
+    )
+    compare_parser.add_argument(
+        "--parse", help='The candidate parser, as "package.module:function"'
+    )
+    compare_parser.add_argument(
+        "--engine", choices=OCR_ENGINE_BACKENDS, help="The candidate OCR engine"
+    )
+    compare_parser.add_argument(
+        "--quantized", action="store_true", help="Use the candidate's quantized models"
+    )
+    compare_parser.add_argument("--reference-engine", default="paddle")
+    compare_parser.add_argument("--repeat", type=int, default=3)
+    compare_parser.add_argument("--report", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_raw_ocr_results(
+            get_corpus_images(args.corpus), args.output, get_ocr_engine(args.engine)
+        )
+        return
+
+    candidate = Implementation(
+        cluster=load_callable(args.cluster) if args.cluster else cluster_ocr_results,
+        parse=load_callable(args.parse) if args.parse else get_document_data,
+    )
+    reference = Implementation()
+    if args.raw:
+        samples = [
+            (path.stem, load_raw_ocr_results(path), None)
+            for path in sorted(Path(args.raw).glob("*.json"))
+        ]
+    elif args.engine or args.quantized:
+        # Each implementation runs its own OCR engine on the images
+        samples = [(path.name, None, path) for path in get_corpus_images(args.corpus)]
+        reference = reference._replace(engine=get_ocr_engine(args.reference_engine))
+        candidate = candidate._replace(
+            engine=get_ocr_engine(
+                args.engine or args.reference_engine, quantized=args.quantized
+            )
+        )
+    else:
+        # Both implementations share the same engine, so the images are OCR'd once
+        engine = get_ocr_engine(args.reference_engine)
+        samples = [
+            (path.name, engine.ocr(load_image(str(path))), None)
+            for path in get_corpus_images(args.corpus)
+        ]
+
+    reports = [
+        compare_implementations(
+            name, candidate, reference, raw_ocr_results, image_path, args.repeat
+        )
+        for name, raw_ocr_results, image_path in samples
+    ]
+    summary = summarize(reports)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(
+                {**summary, "reports": [report._asdict() for report in reports]},
+                f,
+                indent=2,
+            )
+
+    for report in summary["divergent_samples"]:
+        print(f"{report['name']}:")
+        for diff in report["column_diffs"] + report["results_diffs"]:
+            print(f"  {diff}")
+    for stage, times in summary["speedup"].items():
+        if times["speedup"] is not None:
+            print(
+                f"{stage}: {times['reference_s']:.3f}s -> {times['candidate_s']:.3f}s "
+                f"({times['speedup']:.2f}x)"
+            )
+    print(f"{len(summary['divergent_samples'])}/{summary['samples']} divergent samples")
+
+    if summary["divergent_samples"]:
+        raise SystemExit("The candidate implementation diverges from the reference")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+"""grid.py: Contains the table-grid layout analysis of the OCR'd bboxes, based on the printed ruling lines"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .types import AllColumns, OCRBBoxesResultType, OCRTextsResultType
+
+
+class TableGrid(NamedTuple):
+    # The cell label of each pixel of the analysed image (0 for the non-cell pixels)
+    labels: np.ndarray
+    # The column of each cell label, -1 for the labels that are not cells
+    cell_columns: np.ndarray
+    # The (left ruling, right ruling) x-coordinates of each column
+    columns: List[Tuple[int, int]]
+    # The scale of the analysed image relative to the input image
+    scale: float
+
+
+def extract_ruling_lines(
+    gray: np.ndarray, min_line_ratio: Optional[float] = 0.05
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Extracts the horizontal and vertical ruling lines of a document with
+    morphological openings.
+
+    An opening with a long, thin, structuring element only keeps the dark strokes at
+    least as long as the element, which the text strokes are not.
+
+    Args:
+        gray (np.ndarray): The grayscale image of the document
+        min_line_ratio (Optional[float]): The minimum length of a ruling line, relative to the image's width (horizontal) or height (vertical)
+
+    Returns:
+        tuple: A tuple containing
+        - np.ndarray: The binary mask of the horizontal lines
+        - np.ndarray: The binary mask of the vertical lines
+    """
+    binary = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10
+    )
+    h, w = binary.shape
+    horizontal_kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(int(w * min_line_ratio), 10), 1)
+    )
+    vertical_kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, (1, max(int(h * min_line_ratio), 10))
+    )
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horizontal_kernel)
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, vertical_kernel)
+    return horizontal, vertical
+
+
+def get_line_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the start and end (inclusive) x-coordinates of the runs of columns of a
+    vertical lines mask that contain line pixels, i.e. the extents of the rulings."""
+    present = np.concatenate([[False], mask.any(axis=0), [False]]).astype(np.int8)
+    edges = np.diff(present)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+def detect_table_grid(
+    image: np.ndarray,
+    analysis_side: Optional[int] = 1600,
+    min_line_ratio: Optional[float] = 0.05,
+    max_cell_area_ratio: Optional[float] = 0.1,
+    min_cell_side: Optional[int] = 8,
+) -> TableGrid:
+    """Detects the cells of the printed tables of a document, and their columns.
+
+    The cells are the regions enclosed by the ruling lines: the connected components of
+    the pixels off the lines, without the ones touching the image's border (the page's
+    background) and the ones larger than `max_cell_area_ratio` of the image (the page
+    areas framed by a border, not by a table). The columns of the cells are the pairs of
+    rulings on their left and right, so that the cells of a column match however wide
+    their text is.
+
+    Args:
+        image (np.ndarray): The (rectified) image of the document
+        analysis_side (Optional[int]): The length of the longer side of the downscaled copy the rulings are detected on
+        min_line_ratio (Optional[float]): The minimum length of a ruling line, relative to the image's side
+        max_cell_area_ratio (Optional[float]): The maximum area of a cell, relative to the image's area
+        min_cell_side (Optional[int]): The minimum width and height of a cell, in pixels of the downscaled copy
+
+    Returns:
+        TableGrid: The cell labels and columns of the document
+    """
+    h, w = image.shape[:2]
+    scale = min(1.0, analysis_side / max(h, w))
+    small = cv2.resize(
+        image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+    )
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    height, width = gray.shape
+
+    horizontal, vertical = extract_ruling_lines(gray, min_line_ratio)
+    # Close the small gaps of the rulings, at their intersections in particular
+    kernel = np.ones((3, 3), np.uint8)
+    rulings = cv2.dilate(cv2.bitwise_or(horizontal, vertical), kernel)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(
+        cv2.bitwise_not(rulings), connectivity=4
+    )
+
+    x0, y0, cell_w, cell_h, area = stats.T
+    is_cell = (
+        (x0 > 0)
+        & (y0 > 0)
+        & (x0 + cell_w < width)
+        & (y0 + cell_h < height)
+        & (cell_w >= min_cell_side)
+        & (cell_h >= min_cell_side)
+        & (area <= max_cell_area_ratio * width * height)
+    )
+    # The label 0 is the rulings
+    is_cell[0] = False
+
+    # The rulings on the left and right of each cell, the runs of a skewed ruling are
+    # wider than the ruling, but still end before (start after) the cells it bounds
+    run_starts, run_ends = get_line_runs(cv2.dilate(vertical, kernel))
+    left = np.searchsorted(run_starts, x0, side="right") - 1
+    right = np.searchsorted(run_ends, x0 + cell_w)
+    is_cell &= (left >= 0) & (right < len(run_ends))
+
+    cell_columns = np.full(num_labels, -1)
+    column_ids: Dict[Tuple[int, int], int] = {}
+    for label in np.flatnonzero(is_cell):
+        key = (int(run_starts[left[label]]), int(run_ends[right[label]]))
+        cell_columns[label] = column_ids.setdefault(key, len(column_ids))
+
+    return TableGrid(labels, cell_columns, list(column_ids), scale)
+
+
+def group_free_boxes(
+    idxs: List[int], bboxes: OCRBBoxesResultType, distance_threshold: float
+) -> List[List[int]]:
+    """Groups the boxes outside of the tables into columns, by their starting
+    x-coordinates: a new column starts at each gap wider than `distance_threshold`."""
+    groups: List[List[int]] = []
+    previous_x = None
+    for i in sorted(idxs, key=lambda i: bboxes[i][0]):
+        if previous_x is None or bboxes[i][0] - previous_x > distance_threshold:
+            groups.append([])
+        groups[-1].append(i)
+        previous_x = bboxes[i][0]
+
+    # Like the clustering, the isolated boxes are not columns
+    return [group for group in groups if len(group) > 1]
+
+
+def grid_ocr_results(
+    image: np.ndarray,
+    bboxes: OCRBBoxesResultType,
+    texts: OCRTextsResultType,
+    distance_threshold: Optional[float] = 30,
+    grid: Optional[TableGrid] = None,
+) -> AllColumns:
+    """Returns the columns of the OCR results, from the cell grid of the tables.
+
+    This is an alternative to `cluster_ocr_results` that does not depend on the texts
+    of a column starting at the same x-coordinate: each box is assigned to the table
+    cell that contains its center (a lookup in the grid's label image), and the column
+    of its cell. The boxes outside of the tables (the form's header, for instance) are
+    grouped by their starting x-coordinates, in a single sweep. The columns are in the
+    same `AllColumns` structure, so they are parsed by `get_document_data` unchanged.
+
+    The bboxes must be in the coordinates of the image, which should be rectified (see
+    `rectify_document`) for the rulings to be straight.
+
+    Args:
+        image (np.ndarray): The image the texts were extracted from
+        bboxes (OCRBBoxesResultType): The (x1, y1, x2, y2) bounding boxes associated with the extracted texts
+        texts (OCRTextsResultType): The extracted texts
+        distance_threshold (Optional[float]): The maximum gap between the starting x-coordinates of the texts outside of the tables in a column
+        grid (Optional[TableGrid]): The table grid of the image, detected if not provided
+
+    Returns:
+        list: A list containing the columns.
+    """
+    if grid is None:
+        grid = detect_table_grid(image)
+
+    height, width = grid.labels.shape
+    columns: List[List[int]] = [[] for _ in grid.columns]
+    free_idxs = []
+    for i, (x1, y1, x2, y2) in enumerate(bboxes):
+        cx = min(max(int((x1 + x2) / 2 * grid.scale), 0), width - 1)
+        cy = min(max(int((y1 + y2) / 2 * grid.scale), 0), height - 1)
+        column = grid.cell_columns[grid.labels[cy, cx]]
+        if column >= 0:
+            columns[column].append(i)
+        else:
+            free_idxs.append(i)
+
+    columns = [column for column in columns if column]
+    columns += group_free_boxes(free_idxs, bboxes, distance_threshold)
+
+    # Sort the columns based on the average of their starting x-coordinates, and their
+    # texts based on their starting y-coordinates
+    columns.sort(key=lambda idxs: np.average([bboxes[i][0] for i in idxs]))
+    return [
+        [
+            (texts[i].strip(), bboxes[i])
+            for i in sorted(column, key=lambda i: bboxes[i][1])
+        ]
+        for column in columns
+    ]
@@ -5,40 +5,134 @@
 
 import os
 import pathlib
-from typing import List, Optional, Tuple
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
-from paddleocr import PaddleOCR
 
+from .engine import OCREngine, PaddleOCREngine
 from .types import (
+    EnginePreset,
     OCRBBoxesResultType,
     OCRResultType,
     OCRScoresResultType,
     OCRTextsResultType,
 )
 
-# Instantiate the OCR engine
-ocr = PaddleOCR(
-    use_angle_cls=True,
-    lang="en",
-    det_model_dir="./models/det/en/en_PP-OCRv3_det_infer",
-    rec_model_dir="./models/rec/en/en_PP-OCRv3_rec_infer",
-    cls_model_dir="./models/cls/ch_ppocr_mobile_v2.0_cls_infer",
-    cpu_threads=10,
-    show_log=True,
-)
-
-
-def get_ocr_engine():
-    return ocr
+# The available OCR engine backends
+OCR_ENGINE_BACKENDS = ["paddle", "onnx"]
+
+# The speed/accuracy presets of the OCR engines, "balanced" is PaddleOCR's defaults
+ENGINE_PRESETS = {
+    # No angle classifier, a smaller detector input, larger recognition batches and
+    # MKL-DNN: for a fast turnaround on well-framed photos
+    "fast": EnginePreset(
+        use_angle_cls=False,
+        det_limit_side_len=736,
+        rec_batch_num=16,
+        enable_mkldnn=True,
+    ),
+    "balanced": EnginePreset(),
+    # The shortest side of the detector's input is upscaled to 960px (phone photos of
+    # 540x720 are detected at 960x1280, which "balanced" leaves as is), and the text
+    # boxes are expanded further so that the edges of the digits are not cropped: for
+    # audits. Large photos are not downscaled, their detection is slower.
+    "accurate": EnginePreset(
+        det_limit_side_len=960, det_limit_type="min", det_db_unclip_ratio=2.0
+    ),
+}
+
+
+@lru_cache
+def get_ocr_engine(
+    backend: Optional[str] = "paddle",
+    cpu_threads: Optional[int] = 10,
+    quantized: Optional[bool] = False,
+    quantization_min_accuracy: Optional[float] = 0.98,
+    numeric_rec_model_path: Optional[str] = None,
+    numeric_rec_char_dict_path: Optional[str] = None,
+    preset: Optional[str] = "balanced",
+) -> OCREngine:
+    """Returns the (cached) OCR engine for the specified backend and preset.
 
+    Args:
+        backend (Optional[str]): The OCR engine backend, one of `OCR_ENGINE_BACKENDS`
+        cpu_threads (Optional[int]): The number of CPU threads used by the inference runtime
+        quantized (Optional[bool]): Whether to use the INT8-quantized det/rec models (onnx backend only)
+        quantization_min_accuracy (Optional[float]): The minimum party vote extraction accuracy the quantized models must have passed the accuracy gate with
+        numeric_rec_model_path (Optional[str]): The path to a lighter recognizer for the numeric cells (onnx backend only)
+        numeric_rec_char_dict_path (Optional[str]): The path to the numeric recognizer's character dictionary
+        preset (Optional[str]): The speed/accuracy preset, one of `ENGINE_PRESETS`
 
-def extract_text(img_path: str) -> OCRResultType:
+    Returns:
+        OCREngine: The OCR engine
+    """
+    if quantized and backend != "onnx":
+        raise ValueError("The quantized models are only supported by the onnx backend")
+    if numeric_rec_model_path and backend != "onnx":
+        raise ValueError(
+            "The numeric recognition model is only supported by the onnx backend"
+        )
+
+    if preset not in ENGINE_PRESETS:
+        raise ValueError(
+            f"Unknown OCR engine preset: {preset}, "
+            f"expected one of {list(ENGINE_PRESETS)}"
+        )
+    params = ENGINE_PRESETS[preset]
+
+    if backend == "paddle":
+        return PaddleOCREngine(cpu_threads=cpu_threads, **params._asdict())
+    if backend == "onnx":
+        # MKL-DNN is a Paddle inference option
+        onnx_params = params._asdict()
+        del onnx_params["enable_mkldnn"]
+
+        # onnxruntime is imported lazily so that it is not required by the paddle backend
+        from .onnx_engine import ONNXRuntimeEngine
+
+        if quantized:
+            from .quantization import (
+                QUANTIZED_DET_MODEL_PATH,
+                QUANTIZED_REC_MODEL_PATH,
+                check_quantization_gate,
+            )
+
+            # Refuse to load quantized models that have not passed the accuracy gate
+            check_quantization_gate(quantization_min_accuracy)
+            return ONNXRuntimeEngine(
+                det_model_path=QUANTIZED_DET_MODEL_PATH,
+                rec_model_path=QUANTIZED_REC_MODEL_PATH,
+                cpu_threads=cpu_threads,
+                numeric_rec_model_path=numeric_rec_model_path,
+                numeric_rec_char_dict_path=numeric_rec_char_dict_path,
+                **onnx_params,
+            )
+
+        return ONNXRuntimeEngine(
+            cpu_threads=cpu_threads,
+            numeric_rec_model_path=numeric_rec_model_path,
+            numeric_rec_char_dict_path=numeric_rec_char_dict_path,
+            **onnx_params,
+        )
+
+    raise ValueError(
+        f"Unknown OCR engine backend: {backend}, expected one of {OCR_ENGINE_BACKENDS}"
+    )
+
+
+def extract_text(
+    img: Union[str, np.ndarray],
+    engine: Optional[OCREngine] = None,
+    checkpoint: Optional[Callable[[str], None]] = None,
+) -> OCRResultType:
     """Returns the extracted texts and their associated bounding boxes and confidence scores.
 
     Args:
-        img_path (str): The path to the image file
+        img (Union[str, np.ndarray]): The path to the image file or an already decoded image
+        engine (Optional[OCREngine]): The OCR engine, defaults to the PaddleOCR engine
+        checkpoint (Optional[Callable]): Called with the name of each stage that ended, see `OCREngine.ocr`
 
     Returns:
         tuple: A tuple containing
@@ -46,13 +140,11 @@ def extract_text(img_path: str) -> OCRResultType:
         - texts (list): List of the extracted texts
         - scores (list): List of the confidence scores associated with the extracted texts
     """
-    result = ocr.ocr(img_path, cls=True)
+    if engine is None:
+        engine = get_ocr_engine()
 
     # Obtain the bboxes, texts, and scores
-    result = result[0]
-    bboxes = [line[0] for line in result]
-    texts = [line[1][0] for line in result]
-    scores = [line[1][1] for line in result]
+    bboxes, texts, scores = engine.ocr(img, checkpoint)
 
     # Return the results
     return bboxes, texts, scores
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+
+"""onnx_engine.py: Contains the ONNX Runtime backend for the PP-OCRv3 models"""
+
+__credits__ = ["PaddleOCR (for the DB post-processing and CTC decoding algorithms)"]
+
+import math
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+import pyclipper
+
+from .engine import (
+    DIGITS,
+    OCREngine,
+    RecognitionResultType,
+    get_charset_mask,
+    get_det_input_size,
+)
+
+# Paths to the bundled PP-OCRv3 models converted to ONNX (see `make convert-onnx-models`)
+ONNX_DET_MODEL_PATH = "./models/onnx/det/en_PP-OCRv3_det.onnx"
+ONNX_REC_MODEL_PATH = "./models/onnx/rec/en_PP-OCRv3_rec.onnx"
+ONNX_CLS_MODEL_PATH = "./models/onnx/cls/ch_ppocr_mobile_v2.0_cls.onnx"
+REC_CHAR_DICT_PATH = "./models/rec/en/en_dict.txt"
+
+
+def get_session_options(
+    intra_op_num_threads: Optional[int] = 4,
+) -> ort.SessionOptions:
+    """Returns the ONNX Runtime session options used for all the models.
+
+    All the graph optimizations (constant folding, node fusions, layout optimizations) are
+    enabled. The models are run sequentially within a single request, so the inter-op thread
+    pool is kept at a single thread and the CPU budget is given to the intra-op thread pool.
+
+    Args:
+        intra_op_num_threads (Optional[int]): The number of threads used within each operator
+
+    Returns:
+        ort.SessionOptions: The session options
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+def load_char_dict(char_dict_path: str) -> List[str]:
+    """Returns the recognizer's character list, including the CTC blank and the space character.
+
+    Args:
+        char_dict_path (str): The path to the character dictionary file
+
+    Returns:
+        list: The list of characters indexed by the recognizer's class indexes
+    """
+    with open(char_dict_path, "rb") as f:
+        chars = [line.decode("utf-8").strip("\r\n") for line in f]
+    return ["blank"] + chars + [" "]
+
+
+class ONNXRuntimeEngine(OCREngine):
+    """OCR engine backed by ONNX Runtime and the converted PP-OCRv3 models."""
+
+    # ONNX Runtime sessions can be run concurrently
+    concurrent_detection = True
+    concurrent_recognition = True
+
+    def __init__(
+        self,
+        det_model_path: Optional[str] = ONNX_DET_MODEL_PATH,
+        rec_model_path: Optional[str] = ONNX_REC_MODEL_PATH,
+        cls_model_path: Optional[str] = ONNX_CLS_MODEL_PATH,
+        rec_char_dict_path: Optional[str] = REC_CHAR_DICT_PATH,
+        cpu_threads: Optional[int] = 4,
+        use_angle_cls: Optional[bool] = True,
+        det_limit_side_len: Optional[int] = 960,
+        det_limit_type: Optional[str] = "max",
+        det_db_unclip_ratio: Optional[float] = 1.5,
+        rec_batch_num: Optional[int] = 6,
+        cls_batch_num: Optional[int] = 6,
+        numeric_rec_model_path: Optional[str] = None,
+        numeric_rec_char_dict_path: Optional[str] = None,
+    ):
+        super().__init__(use_angle_cls=use_angle_cls)
+        self.det_limit_side_len = det_limit_side_len
+        self.det_limit_type = det_limit_type
+        self.rec_batch_num = rec_batch_num
+        self.cls_batch_num = cls_batch_num
+
+        # DB post-processing parameters (PaddleOCR's defaults)
+        self.det_db_thresh = 0.3
+        self.det_db_box_thresh = 0.6
+        self.det_db_unclip_ratio = det_db_unclip_ratio
+        self.max_candidates = 1000
+
+        # Angle classifier parameters
+        self.cls_image_shape = (3, 48, 192)
+        self.cls_thresh = 0.9
+
+        # Recognizer parameters
+        self.rec_image_shape = (3, 48, 320)
+        self.character = load_char_dict(rec_char_dict_path)
+
+        # An optional (lighter) recognizer trained on the numeric cells only, its
+        # character dictionary defaults to the general recognizer's
+        self.numeric_character = (
+            load_char_dict(numeric_rec_char_dict_path)
+            if numeric_rec_char_dict_path
+            else self.character
+        )
+        self.numeric_digits_mask = get_charset_mask(self.numeric_character, DIGITS)
+
+        # The sessions (and their thread pools) are created lazily in the process that
+        # runs them, from the model files: thread pools do not survive a fork, and each
+        # session holds its own copy of the weights, which forked workers cannot share.
+        # The engine keeps no copy of its own, the model files are only checked.
+        self.cpu_threads = cpu_threads
+        self._model_paths = {"det": det_model_path, "rec": rec_model_path}
+        if use_angle_cls:
+            self._model_paths["cls"] = cls_model_path
+        if numeric_rec_model_path:
+            self._model_paths["numeric_rec"] = numeric_rec_model_path
+        for path in self._model_paths.values():
+            if not Path(path).is_file():
+                raise FileNotFoundError(f"The ONNX model was not found: {path}")
+        self._sessions = {}
+        self._sessions_pid = None
+
+    def _get_session(self, name: str) -> ort.InferenceSession:
+        if self._sessions_pid != os.getpid():
+            self._sessions = {}
+            self._sessions_pid = os.getpid()
+        if name not in self._sessions:
+            self._sessions[name] = ort.InferenceSession(
+                str(self._model_paths[name]),
+                get_session_options(self.cpu_threads),
+                providers=["CPUExecutionProvider"],
+            )
+        return self._sessions[name]
+
+    @property
+    def det_session(self) -> ort.InferenceSession:
+        return self._get_session("det")
+
+    @property
+    def rec_session(self) -> ort.InferenceSession:
+        return self._get_session("rec")
+
+    @property
+    def numeric_rec_session(self) -> ort.InferenceSession:
+        # Fall back to the general recognizer when no numeric model is configured
+        if "numeric_rec" not in self._model_paths:
+            return self.rec_session
+        return self._get_session("numeric_rec")
+
+    @property
+    def cls_session(self) -> ort.InferenceSession:
+        return self._get_session("cls")
+
+    def _run(self, session: ort.InferenceSession, inputs: np.ndarray) -> np.ndarray:
+        input_name = session.get_inputs()[0].name
+        return session.run(None, {input_name: inputs})[0]
+
+    def _resize_det_image(self, img: np.ndarray) -> Tuple[np.ndarray, float, float]:
+        """Resizes the image to the detector's limit, with both sides multiples of 32."""
+        h, w = img.shape[:2]
+        resize_h, resize_w = get_det_input_size(
+            h, w, self.det_limit_side_len, self.det_limit_type
+        )
+        resized = cv2.resize(img, (resize_w, resize_h))
+        return resized, resize_h / float(h), resize_w / float(w)
+
+    def preprocess_det_image(self, img: np.ndarray) -> np.ndarray:
+        """Returns the detector's input tensor for an image."""
+        resized, _, _ = self._resize_det_image(img)
+
+        # Normalize with the ImageNet mean and std, then convert HWC to CHW
+        mean = np.array([0.485, 0.456, 0.406], dtype="float32")
+        std = np.array([0.229, 0.224, 0.225], dtype="float32")
+        x = (resized.astype("float32") / 255.0 - mean) / std
+        return x.transpose((2, 0, 1))[np.newaxis, :]
+
+    def detect(self, img: np.ndarray) -> np.ndarray:
+        src_h, src_w = img.shape[:2]
+        pred = self._run(self.det_session, self.preprocess_det_image(img))[0, 0]
+        bitmap = pred > self.det_db_thresh
+        boxes = self._boxes_from_bitmap(pred, bitmap, src_w, src_h)
+        return self._filter_det_boxes(boxes, src_h, src_w)
+
+    def _boxes_from_bitmap(
+        self, pred: np.ndarray, bitmap: np.ndarray, dest_width: int, dest_height: int
+    ) -> List[np.ndarray]:
+        height, width = bitmap.shape
+        contours, _ = cv2.findContours(
+            (bitmap * 255).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
+        )
+
+        boxes = []
+        for contour in contours[: self.max_candidates]:
+            points, sside = self._get_mini_boxes(contour)
+            if sside < 3:
+                continue
+            if self._box_score_fast(pred, points) < self.det_db_box_thresh:
+                continue
+
+            # Expand the shrunk text region predicted by the DB model
+            expanded = self._unclip(points).reshape(-1, 1, 2).astype("float32")
+            if len(expanded) == 0:
+                continue
+            box, sside = self._get_mini_boxes(expanded)
+            if sside < 5:
+                continue
+
+            # Map the box back to the original image coordinates
+            box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0, dest_width)
+            box[:, 1] = np.clip(
+                np.round(box[:, 1] / height * dest_height), 0, dest_height
+            )
+            boxes.append(box.astype("float32"))
+
+        return boxes
+
+    def _get_mini_boxes(self, contour: np.ndarray) -> Tuple[np.ndarray, float]:
+        bounding_box = cv2.minAreaRect(contour)
+        points = sorted(list(cv2.boxPoints(bounding_box)), key=lambda x: x[0])
+
+        if points[1][1] > points[0][1]:
+            index_1, index_4 = 0, 1
+        else:
+            index_1, index_4 = 1, 0
+        if points[3][1] > points[2][1]:
+            index_2, index_3 = 2, 3
+        else:
+            index_2, index_3 = 3, 2
+
+        box = np.array(
+            [points[index_1], points[index_2], points[index_3], points[index_4]]
+        )
+        return box, min(bounding_box[1])
+
+    def _box_score_fast(self, pred: np.ndarray, box: np.ndarray) -> float:
+        h, w = pred.shape[:2]
+        box = box.copy()
+        xmin = np.clip(np.floor(box[:, 0].min()).astype("int32"), 0, w - 1)
+        xmax = np.clip(np.ceil(box[:, 0].max()).astype("int32"), 0, w - 1)
+        ymin = np.clip(np.floor(box[:, 1].min()).astype("int32"), 0, h - 1)
+        ymax = np.clip(np.ceil(box[:, 1].max()).astype("int32"), 0, h - 1)
+
+        mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
+        box[:, 0] = box[:, 0] - xmin
+        box[:, 1] = box[:, 1] - ymin
+        cv2.fillPoly(mask, box.reshape(1, -1, 2).astype("int32"), 1)
+        return cv2.mean(pred[ymin : ymax + 1, xmin : xmax + 1], mask)[0]
+
+    def _unclip(self, box: np.ndarray) -> np.ndarray:
+        area = cv2.contourArea(box.astype("float32"))
+        length = cv2.arcLength(box.astype("float32"), True)
+        distance = area * self.det_db_unclip_ratio / length
+        offset = pyclipper.PyclipperOffset()
+        offset.AddPath(box.tolist(), pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+        expanded = offset.Execute(distance)
+        return np.array(expanded[0]) if expanded else np.zeros((0, 2))
+
+    def _filter_det_boxes(
+        self, boxes: List[np.ndarray], img_height: int, img_width: int
+    ) -> np.ndarray:
+        filtered = []
+        for box in boxes:
+            # Order the points clockwise starting from the top-left point
+            s = box.sum(axis=1)
+            diff = np.diff(box, axis=1).ravel()
+            rect = np.array(
+                [
+                    box[np.argmin(s)],
+                    box[np.argmin(diff)],
+                    box[np.argmax(s)],
+                    box[np.argmax(diff)],
+                ],
+                dtype="float32",
+            )
+            rect[:, 0] = np.clip(rect[:, 0], 0, img_width - 1)
+            rect[:, 1] = np.clip(rect[:, 1], 0, img_height - 1)
+
+            rect_width = int(np.linalg.norm(rect[0] - rect[1]))
+            rect_height = int(np.linalg.norm(rect[0] - rect[3]))
+            if rect_width <= 3 or rect_height <= 3:
+                continue
+            filtered.append(rect)
+
+        return np.array(filtered).reshape(-1, 4, 2)
+
+    def _resize_norm_img(
+        self, img: np.ndarray, image_shape: Tuple[int, int, int], img_width: int
+    ) -> np.ndarray:
+        """Resizes a text crop to the model's input height (keeping its aspect ratio),
+        normalizes it to [-1, 1] and right-pads it to the batch width."""
+        img_c, img_h, _ = image_shape
+        h, w = img.shape[:2]
+        resized_w = min(img_width, int(math.ceil(img_h * w / float(h))))
+        resized = cv2.resize(img, (resized_w, img_h)).astype("float32")
+        resized = (resized.transpose((2, 0, 1)) / 255.0 - 0.5) / 0.5
+
+        padded = np.zeros((img_c, img_h, img_width), dtype=np.float32)
+        padded[:, :, 0:resized_w] = resized
+        return padded
+
+    def classify(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        crops = list(crops)
+        # Sorting by the aspect ratio speeds up the batched inference
+        indices = np.argsort([crop.shape[1] / float(crop.shape[0]) for crop in crops])
+
+        for start in range(0, len(crops), self.cls_batch_num):
+            batch_indices = indices[start : start + self.cls_batch_num]
+            batch = np.stack(
+                [
+                    self._resize_norm_img(
+                        crops[i], self.cls_image_shape, self.cls_image_shape[2]
+                    )
+                    for i in batch_indices
+                ]
+            )
+            preds = self._run(self.cls_session, batch)
+
+            for i, pred in zip(batch_indices, preds):
+                # Class 1 denotes text that is rotated by 180 degrees
+                if pred.argmax() == 1 and pred[1] > self.cls_thresh:
+                    crops[i] = cv2.rotate(crops[i], cv2.ROTATE_180)
+
+        return crops
+
+    def recognize(
+        self, crops: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> RecognitionResultType:
+        return self._recognize(crops, self.rec_session, self.character, batch_size)
+
+    def recognize_digits(
+        self, crops: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> RecognitionResultType:
+        return self._recognize(
+            crops,
+            self.numeric_rec_session,
+            self.numeric_character,
+            batch_size,
+            self.numeric_digits_mask,
+        )
+
+    def _recognize(
+        self,
+        crops: List[np.ndarray],
+        session: ort.InferenceSession,
+        character: List[str],
+        batch_size: Optional[int] = None,
+        mask: Optional[np.ndarray] = None,
+    ) -> RecognitionResultType:
+        rec_res = [("", 0.0)] * len(crops)
+        # Sorting by the aspect ratio speeds up the batched inference
+        indices = np.argsort([crop.shape[1] / float(crop.shape[0]) for crop in crops])
+        _, img_h, img_w = self.rec_image_shape
+        batch_size = batch_size or self.rec_batch_num
+
+        for start in range(0, len(crops), batch_size):
+            batch_indices = indices[start : start + batch_size]
+            max_wh_ratio = max(
+                [img_w / img_h]
+                + [crops[i].shape[1] / float(crops[i].shape[0]) for i in batch_indices]
+            )
+            batch_width = int(img_h * max_wh_ratio)
+            batch = np.stack(
+                [
+                    self._resize_norm_img(crops[i], self.rec_image_shape, batch_width)
+                    for i in batch_indices
+                ]
+            )
+            preds = self._run(session, batch)
+
+            for i, result in zip(
+                batch_indices, self._ctc_decode(preds, character, mask)
+            ):
+                rec_res[i] = result
+
+        return rec_res
+
+    def _ctc_decode(
+        self,
+        preds: np.ndarray,
+        character: Optional[List[str]] = None,
+        mask: Optional[np.ndarray] = None,
+    ) -> RecognitionResultType:
+        """Greedy CTC decoding: repeated characters are collapsed and blanks are removed.
+
+        Args:
+            preds (np.ndarray): The recognizer's class probabilities, with shape (N, T, C)
+            character (Optional[list]): The character list, defaults to the general recognizer's
+            mask (Optional[np.ndarray]): The mask of the classes that may be decoded, all by default
+
+        Returns:
+            RecognitionResultType: The decoded text and confidence score of each crop
+        """
+        if character is None:
+            character = self.character
+        if mask is not None:
+            preds = preds * mask
+
+        preds_idx = preds.argmax(axis=2)
+        preds_prob = preds.max(axis=2)
+
+        results = []
+        for idx, prob in zip(preds_idx, preds_prob):
+            selection = np.ones(len(idx), dtype=bool)
+            selection[1:] = idx[1:] != idx[:-1]
+            selection &= idx != 0
+
+            text = "".join(character[i] for i in idx[selection])
+            conf = prob[selection]
+            results.append((text, float(np.mean(conf)) if len(conf) else 0.0))
+
+        return results
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""pdf.py: Contains the lazy rasterization of multi-page PDFs of result sheets"""
+
+import math
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from .engine import OCREngine
+from .ocr import extract_text, get_ocr_engine
+from .pipeline import DocumentDataType, parse_ocr_results
+from .types import DocumentParserConfig, OCRResultType
+
+# PDF page sizes are in points (1/72 inch)
+POINTS_PER_INCH = 72
+
+
+def get_pdf_page_count(path: str) -> int:
+    """Returns the number of pages of a PDF file.
+
+    Raises:
+        ValueError: If the file is not a valid PDF
+    """
+    # pypdfium2 is imported lazily so that it is only required by the PDF ingestion
+    import pypdfium2 as pdfium
+
+    try:
+        pdf = pdfium.PdfDocument(path)
+    except pdfium.PdfiumError as e:
+        raise ValueError(f"Invalid PDF: {str(e)}")
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def iter_pdf_pages(
+    path: str,
+    dpi: Optional[int] = 200,
+    max_pixels: Optional[int] = None,
+    max_pages: Optional[int] = None,
+) -> Iterator[np.ndarray]:
+    """Rasterizes the pages of a PDF file one at a time, as 3-channel BGR images.
+
+    The PDF is read from the file as the pages are rendered, and each page (and its
+    bitmap) is released before the next one is rendered, so only one page is held in
+    memory at a time as long as the caller drops the previous page.
+
+    Args:
+        path (str): The path to the PDF file
+        dpi (Optional[int]): The resolution of the rasterized pages
+        max_pixels (Optional[int]): The maximum pixel count of a page, larger pages are rendered at a lower resolution
+        max_pages (Optional[int]): The maximum number of pages to render
+
+    Yields:
+        np.ndarray: The rasterized pages
+
+    Raises:
+        ValueError: If the file is not a valid PDF
+    """
+    # pypdfium2 is imported lazily so that it is only required by the PDF ingestion
+    import pypdfium2 as pdfium
+
+    try:
+        pdf = pdfium.PdfDocument(path)
+    except pdfium.PdfiumError as e:
+        raise ValueError(f"Invalid PDF: {str(e)}")
+
+    try:
+        num_pages = len(pdf) if max_pages is None else min(len(pdf), max_pages)
+        for i in range(num_pages):
+            page = pdf[i]
+            try:
+                width, height = page.get_size()
+                scale = dpi / POINTS_PER_INCH
+                pixels = width * height * scale**2
+                if max_pixels and pixels > max_pixels:
+                    scale *= math.sqrt(max_pixels / pixels)
+
+                bitmap = page.render(scale=scale)
+                try:
+                    # Copy the pixels out of the bitmap, whose buffer is freed on close
+                    image = np.array(bitmap.to_numpy()[:, :, :3])
+                finally:
+                    bitmap.close()
+            except pdfium.PdfiumError as e:
+                raise ValueError(f"Unable to render page {i + 1}: {str(e)}")
+            finally:
+                page.close()
+            yield image
+            # Release the page before rendering the next one
+            del image
+    finally:
+        pdf.close()
+
+
+class PDFPageResults(NamedTuple):
+    page: int
+    raw_ocr_results: OCRResultType
+    document_data: DocumentDataType
+
+
+def iter_pdf_document_data(
+    path: str,
+    engine: Optional[OCREngine] = None,
+    config: Optional[DocumentParserConfig] = None,
+    dpi: Optional[int] = 200,
+    max_pixels: Optional[int] = None,
+) -> Iterator[PDFPageResults]:
+    """Runs OCR and parses the result sheet of each page of a PDF file, one page at a time.
+
+    Args:
+        path (str): The path to the PDF file
+        engine (Optional[OCREngine]): The OCR engine, defaults to the PaddleOCR engine
+        config (Optional[DocumentParserConfig]): The parser's thresholds and tolerances
+        dpi (Optional[int]): The resolution of the rasterized pages
+        max_pixels (Optional[int]): The maximum pixel count of a page
+
+    Yields:
+        PDFPageResults: The page number (from 1), raw OCR results and document data of each page
+    """
+    if engine is None:
+        engine = get_ocr_engine()
+
+    for i, image in enumerate(iter_pdf_pages(path, dpi, max_pixels), start=1):
+        bboxes, texts, scores = extract_text(image, engine=engine)
+        del image
+        yield PDFPageResults(
+            i,
+            (bboxes, texts, scores),
+            parse_ocr_results(bboxes, texts, scores, config),
+        )
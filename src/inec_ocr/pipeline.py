@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""pipeline.py: Contains the parsing pipeline that turns raw OCR results into the document data"""
+
+from typing import Optional, Tuple, Union
+
+from .clustering import cluster_ocr_results
+from .document import get_document_data
+from .ocr import filter_text_predictions
+from .types import (
+    DocumentParserConfig,
+    OCRBBoxesResultType,
+    OCRScoresResultType,
+    OCRTextsResultType,
+    ResultsMap,
+)
+
+DocumentDataType = Tuple[
+    Union[ResultsMap, None],
+    Union[ResultsMap, None],
+    Union[str, None],
+    Union[ResultsMap, None],
+]
+
+
+def parse_ocr_results(
+    bboxes: OCRBBoxesResultType,
+    texts: OCRTextsResultType,
+    scores: OCRScoresResultType,
+    config: Optional[DocumentParserConfig] = None,
+) -> DocumentDataType:
+    """Re-runs the parsing stages (filtering, clustering and document parsing) on raw OCR results.
+
+    This is everything the OCR endpoint does after the OCR engine, so it can be used to
+    re-tune the parser's thresholds against archived raw OCR results without re-running OCR.
+
+    Args:
+        bboxes (OCRBBoxesResultType): The bounding boxes associated with the extracted texts
+        texts (OCRTextsResultType): The extracted texts
+        scores (OCRScoresResultType): The confidence scores associated with the extracted texts
+        config (Optional[DocumentParserConfig]): The parser's thresholds and tolerances, defaults to `DocumentParserConfig()`
+
+    Returns:
+        tuple: A tuple containing
+        - ResultsMap: Political parties vote results
+        - ResultsMap: Polling unit data results
+        - str: Election type
+        - ResultsMap: Polling unit registration info results
+    """
+    if config is None:
+        config = DocumentParserConfig()
+
+    filtered_bboxes, filtered_texts = filter_text_predictions(
+        bboxes, texts, scores, config.conf_thresh
+    )
+
+    # The clustering needs at least two boxes
+    if len(filtered_bboxes) < 2:
+        return (None, None, None, None)
+
+    final_cols = cluster_ocr_results(
+        filtered_bboxes, filtered_texts, config.distance_threshold
+    )
+    return get_document_data(final_cols, config)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""preview.py: Contains the fast, detection-only, layout preview of a photo"""
+
+import time
+from typing import List, NamedTuple, Optional, Union
+
+import cv2
+import numpy as np
+
+from .document import find_document_contour
+from .engine import OCREngine, load_image
+from .ocr import get_ocr_engine
+from .quality import QualityReport, QualityThresholds, assess_image_quality
+
+
+class LayoutPreview(NamedTuple):
+    width: int
+    height: int
+    boxes: List[List[List[int]]]
+    page_quad: Union[List[List[int]], None]
+    quality: QualityReport
+    duration_ms: float
+
+
+def preview_layout(
+    img: Union[str, np.ndarray],
+    engine: Optional[OCREngine] = None,
+    max_side: Optional[int] = 960,
+    thresholds: Optional[QualityThresholds] = None,
+) -> LayoutPreview:
+    """Previews the layout of a photo by running the text detector only, at a low resolution.
+
+    This lets a client confirm the framing of a photo before paying for the full OCR
+    pipeline: the text boxes, the page's four corners and the quality report are
+    computed in a fraction of the pipeline's time.
+
+    Args:
+        img (Union[str, np.ndarray]): The path to the image file or an already decoded image
+        engine (Optional[OCREngine]): The OCR engine, defaults to the PaddleOCR engine
+        max_side (Optional[int]): The length of the longer side of the downscaled copy the detector runs on
+        thresholds (Optional[QualityThresholds]): The thresholds of the quality checks
+
+    Returns:
+        LayoutPreview: The text boxes and page quad (in the image's coordinates), and the quality report
+    """
+    start = time.perf_counter()
+    if engine is None:
+        engine = get_ocr_engine()
+
+    image = load_image(img)
+    h, w = image.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    small = cv2.resize(
+        image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+    )
+
+    quality = assess_image_quality(image, thresholds)
+    boxes = np.asarray(engine.detect(small), dtype="float32").reshape(-1, 4, 2)
+    page_quad = find_document_contour(small)
+
+    return LayoutPreview(
+        w,
+        h,
+        (boxes / scale).round().astype(int).tolist(),
+        (page_quad / scale).round().astype(int).tolist()
+        if page_quad is not None
+        else None,
+        quality,
+        (time.perf_counter() - start) * 1000,
+    )
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+"""quality.py: Contains the fast image quality gate that runs before the OCR"""
+
+import argparse
+import json
+import time
+from typing import List, NamedTuple, Optional, Union
+
+import cv2
+import numpy as np
+
+from .common import get_corpus_images
+from .document import find_document_contour
+from .engine import load_image
+
+
+class QualityThresholds(NamedTuple):
+    """The thresholds of the image quality gate."""
+
+    # Minimum variance of the Laplacian (sharpness) of the image, at the analysis size
+    min_blur_variance: float = 60.0
+    # Maximum fraction of the sheet's pixels that are glare, i.e. saturated and brighter
+    # than the sheet's paper
+    max_glare_ratio: float = 0.25
+    # Maximum fraction of very dark pixels
+    max_dark_ratio: float = 0.5
+    # Minimum standard deviation of the gray levels
+    min_contrast: float = 25.0
+    # Minimum length of the shorter side of the image, in pixels (the smallest readable
+    # photos of the test corpus are 519x720)
+    min_side: int = 480
+    # Minimum fraction of the image covered by the sheet, when its edges are found
+    min_coverage: float = 0.25
+
+
+class QualityReport(NamedTuple):
+    passed: bool
+    reasons: List[str]
+    warnings: List[str]
+    blur_variance: float
+    glare_ratio: float
+    dark_ratio: float
+    contrast: float
+    coverage: Union[float, None]
+    width: int
+    height: int
+    score: float
+    duration_ms: float
+
+
+def get_quality_score(
+    blur_variance: float,
+    glare_ratio: float,
+    dark_ratio: float,
+    contrast: float,
+    coverage: Union[float, None],
+    min_side: int,
+    thresholds: QualityThresholds,
+) -> float:
+    """Returns a quality score between 0 and 1, the score of the weakest measure.
+
+    Each measure is scored on a scale where its threshold scores 0.5, so a photo that
+    passes every check scores at least 0.5.
+    """
+
+    def at_least(value: float, threshold: float) -> float:
+        return min(1.0, 0.5 * value / threshold) if threshold else 1.0
+
+    def at_most(value: float, threshold: float) -> float:
+        return max(0.0, 1.0 - 0.5 * value / threshold) if threshold else 1.0
+
+    scores = [
+        at_least(blur_variance, thresholds.min_blur_variance),
+        at_most(glare_ratio, thresholds.max_glare_ratio),
+        at_most(dark_ratio, thresholds.max_dark_ratio),
+        at_least(contrast, thresholds.min_contrast),
+        at_least(min_side, thresholds.min_side),
+    ]
+    if coverage is not None:
+        scores.append(at_least(coverage, thresholds.min_coverage))
+    return min(scores)
+
+
+# The gray level from which a pixel is saturated, and the margin by which a saturated
+# pixel must be brighter than the sheet's paper to be glare
+SATURATION_LEVEL = 250
+GLARE_MARGIN = 15
+# The percentile of the paper's gray levels that is the paper level: the glare may cover
+# up to three quarters of the paper without raising it
+PAPER_PERCENTILE = 25
+
+
+def get_paper_level(sheet: np.ndarray) -> float:
+    """Returns the gray level of the sheet's paper, robust to the glare.
+
+    The ink is separated from the paper by an Otsu threshold of the unsaturated pixels,
+    so that the glare does not skew it, and the paper level is a low percentile of the
+    paper's pixels (glare included).
+
+    Args:
+        sheet (np.ndarray): The gray levels of the sheet's pixels
+
+    Returns:
+        float: The paper level
+    """
+    unsaturated = sheet[sheet < SATURATION_LEVEL]
+    if unsaturated.size:
+        ink_level, _ = cv2.threshold(
+            unsaturated.reshape(-1, 1), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+        )
+        sheet = sheet[sheet > ink_level]
+    return float(np.percentile(sheet, PAPER_PERCENTILE))
+
+
+def get_glare_ratio(gray: np.ndarray, points: Union[np.ndarray, None]) -> float:
+    """Returns the fraction of the sheet's pixels that are glare.
+
+    Only the pixels inside the sheet's contour (the whole image when it is not found)
+    are measured, so a bright background around the sheet is not glare. A saturated
+    pixel is glare when it is brighter than the sheet's paper (see `get_paper_level`) by
+    `GLARE_MARGIN`, or is clipped (255) when the paper is brighter than that. The paper
+    of a scan, or of a well-exposed photo, is itself saturated, and loses no text.
+
+    Args:
+        gray (np.ndarray): The grayscale image
+        points (np.ndarray): The four corners of the sheet, or None if it was not found
+
+    Returns:
+        float: The glare ratio
+    """
+    if points is not None:
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        cv2.fillPoly(mask, [points.reshape(-1, 2).astype(np.int32)], 1)
+        sheet = gray[mask.astype(bool)]
+    else:
+        sheet = gray.ravel()
+    if not sheet.size:
+        return 0.0
+
+    paper = get_paper_level(sheet)
+    if paper >= SATURATION_LEVEL:
+        return 0.0
+    glare_level = min(max(SATURATION_LEVEL, paper + GLARE_MARGIN), 255)
+    return float(np.count_nonzero(sheet >= glare_level)) / sheet.size
+
+
+def assess_image_quality(
+    image: np.ndarray,
+    thresholds: Optional[QualityThresholds] = None,
+    analysis_side: Optional[int] = 1024,
+) -> QualityReport:
+    """Checks whether a photo of a result sheet is readable enough to be worth an OCR pass.
+
+    The checks run on a grayscale copy downscaled to `analysis_side` (so that the blur
+    variance does not depend on the image's resolution), and take a few milliseconds:
+    - the sharpness, as the variance of the Laplacian
+    - the exposure, as the fraction of the sheet's glare pixels (see `get_glare_ratio`)
+      and the fraction of very dark pixels
+    - the contrast, as the standard deviation of the gray levels
+    - the resolution, as the length of the shorter side of the original image
+    - the coverage, as the fraction of the image covered by the sheet's contour
+
+    The sheet's contour is not found when the sheet fills the frame, so a missing contour
+    only adds a warning.
+
+    Args:
+        image (np.ndarray): The input image
+        thresholds (Optional[QualityThresholds]): The thresholds, defaults to `QualityThresholds()`
+        analysis_side (Optional[int]): The length of the longer side of the analyzed copy
+
+    Returns:
+        QualityReport: The measures, their score (see `get_quality_score`), and the reasons the image failed the gate (if any)
+    """
+    start = time.perf_counter()
+    if thresholds is None:
+        thresholds = QualityThresholds()
+
+    h, w = image.shape[:2]
+    scale = min(1.0, analysis_side / max(h, w))
+    small = cv2.resize(
+        image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+    )
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    blur_variance = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    dark_ratio = float(np.count_nonzero(gray <= 30)) / gray.size
+    contrast = float(gray.std())
+
+    points = find_document_contour(small, min_area_ratio=0.05)
+    glare_ratio = get_glare_ratio(gray, points)
+    coverage = (
+        float(cv2.contourArea(points)) / (gray.shape[0] * gray.shape[1])
+        if points is not None
+        else None
+    )
+
+    reasons, warnings = [], []
+    if blur_variance < thresholds.min_blur_variance:
+        reasons.append(f"The photo is blurry (sharpness {blur_variance:.0f})")
+    if glare_ratio > thresholds.max_glare_ratio:
+        reasons.append(f"The photo has glare ({glare_ratio:.0%} of the sheet)")
+    if dark_ratio > thresholds.max_dark_ratio:
+        reasons.append(f"The photo is underexposed ({dark_ratio:.0%} dark pixels)")
+    if contrast < thresholds.min_contrast:
+        reasons.append(f"The photo has a low contrast ({contrast:.0f})")
+    if min(h, w) < thresholds.min_side:
+        reasons.append(f"The resolution is too low ({w}x{h})")
+    if coverage is None:
+        warnings.append("The edges of the result sheet were not found")
+    elif coverage < thresholds.min_coverage:
+        reasons.append(f"The result sheet only covers {coverage:.0%} of the photo")
+
+    score = get_quality_score(
+        blur_variance,
+        glare_ratio,
+        dark_ratio,
+        contrast,
+        coverage,
+        min(h, w),
+        thresholds,
+    )
+    return QualityReport(
+        not reasons,
+        reasons,
+        warnings,
+        blur_variance,
+        glare_ratio,
+        dark_ratio,
+        contrast,
+        coverage,
+        w,
+        h,
+        score,
+        (time.perf_counter() - start) * 1000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the image quality gate against the fail/success test images"
+    )
+    parser.add_argument("--corpus", default="./test-images")
+    parser.add_argument("--report", help="Write the per-image reports to this file")
+    args = parser.parse_args()
+
+    reports = {}
+    for path in get_corpus_images(args.corpus):
+        report = assess_image_quality(load_image(str(path)))
+        reports[str(path)] = report._asdict()
+        print(
+            f"{path}: {'pass' if report.passed else 'reject'} "
+            f"({report.duration_ms:.1f}ms) {'; '.join(report.reasons)}"
+        )
+
+    # The images are labelled by their directory
+    success = [r for p, r in reports.items() if "/success/" in p]
+    fail = [r for p, r in reports.items() if "/fail/" in p]
+    durations = [r["duration_ms"] for r in reports.values()]
+    summary = {
+        "success_passed": f"{sum(r['passed'] for r in success)}/{len(success)}",
+        "fail_rejected": f"{sum(not r['passed'] for r in fail)}/{len(fail)}",
+        "mean_duration_ms": float(np.mean(durations)) if durations else None,
+        "max_duration_ms": max(durations, default=None),
+    }
+    print(json.dumps(summary, indent=2))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"summary": summary, "reports": reports}, f, indent=2)
+
+    # Rejecting a readable sheet is the costly mistake
+    if any(not r["passed"] for r in success):
+        raise SystemExit("The quality gate rejects readable sheets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+"""quantization.py: Contains the INT8 quantization of the ONNX models and its accuracy gate"""
+
+import argparse
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+from .common import compute_votes_accuracy, count_scored_votes, get_corpus_images
+from .engine import load_image
+from .onnx_engine import (
+    ONNX_DET_MODEL_PATH,
+    ONNX_REC_MODEL_PATH,
+    ONNXRuntimeEngine,
+)
+from .pipeline import parse_ocr_results
+from .types import ResultsMap
+
+# Paths to the INT8-quantized detection and recognition models
+QUANTIZED_DET_MODEL_PATH = "./models/onnx/det/en_PP-OCRv3_det.int8.onnx"
+QUANTIZED_REC_MODEL_PATH = "./models/onnx/rec/en_PP-OCRv3_rec.int8.onnx"
+
+# Path to the report written by the accuracy gate
+QUANTIZATION_REPORT_PATH = "./models/onnx/quantization_report.json"
+
+# The minimum number of reference party vote counts the accuracy gate must score, an
+# accuracy over fewer votes (none, if the reference parses failed) is meaningless
+QUANTIZATION_MIN_SCORED_VOTES = 20
+
+
+class QuantizationGateError(RuntimeError):
+    """Raised when the quantized models have not passed the accuracy gate."""
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    """Returns the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCalibrationDataReader:
+    """Feeds the preprocessed corpus images to the static quantization calibrator."""
+
+    def __init__(self, image_paths: List[Path], engine: ONNXRuntimeEngine):
+        self.image_paths = image_paths
+        self.engine = engine
+        self.input_name = engine.det_session.get_inputs()[0].name
+        self._iter: Optional[Iterator[Dict[str, np.ndarray]]] = None
+
+    def _inputs(self) -> Iterator[Dict[str, np.ndarray]]:
+        for path in self.image_paths:
+            img = load_image(str(path))
+            yield {self.input_name: self.engine.preprocess_det_image(img)}
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._iter is None:
+            self._iter = self._inputs()
+        return next(self._iter, None)
+
+    def rewind(self) -> None:
+        self._iter = None
+
+
+def quantize_models(image_paths: List[Path]) -> None:
+    """Quantizes the detection and recognition models to INT8.
+
+    The detection model is a convolutional network, so it is statically quantized (QDQ,
+    per-channel weights) with the activation ranges calibrated on the corpus images. The
+    recognition model is dominated by MatMul/LSTM ops and variable-width inputs, so it is
+    dynamically quantized.
+
+    Args:
+        image_paths (List[Path]): The calibration images
+    """
+    # The quantization tooling is only needed offline
+    from onnxruntime.quantization import (
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    engine = ONNXRuntimeEngine(use_angle_cls=False)
+    quantize_static(
+        ONNX_DET_MODEL_PATH,
+        QUANTIZED_DET_MODEL_PATH,
+        DetectionCalibrationDataReader(image_paths, engine),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    quantize_dynamic(
+        ONNX_REC_MODEL_PATH, QUANTIZED_REC_MODEL_PATH, weight_type=QuantType.QInt8
+    )
+
+
+def get_political_parties_results(
+    engine: ONNXRuntimeEngine, image_path: Path
+) -> Union[ResultsMap, None]:
+    """Runs the full pipeline on an image and returns the political parties vote results."""
+    bboxes, texts, scores = engine.ocr(str(image_path))
+    return parse_ocr_results(bboxes, texts, scores)[0]
+
+
+def validate_quantized_models(
+    image_paths: List[Path],
+    min_accuracy: float,
+    ground_truth: Optional[Dict[str, ResultsMap]] = None,
+    min_scored_votes: Optional[int] = QUANTIZATION_MIN_SCORED_VOTES,
+) -> Dict:
+    """Validates the quantized models against the corpus and writes the gate report.
+
+    The party vote results extracted with the quantized models are compared against the
+    ground truth when provided, otherwise against the results extracted with the FP32
+    models. The gate fails if fewer than `min_scored_votes` reference vote counts were
+    compared. The report records the digests of the quantized models, so re-quantized
+    models have to pass the gate again before they can be enabled.
+
+    Args:
+        image_paths (List[Path]): The validation images
+        min_accuracy (float): The minimum party vote extraction accuracy
+        ground_truth (Optional[dict]): Map of the image names to their party vote results
+        min_scored_votes (Optional[int]): The minimum number of compared reference vote counts
+
+    Returns:
+        dict: The gate report
+    """
+    fp32_engine = ONNXRuntimeEngine()
+    int8_engine = ONNXRuntimeEngine(
+        det_model_path=QUANTIZED_DET_MODEL_PATH, rec_model_path=QUANTIZED_REC_MODEL_PATH
+    )
+
+    reference = ground_truth
+    if reference is None:
+        reference = {
+            p.name: get_political_parties_results(fp32_engine, p) for p in image_paths
+        }
+    candidate = {
+        p.name: get_political_parties_results(int8_engine, p) for p in image_paths
+    }
+
+    accuracy = compute_votes_accuracy(reference, candidate)
+    scored_votes = count_scored_votes(reference)
+    report = {
+        "accuracy": accuracy,
+        "min_accuracy": min_accuracy,
+        "scored_votes": scored_votes,
+        "min_scored_votes": min_scored_votes,
+        "passed": accuracy >= min_accuracy and scored_votes >= min_scored_votes,
+        "reference": "ground_truth" if ground_truth is not None else "fp32",
+        "num_images": len(image_paths),
+        "det_model_sha256": file_sha256(QUANTIZED_DET_MODEL_PATH),
+        "rec_model_sha256": file_sha256(QUANTIZED_REC_MODEL_PATH),
+    }
+    with open(QUANTIZATION_REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+
+    return report
+
+
+def check_quantization_gate(
+    min_accuracy: float, min_scored_votes: Optional[int] = QUANTIZATION_MIN_SCORED_VOTES
+) -> None:
+    """Verifies that the quantized models have passed the accuracy gate.
+
+    Args:
+        min_accuracy (float): The minimum party vote extraction accuracy
+        min_scored_votes (Optional[int]): The minimum number of reference vote counts the accuracy was measured on
+
+    Raises:
+        QuantizationGateError: If the gate report is missing, failed, below the minimum
+        accuracy or number of scored votes, or was produced for different model files
+    """
+    report_path = Path(QUANTIZATION_REPORT_PATH)
+    if not report_path.exists():
+        raise QuantizationGateError(
+            "The quantized models have not been validated, run `make quantize-models`"
+        )
+    with report_path.open() as f:
+        report = json.load(f)
+
+    if not report["passed"] or report["accuracy"] < min_accuracy:
+        raise QuantizationGateError(
+            "The quantized models failed the accuracy gate: "
+            f"accuracy={report['accuracy']:.4f}, min_accuracy={min_accuracy:.4f}"
+        )
+    # The reports written before the number of scored votes was recorded are rejected
+    scored_votes = report.get("scored_votes", 0)
+    if scored_votes < min_scored_votes:
+        raise QuantizationGateError(
+            "The accuracy gate compared too few party vote counts: "
+            f"scored_votes={scored_votes}, min_scored_votes={min_scored_votes}, "
+            "run `make quantize-models` on a larger corpus"
+        )
+
+    det_sha256 = file_sha256(QUANTIZED_DET_MODEL_PATH)
+    rec_sha256 = file_sha256(QUANTIZED_REC_MODEL_PATH)
+    if (
+        report["det_model_sha256"] != det_sha256
+        or report["rec_model_sha256"] != rec_sha256
+    ):
+        raise QuantizationGateError(
+            "The quantized models changed since they were validated, "
+            "run `make quantize-models`"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Quantize the OCR models to INT8 and validate them against the corpus"
+    )
+    parser.add_argument("--corpus", default="./test-images")
+    parser.add_argument("--min-accuracy", type=float, default=0.98)
+    parser.add_argument(
+        "--min-scored-votes", type=int, default=QUANTIZATION_MIN_SCORED_VOTES
+    )
+    parser.add_argument(
+        "--ground-truth",
+        help="JSON file mapping the image names to their party vote results",
+    )
+    parser.add_argument(
+        "--skip-quantize",
+        action="store_true",
+        help="Only validate the existing quantized models",
+    )
+    args = parser.parse_args()
+
+    image_paths = get_corpus_images(args.corpus)
+    ground_truth = None
+    if args.ground_truth:
+        with open(args.ground_truth) as f:
+            ground_truth = json.load(f)
+
+    if not args.skip_quantize:
+        quantize_models(image_paths)
+    report = validate_quantized_models(
+        image_paths, args.min_accuracy, ground_truth, args.min_scored_votes
+    )
+    print(json.dumps(report, indent=2))
+
+    if not report["passed"]:
+        raise SystemExit("The quantized models failed the accuracy gate")
+
+
+if __name__ == "__main__":
+    main()
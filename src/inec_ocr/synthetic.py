@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+
+"""synthetic.py: Contains the generator of synthetic EC8A result sheets, for the scale and stress benchmarks"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .clustering import cluster_ocr_results
+from .common import compute_votes_accuracy
+from .constants import (
+    ELECTION_TYPES,
+    POLITICAL_PARTIES,
+    POLLING_UNIT_DATA_FIELDS,
+    POLLING_UNIT_REGISTRATION_INFO_FIELDS,
+    STATES,
+)
+from .document import get_document_data
+from .grid import grid_ocr_results
+from .ocr import filter_text_predictions
+from .types import BoundingBox, OCRResultType, ResultsMap
+
+# The geometry of a sheet at scale 1, in pixels. The columns are laid out so that the
+# parser's default tolerances match the fields to their values, and the party names to
+# their votes
+PAGE_WIDTH = 1200
+TEXT_HEIGHT = 20
+CHAR_WIDTH = 12
+ROW_PITCH = 40
+FIELDS_X = 80
+REG_INFO_FIELDS_WIDTH = 260
+PU_DATA_FIELDS_WIDTH = 560
+FIELD_VALUE_GAP = 40
+# The rulings of the party results table (left border, party | votes | votes in words
+# separators, right border), the texts start 8 pixels right of their cell's ruling
+TABLE_RULINGS_X = [120, 182, 330, 1120]
+CELL_PADDING = 8
+# The columns of the filler texts, below the table
+FILLER_COLUMNS_X = [460, 760, 960]
+FILLER_TEXTS = [
+    "AGENT",
+    "SIGNATURE",
+    "STAMP",
+    "REMARKS",
+    "DATE",
+    "TIME",
+    "PRESIDING OFFICER",
+    "N/A",
+]
+
+# The votes in words are spelled digit by digit
+DIGIT_WORDS = [
+    "ZERO",
+    "ONE",
+    "TWO",
+    "THREE",
+    "FOUR",
+    "FIVE",
+    "SIX",
+    "SEVEN",
+    "EIGHT",
+    "NINE",
+]
+
+# The characters the recognizer confuses, the text noise swaps them
+OCR_CONFUSIONS = {"0": "O", "O": "0", "1": "I", "I": "1", "5": "S", "S": "5", "8": "B"}
+
+# The longest side of the rendered images, OpenCV's geometric transforms are limited
+# to 16-bit coordinates
+MAX_RENDER_SIDE = 32767
+
+# An upright text box (x1, y1, x2, y2) and a ruling line segment, at scale 1
+TextBox = Tuple[str, BoundingBox]
+Ruling = Tuple[int, int, int, int]
+
+
+class SyntheticSheet(NamedTuple):
+    pol_parties_results: ResultsMap
+    pu_data_results: ResultsMap
+    election_type: str
+    pu_reg_info_results: ResultsMap
+    raw_ocr_results: OCRResultType
+    image: Union[np.ndarray, None]
+
+
+def generate_sheet_results(
+    rng: np.random.Generator, max_votes: Optional[int] = 300
+) -> Tuple[ResultsMap, ResultsMap, str, ResultsMap]:
+    """Draws the results of a polling unit, with consistent totals.
+
+    Args:
+        rng (np.random.Generator): The random generator
+        max_votes (Optional[int]): The maximum vote count of a party
+
+    Returns:
+        tuple: The party vote results, PU data results, election type and PU registration info results
+    """
+    # Most parties get no votes at a polling unit
+    votes = {
+        party: int(rng.integers(1, max_votes + 1)) if rng.random() < 0.5 else 0
+        for party in POLITICAL_PARTIES
+    }
+
+    valid = sum(votes.values())
+    rejected = int(rng.integers(0, 21))
+    spoiled = int(rng.integers(0, 11))
+    used = spoiled + rejected + valid
+    accredited = used + int(rng.integers(0, 6))
+    unused = int(rng.integers(0, 201))
+    pu_data = dict(
+        zip(
+            POLLING_UNIT_DATA_FIELDS,
+            [
+                accredited + int(rng.integers(0, 1001)),
+                accredited,
+                used + unused,
+                unused,
+                spoiled,
+                rejected,
+                valid,
+                used,
+            ],
+        )
+    )
+
+    pu_reg_info = dict(
+        zip(
+            POLLING_UNIT_REGISTRATION_INFO_FIELDS,
+            [
+                str(rng.choice(STATES)),
+                f"LGA {rng.integers(1, 30):02d}",
+                f"WARD {rng.integers(1, 20):02d}",
+                f"PU {rng.integers(1, 200):03d}",
+            ],
+        )
+    )
+
+    return votes, pu_data, str(rng.choice(ELECTION_TYPES)), pu_reg_info
+
+
+def layout_sheet(
+    votes: ResultsMap,
+    pu_data: ResultsMap,
+    election_type: str,
+    pu_reg_info: ResultsMap,
+    extra_boxes: int,
+    rng: np.random.Generator,
+) -> Tuple[List[TextBox], List[Ruling], int]:
+    """Lays out the texts and the table rulings of a sheet, at scale 1.
+
+    The field names are justified to the width of their column, as in the form's
+    printed cells, so that every value starts at the same distance from its field.
+
+    Args:
+        votes (ResultsMap): The party vote results
+        pu_data (ResultsMap): The PU data results
+        election_type (str): The election type
+        pu_reg_info (ResultsMap): The PU registration info results
+        extra_boxes (int): The number of filler texts below the results table
+        rng (np.random.Generator): The random generator
+
+    Returns:
+        tuple: A tuple containing
+        - list: The texts and their upright boxes
+        - list: The ruling line segments
+        - int: The height of the page
+    """
+
+    def text_box(text: str, x: int, y: int, width: Optional[int] = None) -> TextBox:
+        width = width or len(text) * CHAR_WIDTH
+        return (text, BoundingBox(x, y, x + width, y + TEXT_HEIGHT))
+
+    # The election type is aligned with the fields, the clustering drops lone boxes
+    text_offset = (ROW_PITCH - TEXT_HEIGHT) // 2
+    boxes = [text_box(election_type, FIELDS_X, 50)]
+
+    # The PU registration info, then the PU data, as fields and their values
+    y = 110
+    for fields, fields_width in [
+        (pu_reg_info, REG_INFO_FIELDS_WIDTH),
+        (pu_data, PU_DATA_FIELDS_WIDTH),
+    ]:
+        for field, value in fields.items():
+            boxes.append(text_box(field, FIELDS_X, y, fields_width))
+            value_x = FIELDS_X + fields_width + FIELD_VALUE_GAP
+            boxes.append(text_box(str(value), value_x, y))
+            y += ROW_PITCH
+        y += ROW_PITCH // 2
+
+    # The party results table: a row per party, with its votes in figures and in words
+    table_top = y
+    left, party_right, votes_right, right = TABLE_RULINGS_X
+    rulings = []
+    for party, count in votes.items():
+        rulings.append((left, y, right, y))
+        text_y = y + text_offset
+        boxes.append(text_box(party, left + CELL_PADDING, text_y))
+        boxes.append(text_box(str(count), party_right + CELL_PADDING, text_y))
+        words = " ".join(DIGIT_WORDS[int(digit)] for digit in str(count))
+        boxes.append(text_box(words, votes_right + CELL_PADDING, text_y))
+        y += ROW_PITCH
+    rulings.append((left, y, right, y))
+    rulings += [(x, table_top, x, y) for x in TABLE_RULINGS_X]
+
+    # The filler texts, which only add to the number of boxes
+    y += ROW_PITCH
+    for i in range(extra_boxes):
+        column = i % len(FILLER_COLUMNS_X)
+        text = str(rng.choice(FILLER_TEXTS))
+        boxes.append(text_box(text, FILLER_COLUMNS_X[column], y))
+        if column == len(FILLER_COLUMNS_X) - 1:
+            y += ROW_PITCH
+    if extra_boxes % len(FILLER_COLUMNS_X):
+        y += ROW_PITCH
+
+    return boxes, rulings, y + ROW_PITCH
+
+
+def add_text_noise(text: str, rng: np.random.Generator) -> str:
+    """Swaps one of the characters of a text the recognizer would confuse, if any."""
+    idxs = [i for i, char in enumerate(text) if char in OCR_CONFUSIONS]
+    if not idxs:
+        return text
+    i = int(rng.choice(idxs))
+    return text[:i] + OCR_CONFUSIONS[text[i]] + text[i + 1 :]
+
+
+def render_text(page: np.ndarray, text: str, box: BoundingBox) -> None:
+    """Draws a text on a (grayscale) page, stretched to fill its box."""
+    (width, height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+    patch = np.full((height + baseline + 4, width + 4), 255, dtype=np.uint8)
+    cv2.putText(
+        patch, text, (2, height + 2), cv2.FONT_HERSHEY_SIMPLEX, 1, 0, 2, cv2.LINE_AA
+    )
+    x1, y1, x2, y2 = box
+    patch = cv2.resize(patch, (x2 - x1, y2 - y1), interpolation=cv2.INTER_AREA)
+    page[y1:y2, x1:x2] = np.minimum(page[y1:y2, x1:x2], patch)
+
+
+def generate_sheet(
+    seed: Optional[int] = None,
+    scale: Optional[float] = 1.0,
+    skew: Optional[float] = 0.0,
+    noise: Optional[float] = 0.0,
+    extra_boxes: Optional[int] = 0,
+    max_votes: Optional[int] = 300,
+    render: Optional[bool] = False,
+) -> SyntheticSheet:
+    """Generates a synthetic EC8A result sheet, with the real parties and field names and
+    random results, as the raw OCR results of a photo of it (and optionally the photo).
+
+    The raw OCR results are those of a perfect OCR engine, up to the noise, so the
+    clustering and parsing stages can be benchmarked (and load-tested, with the filler
+    boxes) without running the models. The sheet lies on a darker background, rotated by
+    `skew` degrees around its center.
+
+    Args:
+        seed (Optional[int]): The seed of the random generator
+        scale (Optional[float]): The scale of the sheet, 1 is 1200 pixels wide (the parser's tolerances are tuned for this resolution)
+        skew (Optional[float]): The rotation of the sheet, in degrees
+        noise (Optional[float]): The noise level, between 0 and 1: the jitter of the boxes' corners, the rate of the confused characters (with lower confidence scores) and the pixel noise of the image
+        extra_boxes (Optional[int]): The number of filler texts below the results table
+        max_votes (Optional[int]): The maximum vote count of a party
+        render (Optional[bool]): Whether to render the image of the sheet, only the raw OCR results of the sheets with thousands of filler texts can be generated
+
+    Returns:
+        SyntheticSheet: The sheet's results, its raw OCR results and its image (or None)
+    """
+    rng = np.random.default_rng(seed)
+    votes, pu_data, election_type, pu_reg_info = generate_sheet_results(rng, max_votes)
+    text_boxes, rulings, page_height = layout_sheet(
+        votes, pu_data, election_type, pu_reg_info, extra_boxes, rng
+    )
+
+    # Place the page on the background, and rotate it around the background's center
+    page_w, page_h = round(PAGE_WIDTH * scale), round(page_height * scale)
+    margin = round(0.05 * page_w)
+    canvas_w, canvas_h = page_w + 2 * margin, page_h + 2 * margin
+    M = cv2.getRotationMatrix2D((canvas_w / 2, canvas_h / 2), skew, 1.0)
+
+    scaled_boxes = [
+        BoundingBox(*(round(c * scale) for c in box)) for _, box in text_boxes
+    ]
+    corners = np.array(
+        [[[x1, y1], [x2, y1], [x2, y2], [x1, y2]] for x1, y1, x2, y2 in scaled_boxes],
+        dtype="float32",
+    ).reshape(-1, 4, 2)
+    corners = (corners + margin) @ M[:, :2].T + M[:, 2]
+    corners += rng.normal(0, 3 * scale * noise, corners.shape)
+
+    texts, scores = [], []
+    for text, _ in text_boxes:
+        if noise and rng.random() < 0.2 * noise:
+            texts.append(add_text_noise(text, rng))
+            scores.append(float(rng.uniform(0.5, 0.8)))
+        else:
+            texts.append(text)
+            scores.append(float(rng.uniform(0.85, 1.0)))
+
+    image = None
+    if render:
+        if max(canvas_w, canvas_h) >= MAX_RENDER_SIDE:
+            raise ValueError(
+                f"The sheet is too large to be rendered ({canvas_w}x{canvas_h}), "
+                "reduce the extra boxes or the scale"
+            )
+        page = np.full((page_h, page_w), 255, dtype=np.uint8)
+        thickness = max(1, round(2 * scale))
+        for x1, y1, x2, y2 in rulings:
+            cv2.line(
+                page,
+                (round(x1 * scale), round(y1 * scale)),
+                (round(x2 * scale), round(y2 * scale)),
+                0,
+                thickness,
+            )
+        for (text, _), box in zip(text_boxes, scaled_boxes):
+            render_text(page, text, box)
+
+        canvas = np.full((canvas_h, canvas_w), 90, dtype=np.uint8)
+        canvas[margin : margin + page_h, margin : margin + page_w] = page
+        canvas = cv2.warpAffine(canvas, M, (canvas_w, canvas_h), borderValue=90)
+        if noise:
+            pixel_noise = rng.normal(0, 20 * noise, canvas.shape)
+            canvas = np.clip(canvas + pixel_noise, 0, 255).astype(np.uint8)
+        image = cv2.cvtColor(canvas, cv2.COLOR_GRAY2BGR)
+
+    return SyntheticSheet(
+        votes,
+        pu_data,
+        election_type,
+        pu_reg_info,
+        OCRResultType(corners.tolist(), texts, scores),
+        image,
+    )
+
+
+def benchmark_parsing(
+    num_sheets: int,
+    extra_boxes: int,
+    layout: Optional[str] = "clustering",
+    seed: Optional[int] = 0,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Times the layout (clustering) and parsing stages on synthetic sheets, and
+    measures their party vote extraction accuracy.
+
+    Args:
+        num_sheets (int): The number of sheets
+        extra_boxes (int): The number of filler texts of each sheet
+        layout (Optional[str]): The layout engine, "clustering" or "grid" (which renders the sheets)
+        seed (Optional[int]): The seed of the first sheet, the next sheets use the next seeds
+        kwargs: The other `generate_sheet` arguments
+
+    Returns:
+        dict: The mean number of boxes and stage latencies (in seconds), and the accuracy
+    """
+    num_boxes, layout_latencies, parse_latencies = [], [], []
+    reference, candidate = {}, {}
+    for i in range(num_sheets):
+        sheet = generate_sheet(
+            seed + i, extra_boxes=extra_boxes, render=layout == "grid", **kwargs
+        )
+        bboxes, texts = filter_text_predictions(*sheet.raw_ocr_results)
+        num_boxes.append(len(bboxes))
+
+        start = time.perf_counter()
+        if layout == "grid":
+            all_cols = grid_ocr_results(sheet.image, bboxes, texts)
+        else:
+            all_cols = cluster_ocr_results(bboxes, texts)
+        layout_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        candidate[i] = get_document_data(all_cols)[0]
+        parse_latencies.append(time.perf_counter() - start)
+        reference[i] = sheet.pol_parties_results
+
+    return {
+        "mean_num_boxes": float(np.mean(num_boxes)),
+        "mean_layout_s": float(np.mean(layout_latencies)),
+        "p95_layout_s": float(np.percentile(layout_latencies, 95)),
+        "mean_parse_s": float(np.mean(parse_latencies)),
+        "accuracy": compute_votes_accuracy(reference, candidate),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic EC8A result sheets, or benchmark the parsing "
+        "stages on them"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser(
+        "generate", help="Write the raw OCR results (and images) of synthetic sheets"
+    )
+    generate_parser.add_argument("--output", required=True)
+    generate_parser.add_argument("--render", action="store_true")
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Time the layout and parsing stages as the boxes grow"
+    )
+    benchmark_parser.add_argument(
+        "--extra-boxes", type=int, nargs="+", default=[0, 1000, 5000]
+    )
+    benchmark_parser.add_argument(
+        "--layout", default="clustering", choices=["clustering", "grid"]
+    )
+    benchmark_parser.add_argument("--report", help="Write the report to this file")
+
+    for subparser in (generate_parser, benchmark_parser):
+        subparser.add_argument("--num-sheets", type=int, default=10)
+        subparser.add_argument("--seed", type=int, default=0)
+        subparser.add_argument("--scale", type=float, default=1.0)
+        subparser.add_argument("--skew", type=float, default=0.0)
+        subparser.add_argument("--noise", type=float, default=0.0)
+    generate_parser.add_argument("--extra-boxes", type=int, default=0)
+    args = parser.parse_args()
+
+    params = dict(scale=args.scale, skew=args.skew, noise=args.noise)
+    if args.command == "benchmark":
+        report = {
+            "layout": args.layout,
+            "num_sheets": args.num_sheets,
+            **params,
+            "runs": {
+                extra_boxes: benchmark_parsing(
+                    args.num_sheets, extra_boxes, args.layout, args.seed, **params
+                )
+                for extra_boxes in args.extra_boxes
+            },
+        }
+        print(json.dumps(report, indent=2))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    # The raw OCR results are readable by the equivalence harness, and the ground truth
+    # by the presets benchmark (keyed by the image names)
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ground_truth = {}
+    for i in range(args.num_sheets):
+        name = f"synthetic-{args.seed + i:05d}"
+        sheet = generate_sheet(
+            args.seed + i, extra_boxes=args.extra_boxes, render=args.render, **params
+        )
+        with open(output_dir / f"{name}.json", "w") as f:
+            json.dump(sheet.raw_ocr_results._asdict(), f)
+        if sheet.image is not None:
+            cv2.imwrite(str(output_dir / f"{name}.png"), sheet.image)
+        sample = f"{name}.png" if args.render else f"{name}.json"
+        ground_truth[sample] = sheet.pol_parties_results
+
+    with open(output_dir / "ground-truth.json", "w") as f:
+        json.dump(ground_truth, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""tiling.py: Contains the tiled text detection for high-resolution scans"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# A tile's (x0, y0, x1, y1) pixel extent in the image
+TileType = Tuple[int, int, int, int]
+
+
+def get_tiles(height: int, width: int, tile_size: int, overlap: int) -> List[TileType]:
+    """Splits an image into overlapping tiles covering it entirely.
+
+    The tiles are evenly spaced, so that the last row and column of tiles end on the
+    image's border, and neighbouring tiles overlap by at least `overlap` pixels.
+
+    Args:
+        height (int): The height of the image
+        width (int): The width of the image
+        tile_size (int): The side of the (square) tiles
+        overlap (int): The minimum overlap of the neighbouring tiles
+
+    Returns:
+        list: The tiles, in row-major order
+    """
+
+    def get_starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        num_tiles = int(np.ceil((length - overlap) / (tile_size - overlap)))
+        starts = np.linspace(0, length - tile_size, num_tiles).round()
+        return starts.astype(int).tolist()
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in get_starts(height)
+        for x0 in get_starts(width)
+    ]
+
+
+def get_rects(boxes: np.ndarray) -> np.ndarray:
+    """Returns the (x0, y0, x1, y1) enclosing rectangles of (N, 4, 2) boxes."""
+    return np.concatenate([boxes.min(axis=1), boxes.max(axis=1)], axis=1)
+
+
+def intersect_rects(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Returns the intersections of (broadcast) (..., 4) rectangles, empty if inverted."""
+    return np.concatenate(
+        [np.maximum(a[..., :2], b[..., :2]), np.minimum(a[..., 2:], b[..., 2:])],
+        axis=-1,
+    )
+
+
+def merge_tile_boxes(
+    boxes: np.ndarray,
+    tile_idxs: np.ndarray,
+    tiles: List[TileType],
+    overlap_threshold: Optional[float] = 0.5,
+) -> np.ndarray:
+    """Merges the text boxes detected more than once, or in pieces, by neighbouring tiles.
+
+    A text crossing a tile seam is detected whole by one tile and truncated by the
+    other, or (when it is wider than the overlap) in two overlapping pieces. Only the
+    boxes of two different tiles that both reach into the overlap band of their tiles
+    (the intersection of the tiles) are candidates, so the boxes detected by a single
+    tile, and the boxes away from the seams, are kept as detected however close they
+    are. Two candidates are merged into their enclosing rectangle when they intersect
+    and their vertical overlap is at least `overlap_threshold` of the height of the
+    shorter box, and the merges are transitive (a text crossing several seams).
+
+    Args:
+        boxes (np.ndarray): The text boxes of all the tiles, in image coordinates, with shape (N, 4, 2)
+        tile_idxs (np.ndarray): The index in `tiles` of the tile each box was detected on, with shape (N,)
+        tiles (List[TileType]): The tiles
+        overlap_threshold (Optional[float]): The vertical overlap (relative to the shorter box) above which two intersecting boxes are merged
+
+    Returns:
+        np.ndarray: The merged text boxes, with shape (M, 4, 2)
+    """
+    boxes = boxes.reshape(-1, 4, 2).astype("float32")
+    tile_idxs = np.asarray(tile_idxs)
+    rects = get_rects(boxes)
+    tile_rects = np.asarray(tiles, dtype="float32").reshape(-1, 4)
+
+    # The boxes that reach into another tile, i.e. into an overlap band
+    inters = intersect_rects(rects[:, None], tile_rects[None])
+    reaches = (inters[..., 2] > inters[..., 0]) & (inters[..., 3] > inters[..., 1])
+    reaches[np.arange(len(boxes)), tile_idxs] = False
+    candidates = np.flatnonzero(reaches.any(axis=1))
+
+    parents = np.arange(len(boxes))
+
+    def find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for k, i in enumerate(candidates):
+        others = candidates[k + 1 :]
+        others = others[tile_idxs[others] != tile_idxs[i]]
+        if not len(others):
+            continue
+
+        # The overlap band of the two boxes' tiles, both boxes must reach into it
+        bands = intersect_rects(tile_rects[tile_idxs[i]], tile_rects[tile_idxs[others]])
+        in_band = np.ones(len(others), dtype=bool)
+        for rect in (rects[i], rects[others]):
+            inter = intersect_rects(rect, bands)
+            in_band &= (inter[:, 2] > inter[:, 0]) & (inter[:, 3] > inter[:, 1])
+
+        inter = intersect_rects(rects[i], rects[others])
+        min_h = np.minimum(
+            rects[i, 3] - rects[i, 1], rects[others, 3] - rects[others, 1]
+        )
+        duplicates = (
+            in_band
+            & (inter[:, 2] > inter[:, 0])
+            & (inter[:, 3] - inter[:, 1] >= overlap_threshold * min_h)
+        )
+        for j in others[duplicates]:
+            parents[find(j)] = find(i)
+
+    roots = np.array([find(i) for i in range(len(boxes))], dtype=int)
+    merged_boxes = []
+    for root in np.unique(roots):
+        members = np.flatnonzero(roots == root)
+        if len(members) == 1:
+            merged_boxes.append(boxes[members[0]])
+            continue
+        x0, y0 = rects[members, :2].min(axis=0)
+        x1, y1 = rects[members, 2:].max(axis=0)
+        merged_boxes.append(
+            np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype="float32")
+        )
+
+    return np.array(merged_boxes, dtype="float32").reshape(-1, 4, 2)
+
+
+class TiledDetector:
+    """Detects the text boxes of large images on overlapping tiles, in parallel.
+
+    The detector downscales its input to a fixed side limit, so the small digits of
+    high-resolution scans are lost in a single pass. Images whose longest side exceeds
+    `min_side` are split into tiles of the detector's native size instead, and the boxes
+    of the tiles are mapped back to the image and merged across the tile seams (see
+    `merge_tile_boxes`).
+
+    The tiles are detected concurrently by `max_workers` threads, which requires a
+    detector that is safe to call from several threads at once.
+    """
+
+    def __init__(
+        self,
+        detect: Callable[[np.ndarray], np.ndarray],
+        tile_size: Optional[int] = 960,
+        overlap: Optional[int] = 160,
+        min_side: Optional[int] = 2000,
+        max_workers: Optional[int] = 2,
+        overlap_threshold: Optional[float] = 0.5,
+    ):
+        if overlap >= tile_size:
+            raise ValueError("The tile overlap must be smaller than the tile size")
+
+        self.detect = detect
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_side = min_side
+        self.overlap_threshold = overlap_threshold
+        self._executor = (
+            ThreadPoolExecutor(max_workers, thread_name_prefix="tiled-detection")
+            if max_workers > 1
+            else None
+        )
+
+    def _detect_tile(self, img: np.ndarray, tile: TileType) -> np.ndarray:
+        x0, y0, x1, y1 = tile
+        boxes = np.asarray(self.detect(img[y0:y1, x0:x1]), dtype="float32")
+        boxes = boxes.reshape(-1, 4, 2)
+        boxes[:, :, 0] += x0
+        boxes[:, :, 1] += y0
+        return boxes
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """Returns the detected text boxes of an image, with shape (N, 4, 2)."""
+        height, width = img.shape[:2]
+        if max(height, width) <= self.min_side:
+            return self.detect(img)
+
+        tiles = get_tiles(height, width, self.tile_size, self.overlap)
+        if self._executor is None:
+            tile_boxes = [self._detect_tile(img, tile) for tile in tiles]
+        else:
+            tile_boxes = list(
+                self._executor.map(lambda tile: self._detect_tile(img, tile), tiles)
+            )
+
+        tile_idxs = np.concatenate(
+            [np.full(len(boxes), i) for i, boxes in enumerate(tile_boxes)]
+        )
+        return merge_tile_boxes(
+            np.concatenate(tile_boxes), tile_idxs, tiles, self.overlap_threshold
+        )
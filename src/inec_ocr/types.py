@@ -36,3 +36,53 @@ class ColumnTuple(NamedTuple):
 Column = List[ColumnData]
 AllColumns = List[List[ColumnData]]
 ResultsMap = Dict[str, Union[int, str, float, None]]
+
+
+class DocumentParserConfig(NamedTuple):
+    """The thresholds and tolerances of the OCR results parsing pipeline.
+
+    The defaults are the values the pipeline was tuned with.
+    """
+
+    # Minimum confidence score of the kept OCR results
+    conf_thresh: float = 0.6
+    # Maximum (manhattan) distance between the starting x-coordinates of a column's boxes
+    distance_threshold: float = 30
+    # Minimum number of party names in the political parties column (exclusive)
+    pol_parties_thresh: int = 10
+    # Minimum number of results in the political parties results column
+    pol_parties_results_thresh: int = 3
+    # Minimum number of field names in the PU data/registration info fields columns (exclusive)
+    fields_values_thresh: int = 2
+    # Minimum number of values in the PU data/registration info values columns
+    values_thresh: int = 2
+    # Minimum similarity between an OCR'd and an actual field name
+    fields_similarity_thresh: float = 0.8
+    # Minimum similarity between an OCR'd and an actual election type
+    election_type_similarity_thresh: float = 0.8
+    # `is_near` tolerance between the starting y-coordinates of the boxes on the same row
+    row_tolerance: int = 10
+    # `is_near` tolerance between the starting y-coordinates of a party name and its result
+    pol_parties_row_tolerance: int = 8
+    # `is_near` tolerance between the end of a party name and the start of its result
+    pol_parties_col_tolerance: int = 60
+    # `is_near` tolerance between the end of a PU field name and the start of its value
+    fields_col_tolerance: int = 180
+
+
+class EnginePreset(NamedTuple):
+    """The speed/accuracy parameters of an OCR engine."""
+
+    # Whether the text crops are rotated upright by the angle classifier
+    use_angle_cls: bool = True
+    # Length limit of a side of the detector's input, see `det_limit_type`
+    det_limit_side_len: int = 960
+    # "max": the longest side is downscaled to the limit, "min": the shortest side is
+    # upscaled to the limit
+    det_limit_type: str = "max"
+    # How much the detected text regions are expanded into their boxes
+    det_db_unclip_ratio: float = 1.5
+    # Number of text crops per recognizer forward pass
+    rec_batch_num: int = 6
+    # Whether the Paddle inference runs with MKL-DNN (paddle backend only)
+    enable_mkldnn: bool = False
@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+
+"""validation.py: Contains the digits-only recognition of the numeric cells, the arithmetic consistency checks of the parsed results and the targeted re-recognition of the failing cells"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .common import is_near, is_number
+from .constants import POLLING_UNIT_DATA_FIELDS
+from .document import (
+    get_political_parties_column,
+    get_political_parties_results_column,
+    get_polling_unit_data_fields_column,
+    get_polling_unit_data_values_column,
+)
+from .engine import OCREngine
+from .types import AllColumns, BoundingBox, DocumentParserConfig, ResultsMap
+
+# The PU data field holding the total of the political parties votes
+TOTAL_VALID_VOTES_FIELD = POLLING_UNIT_DATA_FIELDS[6]
+
+# Characters commonly confused with digits by the general recognizer
+DIGIT_CONFUSIONS = str.maketrans(
+    {
+        "O": "0",
+        "o": "0",
+        "D": "0",
+        "Q": "0",
+        "I": "1",
+        "l": "1",
+        "|": "1",
+        "i": "1",
+        "Z": "2",
+        "z": "2",
+        "S": "5",
+        "s": "5",
+        "G": "6",
+        "b": "6",
+        "B": "8",
+        "g": "9",
+    }
+)
+
+# Maps the cell keys (party names or PU data fields) to the bbox of the cell to re-recognize
+CellsMap = Dict[str, BoundingBox]
+
+# Minimum confidence score of a digits-only reading of a numeric cell
+NUMERIC_CELLS_MIN_SCORE = 0.9
+
+
+class ValidationReport(NamedTuple):
+    consistent: bool
+    total_valid_votes: Union[int, None]
+    votes_sum: int
+    corrected: Dict[str, Tuple[Union[int, None], int]]
+    unresolved: List[str]
+    # The readings of the missing cells that were not merged, the votes did not add up
+    unconfirmed: Dict[str, int]
+
+
+def parse_number(text: str) -> Union[int, None]:
+    """Parses an OCR'd number, tolerating separators and letters commonly confused with digits.
+
+    Args:
+        text (str): The OCR'd text
+
+    Returns:
+        int: The parsed number, or None if the text is not a number
+    """
+    text = text.strip().translate(DIGIT_CONFUSIONS)
+    text = text.replace(",", "").replace(" ", "").rstrip(".")
+    return int(float(text)) if is_number(text) else None
+
+
+def is_misread_number(text: str) -> bool:
+    """Checks if an OCR'd text that failed the number check may be a misread number.
+
+    The text must contain a digit, or only characters commonly confused with digits (e.g.
+    "1O" or "O"). The dashes and blank cells, and the words (e.g. "NIL"), are not numbers.
+
+    Args:
+        text (str): The OCR'd text
+
+    Returns:
+        bool: Whether the text may be a misread number
+    """
+    chars = [char for char in text if char.isalnum()]
+    if not chars or is_number(text):
+        return False
+    return any(char.isdigit() for char in chars) or all(
+        ord(char) in DIGIT_CONFUSIONS for char in chars
+    )
+
+
+def _match_value_bbox(
+    bbox: BoundingBox,
+    value_bboxes: List[BoundingBox],
+    row_tolerance: int,
+    col_tolerance: int,
+) -> Union[BoundingBox, None]:
+    for value_bbox in value_bboxes:
+        if is_near(bbox[1], value_bbox[1], row_tolerance) and is_near(
+            bbox[2], value_bbox[0], col_tolerance
+        ):
+            return value_bbox
+    return None
+
+
+def _estimate_value_bbox(
+    bbox: BoundingBox, value_bboxes: List[BoundingBox], col_tolerance: int
+) -> BoundingBox:
+    """Estimates where the (undetected) value cell opposite a name cell is."""
+    if value_bboxes:
+        x1 = int(np.median([b[0] for b in value_bboxes]))
+        x2 = int(np.median([b[2] for b in value_bboxes]))
+    else:
+        x1 = bbox[2] + 5
+        x2 = bbox[2] + col_tolerance
+    return BoundingBox(x1, bbox[1], max(x2, x1 + (bbox[3] - bbox[1])), bbox[3])
+
+
+def get_political_parties_cells(
+    all_cols: AllColumns, config: DocumentParserConfig
+) -> CellsMap:
+    """Returns the bboxes of the political parties vote cells, estimated when undetected.
+
+    Args:
+        all_cols (AllColumns): All the columns extracted from the OCR'd image
+        config (DocumentParserConfig): The parser's thresholds and tolerances
+
+    Returns:
+        dict: A dictionary mapping the political parties names to the bboxes of their vote cells
+    """
+    pol_parties_column = get_political_parties_column(
+        all_cols, config.pol_parties_thresh
+    )
+    if not pol_parties_column:
+        return {}
+
+    results_column = get_political_parties_results_column(
+        all_cols,
+        pol_parties_column,
+        config.pol_parties_results_thresh,
+        config.row_tolerance,
+        config.pol_parties_col_tolerance,
+    )
+    value_bboxes = [cell[1] for cell in results_column[0]] if results_column else []
+
+    cells = {}
+    for name, bbox in pol_parties_column[0]:
+        value_bbox = _match_value_bbox(
+            bbox,
+            value_bboxes,
+            config.pol_parties_row_tolerance,
+            config.pol_parties_col_tolerance,
+        )
+        cells[name] = value_bbox or _estimate_value_bbox(
+            bbox, value_bboxes, config.pol_parties_col_tolerance
+        )
+
+    return cells
+
+
+def get_polling_unit_data_cells(
+    all_cols: AllColumns, config: DocumentParserConfig
+) -> CellsMap:
+    """Returns the bboxes of the polling unit (PU) data value cells, estimated when undetected.
+
+    Args:
+        all_cols (AllColumns): All the columns extracted from the OCR'd image
+        config (DocumentParserConfig): The parser's thresholds and tolerances
+
+    Returns:
+        dict: A dictionary mapping the PU data fields to the bboxes of their value cells
+    """
+    fields_column = get_polling_unit_data_fields_column(
+        all_cols, config.fields_values_thresh, config.fields_similarity_thresh
+    )
+    if not fields_column:
+        return {}
+
+    values_column = get_polling_unit_data_values_column(
+        all_cols,
+        fields_column,
+        config.values_thresh,
+        config.row_tolerance,
+        config.fields_col_tolerance,
+    )
+    value_bboxes = [cell[1] for cell in values_column[0]] if values_column else []
+
+    cells = {}
+    for field, bbox in fields_column[0]:
+        value_bbox = _match_value_bbox(
+            bbox, value_bboxes, config.row_tolerance, config.fields_col_tolerance
+        )
+        cells[field] = value_bbox or _estimate_value_bbox(
+            bbox, value_bboxes, config.fields_col_tolerance
+        )
+
+    return cells
+
+
+def get_total_valid_votes_cell(
+    all_cols: AllColumns, config: DocumentParserConfig
+) -> Union[BoundingBox, None]:
+    """Returns the bbox of the "Total Valid Votes" value cell, estimated when undetected.
+
+    Args:
+        all_cols (AllColumns): All the columns extracted from the OCR'd image
+        config (DocumentParserConfig): The parser's thresholds and tolerances
+
+    Returns:
+        BoundingBox: The bbox of the cell, or None if the field was not found
+    """
+    return get_polling_unit_data_cells(all_cols, config).get(TOTAL_VALID_VOTES_FIELD)
+
+
+def get_cell_crop(
+    image: np.ndarray, bbox: BoundingBox, padding: Optional[int] = 4
+) -> Union[np.ndarray, None]:
+    """Crops a cell out of an image with some padding, the detected box may have clipped a digit.
+
+    Args:
+        image (np.ndarray): The input image
+        bbox (BoundingBox): The bbox of the cell
+        padding (Optional[int]): The padding added around the bbox
+
+    Returns:
+        np.ndarray: The crop of the cell, or None if the cell is outside the image
+    """
+    h, w = image.shape[:2]
+    x1, y1 = max(int(bbox[0]) - padding, 0), max(int(bbox[1]) - padding, 0)
+    x2, y2 = min(int(bbox[2]) + padding, w), min(int(bbox[3]) + padding, h)
+    crop = image[y1:y2, x1:x2]
+    return crop if crop.size else None
+
+
+def get_cell_variants(
+    image: np.ndarray, bbox: BoundingBox, padding: Optional[int] = 4
+) -> List[np.ndarray]:
+    """Returns the alternative crops of a cell that are re-recognized.
+
+    The padded crop of the cell is upscaled, and a contrast-enhanced (CLAHE), binarized
+    (Otsu) version is added for the faint or glared cells.
+
+    Args:
+        image (np.ndarray): The input image
+        bbox (BoundingBox): The bbox of the cell
+        padding (Optional[int]): The padding added around the bbox
+
+    Returns:
+        list: The crops of the cell
+    """
+    crop = get_cell_crop(image, bbox, padding)
+    if crop is None:
+        return []
+
+    upscaled = cv2.resize(crop, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    gray = cv2.cvtColor(upscaled, cv2.COLOR_BGR2GRAY)
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4)).apply(gray)
+    _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return [upscaled, cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)]
+
+
+def recognize_cells(
+    image: np.ndarray,
+    cells: CellsMap,
+    engine: OCREngine,
+    min_score: Optional[float] = None,
+) -> Dict[str, Union[int, None]]:
+    """Re-recognizes the numeric cells and returns the most confident numeric reading of each.
+
+    All the variants of all the cells are recognized in a single batch, decoded to digits only.
+    The readings scored below `min_score` are rejected.
+
+    Args:
+        image (np.ndarray): The input image
+        cells (CellsMap): The bboxes of the cells to re-recognize
+        engine (OCREngine): The OCR engine
+        min_score (Optional[float]): The minimum confidence score of a reading, defaults to the engine's `drop_score`
+
+    Returns:
+        dict: A dictionary mapping the cell keys to their re-recognized values, None when no reading is confident enough
+    """
+    if min_score is None:
+        min_score = engine.drop_score
+
+    keys, crops = [], []
+    for key, bbox in cells.items():
+        for crop in get_cell_variants(image, bbox):
+            keys.append(key)
+            crops.append(crop)
+
+    rec_res = engine.recognize_crops(crops, digits=True) if crops else []
+
+    best: Dict[str, Tuple[float, Union[int, None]]] = {
+        key: (-1.0, None) for key in cells
+    }
+    for key, (text, score) in zip(keys, rec_res):
+        value = parse_number(text)
+        if value is not None and score >= min_score and score > best[key][0]:
+            best[key] = (score, value)
+
+    return {key: value for key, (_, value) in best.items()}
+
+
+def recognize_numeric_cells(
+    image: np.ndarray,
+    all_cols: AllColumns,
+    pol_parties_results: Union[ResultsMap, None],
+    pu_data_results: Union[ResultsMap, None],
+    engine: OCREngine,
+    config: Optional[DocumentParserConfig] = None,
+    min_score: Optional[float] = NUMERIC_CELLS_MIN_SCORE,
+) -> Tuple[Union[ResultsMap, None], Union[ResultsMap, None]]:
+    """Re-reads the numeric cells whose text failed the number check with the digits-only recognizer.
+
+    The general recognizer may read a digit as a look-alike letter (e.g. "O" for "0"),
+    which fails the `is_number` check and loses the value. Only the vote cells and the
+    PU data value cells whose text may be a misread number are re-recognized, in a single
+    batch decoded to digits only, and a reading fills the value when it is confident
+    enough. The dashes and blank cells (which the digits cannot read) and the parsed
+    values are kept.
+
+    Args:
+        image (np.ndarray): The input image
+        all_cols (AllColumns): All the columns extracted from the OCR'd image
+        pol_parties_results (ResultsMap): The political parties vote results
+        pu_data_results (ResultsMap): The polling unit data results
+        engine (OCREngine): The OCR engine
+        config (Optional[DocumentParserConfig]): The parser's thresholds and tolerances, defaults to `DocumentParserConfig()`
+        min_score (Optional[float]): The minimum confidence score of a reading
+
+    Returns:
+        tuple: A tuple containing
+        - ResultsMap: The political parties vote results
+        - ResultsMap: The polling unit data results
+    """
+    if config is None:
+        config = DocumentParserConfig()
+
+    # The texts of the detected cells, the estimated cells have none
+    texts = {bbox: text for col in all_cols for text, bbox in col}
+
+    keys, crops = [], []
+    for results, cells in (
+        (pol_parties_results, get_political_parties_cells),
+        (pu_data_results, get_polling_unit_data_cells),
+    ):
+        if not results:
+            continue
+        for key, bbox in cells(all_cols, config).items():
+            if key not in results or results[key] is not None:
+                continue
+            if not is_misread_number(texts.get(bbox, "")):
+                continue
+            crop = get_cell_crop(image, bbox)
+            if crop is not None:
+                keys.append(key)
+                crops.append(crop)
+
+    if not crops:
+        return pol_parties_results, pu_data_results
+
+    readings = {}
+    for key, (text, score) in zip(keys, engine.recognize_crops(crops, digits=True)):
+        value = parse_number(text)
+        if value is not None and score >= min_score:
+            readings[key] = value
+
+    def merge(results: Union[ResultsMap, None]) -> Union[ResultsMap, None]:
+        if not results:
+            return results
+        return {key: readings.get(key, value) for key, value in results.items()}
+
+    return merge(pol_parties_results), merge(pu_data_results)
+
+
+def _votes_sum(results: ResultsMap) -> int:
+    return sum(value for value in results.values() if value is not None)
+
+
+def _is_consistent(results: ResultsMap, total: Union[int, None]) -> bool:
+    return (
+        total is not None
+        and all(value is not None for value in results.values())
+        and _votes_sum(results) == total
+    )
+
+
+def validate_document_data(
+    image: np.ndarray,
+    all_cols: AllColumns,
+    pol_parties_results: Union[ResultsMap, None],
+    pu_data_results: Union[ResultsMap, None],
+    engine: OCREngine,
+    config: Optional[DocumentParserConfig] = None,
+    min_score: Optional[float] = None,
+) -> Tuple[Union[ResultsMap, None], Union[ResultsMap, None], ValidationReport]:
+    """Checks that the party votes add up to the total valid votes, and re-recognizes the failing cells.
+
+    The missing vote cells are re-recognized. If the votes do not add up to the total, all
+    the vote cells and the total cell are re-recognized. The readings, including those of
+    the missing cells, are only merged if they make the votes add up: a single corrected
+    cell is preferred to all the corrected cells at once. The readings of the missing
+    cells that were not merged are reported as unconfirmed, the cells are left empty.
+
+    Args:
+        image (np.ndarray): The input image
+        all_cols (AllColumns): All the columns extracted from the OCR'd image
+        pol_parties_results (ResultsMap): The political parties vote results
+        pu_data_results (ResultsMap): The polling unit data results
+        engine (OCREngine): The OCR engine
+        config (Optional[DocumentParserConfig]): The parser's thresholds and tolerances, defaults to `DocumentParserConfig()`
+        min_score (Optional[float]): The minimum confidence score of a reading, defaults to the engine's `drop_score`
+
+    Returns:
+        tuple: A tuple containing
+        - ResultsMap: The corrected political parties vote results
+        - ResultsMap: The corrected polling unit data results
+        - ValidationReport: The validation report
+    """
+    if config is None:
+        config = DocumentParserConfig()
+
+    total = (pu_data_results or {}).get(TOTAL_VALID_VOTES_FIELD)
+    if not pol_parties_results or _is_consistent(pol_parties_results, total):
+        votes_sum = _votes_sum(pol_parties_results or {})
+        consistent = pol_parties_results is not None and total == votes_sum
+        report = ValidationReport(consistent, total, votes_sum, {}, [], {})
+        return pol_parties_results, pu_data_results, report
+
+    # Select the suspicious cells
+    party_cells = get_political_parties_cells(all_cols, config)
+    missing = [party for party, value in pol_parties_results.items() if value is None]
+    if total is not None and not missing:
+        suspicious = list(pol_parties_results)
+    else:
+        suspicious = missing
+    cells = {party: party_cells[party] for party in suspicious if party in party_cells}
+
+    total_cell = get_total_valid_votes_cell(all_cols, config)
+    if total_cell is not None and (total is None or not missing):
+        cells[TOTAL_VALID_VOTES_FIELD] = total_cell
+
+    readings = recognize_cells(image, cells, engine, min_score=min_score)
+    new_total = readings.pop(TOTAL_VALID_VOTES_FIELD, None)
+    fills = {
+        party: readings[party] for party in missing if readings.get(party) is not None
+    }
+    fallback_total = total if total is not None else new_total
+
+    # Try the smallest corrections first: the missing values alone, with a single party
+    # cell, or with the total cell
+    candidates = [(fills, fallback_total)]
+    candidates += [
+        ({**fills, party: value}, fallback_total)
+        for party, value in readings.items()
+        if value is not None
+        and party not in fills
+        and value != pol_parties_results[party]
+    ]
+    if new_total is not None:
+        candidates.append((fills, new_total))
+    candidates.append(
+        (
+            {p: v for p, v in readings.items() if v is not None},
+            new_total if new_total is not None else total,
+        )
+    )
+
+    corrected_results, corrected_total = pol_parties_results, total
+    for changes, candidate_total in candidates:
+        candidate_results = {**pol_parties_results, **changes}
+        if _is_consistent(candidate_results, candidate_total):
+            corrected_results, corrected_total = candidate_results, candidate_total
+            break
+
+    corrected = {
+        party: (pol_parties_results[party], value)
+        for party, value in corrected_results.items()
+        if value != pol_parties_results[party]
+    }
+    if corrected_total != total:
+        corrected[TOTAL_VALID_VOTES_FIELD] = (total, corrected_total)
+        pu_data_results = {
+            **(pu_data_results or {}),
+            TOTAL_VALID_VOTES_FIELD: corrected_total,
+        }
+
+    unconfirmed = {
+        party: value
+        for party, value in fills.items()
+        if corrected_results[party] is None
+    }
+    if total is None and corrected_total is None and new_total is not None:
+        unconfirmed[TOTAL_VALID_VOTES_FIELD] = new_total
+
+    report = ValidationReport(
+        _is_consistent(corrected_results, corrected_total),
+        corrected_total,
+        _votes_sum(corrected_results),
+        corrected,
+        [party for party, value in corrected_results.items() if value is None],
+        unconfirmed,
+    )
+    return corrected_results, pu_data_results, report
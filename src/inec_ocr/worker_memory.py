@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""worker_memory.py: Contains the resident memory benchmark of the OCR engine across forked workers"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+from typing import Any, Dict, Optional
+
+from .engine import load_image
+from .ocr import OCR_ENGINE_BACKENDS, get_ocr_engine
+
+MB = 1024 * 1024
+
+
+def get_memory_usage() -> Dict[str, float]:
+    """Returns the resident memory of the process, in MB (Linux only).
+
+    The proportional set size (PSS) splits the pages shared with other processes
+    between them, so the PSS of the workers (and of their master) add up to the memory
+    they use together. The private memory is the memory only the process uses.
+
+    Returns:
+        dict: The RSS, PSS and private memory of the process
+    """
+    usage = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == "kB":
+                usage[fields[0].rstrip(":")] = int(fields[1]) * 1024 / MB
+    return {
+        "rss_mb": usage["Rss"],
+        "pss_mb": usage["Pss"],
+        "private_mb": usage["Private_Clean"] + usage["Private_Dirty"],
+    }
+
+
+def _run_worker(
+    backend: str,
+    image_path: str,
+    cpu_threads: int,
+    preset: str,
+    barrier: Any,
+    queue: Any,
+) -> None:
+    engine = get_ocr_engine(backend, cpu_threads, preset=preset)
+    engine.ocr(load_image(image_path))
+    # The memory is measured once all the workers have run, and before any exits, so
+    # the shared pages are split between all of them
+    barrier.wait()
+    queue.put(get_memory_usage())
+    barrier.wait()
+
+
+def measure_worker_memory(
+    backend: str,
+    image_path: str,
+    workers: Optional[int] = 2,
+    preload: Optional[bool] = True,
+    cpu_threads: Optional[int] = 1,
+    preset: Optional[str] = "balanced",
+) -> Dict[str, Any]:
+    """Measures the resident memory of forked workers that each run the OCR engine once.
+
+    The workers are forked as gunicorn forks them: with `preload`, the engine is created
+    in the master process before the fork (see `PRELOAD_MODELS`), otherwise each worker
+    creates its own.
+
+    Args:
+        backend (str): The OCR engine backend, one of `OCR_ENGINE_BACKENDS`
+        image_path (str): The image each worker runs the OCR on
+        workers (Optional[int]): The number of workers
+        preload (Optional[bool]): Whether the engine is created before the fork
+        cpu_threads (Optional[int]): The number of CPU threads used by the inference runtime
+        preset (Optional[str]): The speed/accuracy preset, one of `ENGINE_PRESETS`
+
+    Returns:
+        dict: The memory usage of the master and of each worker, and their total PSS
+    """
+    if preload:
+        get_ocr_engine(backend, cpu_threads, preset=preset)
+        gc.freeze()
+
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(
+            target=_run_worker,
+            args=(backend, image_path, cpu_threads, preset, barrier, queue),
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    workers_usage = [queue.get() for _ in processes]
+    master_usage = get_memory_usage()
+    for process in processes:
+        process.join()
+
+    return {
+        "backend": backend,
+        "preset": preset,
+        "preload": preload,
+        "master": master_usage,
+        "workers": workers_usage,
+        "total_pss_mb": master_usage["pss_mb"]
+        + sum(usage["pss_mb"] for usage in workers_usage),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the resident memory of the OCR engine across forked workers"
+    )
+    parser.add_argument("--backend", default="onnx", choices=OCR_ENGINE_BACKENDS)
+    parser.add_argument("--image", default="./test-images/success/1.jpeg")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--cpu-threads", type=int, default=1)
+    parser.add_argument("--preset", default="balanced")
+    parser.add_argument(
+        "--no-preload",
+        action="store_true",
+        help="Create the engine in each worker instead of before the fork",
+    )
+    parser.add_argument("--report", help="Write the report to this file")
+    args = parser.parse_args()
+
+    report = measure_worker_memory(
+        args.backend,
+        args.image,
+        args.workers,
+        not args.no_preload,
+        args.cpu_threads,
+        args.preset,
+    )
+    print(json.dumps(report, indent=2))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""admission.py: Contains the cost-aware admission control of the OCR requests"""
+
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed, with the HTTP status code and Retry-After to send."""
+
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionTicket:
+    """An admitted request, which holds its estimated cost until it is released."""
+
+    def __init__(
+        self,
+        controller: "AdmissionController",
+        pixels: int,
+        cost: float,
+        lane: Optional[str] = None,
+    ):
+        self.controller = controller
+        self.pixels = pixels
+        self.cost = cost
+        self.lane = lane
+        self.service_time: Optional[float] = None
+        self._released = False
+
+    def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Runs the request's work, timing it to refine the controller's cost model."""
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.service_time = time.perf_counter() - start
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.controller.release(self)
+
+
+class AdmissionController:
+    """Sheds the OCR requests that would wait too long for the pipeline.
+
+    The cost of a request (the time the pipeline takes on it) is estimated from its pixel
+    count: `base_cost + megapixels * cost_per_mpixel`, where the cost per megapixel is
+    continuously refined (EWMA) from the measured service times. The queue wait of a
+    new request is the estimated cost of the admitted, unfinished requests divided by the
+    number of requests the pipeline runs concurrently.
+
+    A request is rejected with a 503 when the queue is full, and with a 429 when its
+    estimated wait plus its own cost exceeds the maximum queue wait (or the time left
+    before its deadline), unless nothing is ahead of it. The Retry-After is the time for
+    the excess work to drain.
+
+    The requests may be split into priority lanes (from the highest priority to the
+    lowest), which the scheduler serves in order: the wait of a request then only counts
+    the requests of its lane and of the higher priority lanes, plus the lower priority
+    requests that are already being processed, and the queue depth is per lane.
+    """
+
+    def __init__(
+        self,
+        max_queue_wait: Optional[float] = 30.0,
+        max_queue_depth: Optional[int] = 16,
+        concurrency: Optional[int] = 1,
+        base_cost: Optional[float] = 0.5,
+        cost_per_mpixel: Optional[float] = 0.5,
+        ewma_alpha: Optional[float] = 0.2,
+        lanes: Optional[List[str]] = None,
+    ):
+        self.max_queue_wait = max_queue_wait
+        self.max_queue_depth = max_queue_depth
+        self.concurrency = max(concurrency, 1)
+        self.base_cost = base_cost
+        self.cost_per_mpixel = cost_per_mpixel
+        self.ewma_alpha = ewma_alpha
+        self.lanes = list(lanes) if lanes else ["default"]
+
+        self.in_flight = 0
+        self.in_flight_cost = 0.0
+        self.lane_in_flight = {lane: 0 for lane in self.lanes}
+        self.lane_cost = {lane: 0.0 for lane in self.lanes}
+        self.admitted = 0
+        self.rejected = {429: 0, 503: 0}
+        self._lock = threading.Lock()
+
+    def estimate_cost(self, pixels: int) -> float:
+        """Returns the estimated service time of a request, in seconds."""
+        return self.base_cost + pixels / 1e6 * self.cost_per_mpixel
+
+    def estimate_wait(self, lane: Optional[str] = None) -> float:
+        """Returns the estimated queue wait of a new request of a lane (the lowest
+        priority lane by default), in seconds."""
+        rank = self.lanes.index(lane) if lane else len(self.lanes) - 1
+        ahead = sum(self.lane_cost[name] for name in self.lanes[: rank + 1])
+
+        # The lower priority requests are not preempted, at most one (of average cost)
+        # per concurrent request is ahead of the new request
+        lower = self.lanes[rank + 1 :]
+        lower_count = sum(self.lane_in_flight[name] for name in lower)
+        if lower_count:
+            lower_cost = sum(self.lane_cost[name] for name in lower)
+            ahead += min(lower_cost, self.concurrency * lower_cost / lower_count)
+
+        return ahead / self.concurrency
+
+    def admit(
+        self,
+        pixels: int,
+        time_left: Optional[float] = None,
+        lane: Optional[str] = None,
+    ) -> AdmissionTicket:
+        """Admits a request or sheds it.
+
+        Args:
+            pixels (int): The pixel count of the request's image
+            time_left (Optional[float]): The time left before the request's deadline, in seconds
+            lane (Optional[str]): The priority lane of the request, the lowest priority lane by default
+
+        Returns:
+            AdmissionTicket: The ticket to release once the request's work is done
+
+        Raises:
+            AdmissionRejected: If the request is shed
+        """
+        lane = lane or self.lanes[-1]
+        with self._lock:
+            cost = self.estimate_cost(pixels)
+            wait = self.estimate_wait(lane)
+            in_flight = self.lane_in_flight[lane]
+
+            if self.max_queue_depth and in_flight >= self.max_queue_depth:
+                self.rejected[503] += 1
+                raise AdmissionRejected(
+                    503,
+                    # The time for one of the requests in progress to finish
+                    self._retry_after(wait / in_flight),
+                    f"The server is overloaded ({in_flight} requests in progress)",
+                )
+
+            limit = self.max_queue_wait or math.inf
+            if time_left is not None:
+                limit = min(limit, time_left)
+            # A request with nothing ahead of it is admitted, however large
+            if wait and wait + cost > limit:
+                self.rejected[429] += 1
+                raise AdmissionRejected(
+                    429,
+                    self._retry_after(wait + cost - limit),
+                    f"The estimated processing time ({wait + cost:.1f}s) "
+                    f"exceeds the limit ({limit:.1f}s)",
+                )
+
+            self.in_flight += 1
+            self.in_flight_cost += cost
+            self.lane_in_flight[lane] += 1
+            self.lane_cost[lane] += cost
+            self.admitted += 1
+            return AdmissionTicket(self, pixels, cost, lane)
+
+    @staticmethod
+    def _retry_after(seconds: float) -> int:
+        return max(1, math.ceil(seconds))
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """Releases the cost of a finished request, and refines the cost model."""
+        with self._lock:
+            self.in_flight -= 1
+            self.in_flight_cost = max(self.in_flight_cost - ticket.cost, 0.0)
+            self.lane_in_flight[ticket.lane] -= 1
+            self.lane_cost[ticket.lane] = max(
+                self.lane_cost[ticket.lane] - ticket.cost, 0.0
+            )
+
+            if ticket.service_time is not None and ticket.pixels:
+                observed = max(ticket.service_time - self.base_cost, 0.0)
+                observed /= ticket.pixels / 1e6
+                self.cost_per_mpixel += self.ewma_alpha * (
+                    observed - self.cost_per_mpixel
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "in_flight_cost_s": self.in_flight_cost,
+                "estimated_wait_s": self.estimate_wait(),
+                "cost_per_mpixel_s": self.cost_per_mpixel,
+                "admitted": self.admitted,
+                "rejected_429": self.rejected[429],
+                "rejected_503": self.rejected[503],
+                "max_queue_wait_s": self.max_queue_wait,
+                "max_queue_depth": self.max_queue_depth,
+                "lanes": {
+                    lane: {
+                        "in_flight": self.lane_in_flight[lane],
+                        "in_flight_cost_s": self.lane_cost[lane],
+                        "estimated_wait_s": self.estimate_wait(lane),
+                    }
+                    for lane in self.lanes
+                },
+            }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""cpu.py: Contains utilities for budgeting the worker processes and threads from the container's CPU quota"""
+
+import math
+import os
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+# Environment variables that size the OpenMP/BLAS thread pools used by the inference runtimes
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+]
+
+
+class ThreadBudget(NamedTuple):
+    cpus: float
+    workers: int
+    threads_per_worker: int
+
+
+def _read_cgroup_quota() -> Optional[float]:
+    """Returns the CPU quota (in CPUs) from the cgroup v2 or v1 controller, if any."""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = Path("/sys/fs/cgroup/cpu.max")
+    if cpu_max.exists():
+        quota, period = cpu_max.read_text().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+
+    # cgroup v1: a quota of -1 means no limit
+    quota_path = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period_path = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota_path.exists() and period_path.exists():
+        quota = int(quota_path.read_text())
+        if quota > 0:
+            return quota / int(period_path.read_text())
+
+    return None
+
+
+def get_cpu_quota() -> float:
+    """Returns the number of CPUs available to the container.
+
+    This is the cgroup CPU quota when one is set (e.g. the pod's CPU limit), capped by
+    the number of CPUs the process may be scheduled on.
+
+    Returns:
+        float: The number of available CPUs
+    """
+    try:
+        affinity = len(os.sched_getaffinity(0))
+    except AttributeError:
+        affinity = os.cpu_count() or 1
+
+    try:
+        quota = _read_cgroup_quota()
+    except (OSError, ValueError):
+        quota = None
+
+    return min(quota, affinity) if quota else float(affinity)
+
+
+def get_thread_budget(
+    workers: Optional[int] = None,
+    threads_per_worker: Optional[int] = None,
+    max_threads_per_worker: Optional[int] = 4,
+) -> ThreadBudget:
+    """Splits the available CPUs between the worker processes and their intra-op threads.
+
+    The product of the workers and the threads per worker never exceeds the CPU quota
+    (rounded up), so concurrent inferences do not oversubscribe the container.
+
+    Args:
+        workers (Optional[int]): The number of workers, derived from the quota if not set
+        threads_per_worker (Optional[int]): The number of threads per worker, derived from the quota if not set
+        max_threads_per_worker (Optional[int]): The default cap on the threads per worker when neither is set
+
+    Returns:
+        ThreadBudget: The CPU quota, the number of workers and the threads per worker
+    """
+    cpus = get_cpu_quota()
+    total_threads = max(1, math.ceil(cpus))
+
+    if workers and not threads_per_worker:
+        threads_per_worker = max(1, total_threads // workers)
+    elif threads_per_worker and not workers:
+        workers = max(1, total_threads // threads_per_worker)
+    elif not workers and not threads_per_worker:
+        threads_per_worker = min(total_threads, max_threads_per_worker)
+        workers = max(1, total_threads // threads_per_worker)
+
+    return ThreadBudget(cpus, workers, threads_per_worker)
+
+
+def apply_thread_env(threads_per_worker: int) -> None:
+    """Sizes the OpenMP/BLAS thread pools, unless they are explicitly configured.
+
+    This must run before numpy or the inference runtimes are imported.
+
+    Args:
+        threads_per_worker (int): The number of threads per worker
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads_per_worker))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""deadline.py: Contains the request deadlines and the cancellation of the requests whose client is gone"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import Depends, Header, Request
+
+from .settings import Settings, get_settings
+
+
+class RequestCancelled(Exception):
+    """Raised at a stage boundary when the request's deadline passed or its client is gone."""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"Request cancelled after the {stage} stage: {reason}")
+        self.stage = stage
+        self.reason = reason
+
+
+class Deadline:
+    """The deadline of a request, checked between the stages of the pipeline.
+
+    The pipeline runs in a worker thread, so the client disconnects are watched in the
+    event loop and signalled to the thread through an event.
+    """
+
+    DEADLINE_EXCEEDED = "deadline exceeded"
+    CLIENT_DISCONNECTED = "client disconnected"
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.disconnected = threading.Event()
+
+    def remaining(self) -> float:
+        """Returns the time left before the deadline, in seconds."""
+        return self.expires_at - time.monotonic()
+
+    def check(self, stage: str) -> None:
+        """Raises `RequestCancelled` if the remaining work of the request must be abandoned.
+
+        Args:
+            stage (str): The name of the stage that just ended
+        """
+        if self.disconnected.is_set():
+            raise RequestCancelled(stage, self.CLIENT_DISCONNECTED)
+        if self.remaining() <= 0:
+            raise RequestCancelled(stage, self.DEADLINE_EXCEEDED)
+
+
+def get_request_deadline(
+    x_request_timeout: Optional[float] = Header(None),
+    settings: Settings = Depends(get_settings),
+) -> Deadline:
+    """Returns the deadline of a request, from its `X-Request-Timeout` header (in seconds).
+
+    The server's `request_timeout` is the default, and `request_max_timeout` caps the
+    header's timeout.
+    """
+    timeout = settings.request_timeout
+    if x_request_timeout is not None and x_request_timeout > 0:
+        timeout = min(x_request_timeout, settings.request_max_timeout)
+    return Deadline(timeout)
+
+
+async def _poll_disconnect(
+    request: Request, deadline: Deadline, interval: float
+) -> None:
+    while deadline.remaining() > 0:
+        if await request.is_disconnected():
+            deadline.disconnected.set()
+            return
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def watch_disconnect(
+    request: Request, deadline: Deadline, interval: Optional[float] = 0.25
+) -> AsyncIterator[None]:
+    """Watches the connection of the request's client, and flags the deadline once it is gone.
+
+    This must only be entered once the request body has been read, since the polling
+    consumes the request's incoming messages.
+
+    Args:
+        request (Request): The request
+        deadline (Deadline): The deadline of the request
+        interval (Optional[float]): The polling interval, in seconds
+    """
+    poller = asyncio.create_task(_poll_disconnect(request, deadline, interval))
+    try:
+        yield
+    finally:
+        poller.cancel()
@@ -2,29 +2,94 @@
 
 """main.py: The entry point for the server."""
 
+import asyncio
+import threading
+import tracemalloc
 import uuid
+from functools import partial
 from pathlib import Path
-from typing import NamedTuple
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
 
 import cv2
-from fastapi import Depends, FastAPI, File, Header, Request, UploadFile
+import numpy as np
+from fastapi import Depends, FastAPI, File, Header, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import HTTPException
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from PIL import Image
+from pydantic import BaseModel
 
 from ..inec_ocr.clustering import cluster_ocr_results
 from ..inec_ocr.common import show_image
-from ..inec_ocr.document import get_document_data
-from ..inec_ocr.ocr import draw_ocr, extract_text, filter_text_predictions
-from ..inec_ocr.types import OCRResultType, ResultsMap
+from ..inec_ocr.dedup import NearDuplicateCache, document_phash
+from ..inec_ocr.document import get_document_data, rectify_document
+from ..inec_ocr.engine import OCREngine, load_image
+from ..inec_ocr.grid import grid_ocr_results
+from ..inec_ocr.ocr import (
+    ENGINE_PRESETS,
+    draw_ocr,
+    extract_text,
+    filter_text_predictions,
+    get_ocr_engine,
+)
+from ..inec_ocr.pdf import iter_pdf_pages
+from ..inec_ocr.pipeline import parse_ocr_results
+from ..inec_ocr.preview import preview_layout
+from ..inec_ocr.quality import QualityThresholds, assess_image_quality
+from ..inec_ocr.types import DocumentParserConfig, OCRResultType, ResultsMap
+from ..inec_ocr.validation import recognize_numeric_cells, validate_document_data
+from .admission import AdmissionController, AdmissionRejected, AdmissionTicket
+from .cpu import get_thread_budget
+from .deadline import (
+    Deadline,
+    RequestCancelled,
+    get_request_deadline,
+    watch_disconnect,
+)
 from .logger import logger
+from .memory import MemoryMonitor, RequestMemoryProfile
+from .responses import (
+    build_json_response,
+    encode_ndjson_line,
+    encode_raw_ocr_results,
+    get_raw_ocr_results_encoding,
+)
+from .results_store import AREA_LEVELS, SheetKey, get_results_store
+from .scheduler import (
+    BULK_LANE,
+    LANES,
+    ClientIdentity,
+    FairScheduler,
+    get_client_identity,
+)
+from .settings import get_settings
+from .storage import get_storage
 from .utils import (
+    IMAGE_ENCODINGS,
+    ImageInfo,
+    check_upload_content_length,
+    encode_img,
     fetch_details,
-    handle_file_upload,
-    upload_img_to_cloudinary,
-    write_img_to_tmp,
+    handle_tmp_file,
+    save_pdf_upload_file_to_tmp,
+    save_request_body_to_tmp,
+    save_upload_file_to_tmp,
 )
 
 BASE_DIR = Path(__file__).parent
@@ -33,14 +98,105 @@ STATIC_FILES_DIR = str(BASE_DIR / "static")
 UPLOADS_DIR = BASE_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+settings = get_settings()
+
 app = FastAPI()
 
 # Mount the static files dir
 app.mount("/static", StaticFiles(directory=STATIC_FILES_DIR), name="static")
 
+# Serve the annotated images stored by the local storage backend
+if settings.storage_backend == "local":
+    app.mount(
+        "/uploads",
+        StaticFiles(directory=settings.storage_local_dir),
+        name="uploads",
+    )
+
 # Templates dir
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
+# Trace the Python allocations, for the per-stage deltas and the top allocations
+if settings.memory_tracemalloc:
+    tracemalloc.start(settings.memory_tracemalloc_frames)
+
+memory_monitor = MemoryMonitor(max_rss_mb=settings.worker_max_rss_mb)
+
+admission_controller = AdmissionController(
+    max_queue_wait=settings.admission_max_queue_wait,
+    max_queue_depth=settings.admission_max_queue_depth,
+    concurrency=settings.admission_concurrency,
+    base_cost=settings.admission_base_cost,
+    cost_per_mpixel=settings.admission_cost_per_mpixel,
+    lanes=LANES,
+)
+
+# The pipeline's slots, shared by the priority lanes and by the clients of each lane
+scheduler = FairScheduler(concurrency=settings.admission_concurrency, lanes=LANES)
+
+
+def load_engine(preset: Optional[str] = None) -> OCREngine:
+    """Returns the (cached) OCR engine of a preset, the deployment's preset by default."""
+    return get_ocr_engine(
+        settings.ocr_engine,
+        settings.ocr_cpu_threads or get_thread_budget().threads_per_worker,
+        settings.ocr_quantized,
+        settings.ocr_quantization_min_accuracy,
+        settings.ocr_numeric_rec_model_path,
+        settings.ocr_numeric_rec_char_dict_path,
+        preset or settings.ocr_preset,
+    )
+
+
+# Load the OCR model weights at import time, i.e. in the gunicorn master process
+# when the app is preloaded, so that they are shared by the forked workers
+if settings.preload_models:
+    load_engine()
+
+engine_lock = threading.Lock()
+
+
+def get_engine(preset: Optional[str] = None) -> OCREngine:
+    """Returns the OCR engine of a preset, with the recognition batching and the tiled
+    detection enabled as configured in the settings.
+
+    The batching and tiling threads do not survive a fork, so this must only be called
+    in the workers, not at import time.
+    """
+    engine = load_engine(preset)
+    with engine_lock:
+        if settings.ocr_rec_batching and engine.recognition_batcher is None:
+            engine.enable_recognition_batching(
+                settings.ocr_rec_batch_max_size, settings.ocr_rec_batch_max_wait_ms
+            )
+        if settings.ocr_tiled_detection and engine.tiled_detector is None:
+            engine.enable_tiled_detection(
+                settings.ocr_det_tile_size,
+                settings.ocr_det_tile_overlap,
+                settings.ocr_det_tile_min_side,
+                settings.ocr_det_tile_workers,
+            )
+    return engine
+
+
+def get_engine_preset(preset: Optional[str] = None) -> str:
+    """Returns the OCR engine preset of a request, the deployment's preset by default."""
+    if preset is None:
+        return settings.ocr_preset
+    if preset not in ENGINE_PRESETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"The preset must be one of {list(ENGINE_PRESETS)}",
+        )
+    return preset
+
+
+@app.on_event("startup")
+def load_ocr_engine():
+    # Load the OCR models of the deployment's preset before serving the first request,
+    # the other presets' are loaded on their first request
+    get_engine()
+
 
 @app.get("/", response_class=HTMLResponse)
 def home_view(request: Request):
@@ -52,26 +208,196 @@ def healthcheck():
     return {"status": True, "message": "Server is healthy!"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Returns the admission control and scheduling state (with the latencies of each
+    lane) of the worker that serves the request."""
+    return {
+        "status": True,
+        "data": {
+            "admission": admission_controller.stats(),
+            "scheduler": scheduler.stats(),
+        },
+    }
+
+
+@app.get("/memory")
+def memory_stats():
+    """Returns the memory statistics of the worker that serves the request."""
+    return {"status": True, "data": memory_monitor.stats()}
+
+
+@app.middleware("http")
+async def recycle_worker_over_memory_ceiling(request: Request, call_next):
+    response = await call_next(request)
+    memory_monitor.after_request()
+    return response
+
+
+# The size limits of the multipart upload endpoints
+MULTIPART_UPLOAD_LIMITS = {
+    "/inec-ocr": settings.max_upload_bytes,
+    "/inec-ocr/preview": settings.max_upload_bytes,
+    "/inec-ocr/pdf": settings.max_pdf_upload_bytes,
+}
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Rejects the oversized multipart uploads before their form is parsed, i.e. before
+    their body is read."""
+    max_bytes = MULTIPART_UPLOAD_LIMITS.get(request.url.path)
+    if request.method == "POST" and max_bytes is not None:
+        try:
+            check_upload_content_length(request, max_bytes)
+        except HTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+    return await call_next(request)
+
+
 class UploadHandlerResponse(NamedTuple):
-    upload_url: str
+    annotated_img: Union[bytes, None]
     pol_parties_results: ResultsMap
     pu_data_results: ResultsMap
     election_type: str
     pu_reg_info_results: ResultsMap
     raw_ocr_results: OCRResultType
+    image_hash: Union[int, None] = None
+    upload_url: Union[str, None] = None
+    validation: Union[dict, None] = None
+    quality: Union[dict, None] = None
 
 
-def upload_handler(p: Path) -> UploadHandlerResponse:
+# Cache of the results of recently processed sheets, looked up by perceptual hash
+dedup_cache = (
+    NearDuplicateCache(
+        max_size=settings.dedup_cache_size,
+        max_distance=settings.dedup_max_distance,
+        ttl=settings.dedup_ttl,
+    )
+    if settings.dedup_cache_size
+    else None
+)
+
+
+# The thresholds of the image quality gate, which runs before the OCR
+quality_thresholds = QualityThresholds(
+    min_blur_variance=settings.quality_min_blur_variance,
+    max_glare_ratio=settings.quality_max_glare_ratio,
+    max_dark_ratio=settings.quality_max_dark_ratio,
+    min_contrast=settings.quality_min_contrast,
+    min_side=settings.quality_min_side,
+    min_coverage=settings.quality_min_coverage,
+)
+
+
+def upload_handler(
+    p: Path, deadline: Optional[Deadline] = None, preset: Optional[str] = None
+) -> UploadHandlerResponse:
     """File upload handler for the OCR endpoint."""
+    return run_profiled_pipeline(
+        partial(run_upload_pipeline, p, preset=preset), deadline
+    )
+
+
+def page_handler(
+    image: np.ndarray, deadline: Optional[Deadline] = None, preset: Optional[str] = None
+) -> UploadHandlerResponse:
+    """Rasterized PDF page handler for the PDF OCR endpoint."""
+    return run_profiled_pipeline(
+        partial(run_image_pipeline, image, preset=preset), deadline
+    )
+
+
+def run_profiled_pipeline(
+    pipeline: Callable[[Callable[[str], None]], UploadHandlerResponse],
+    deadline: Optional[Deadline] = None,
+) -> UploadHandlerResponse:
+    """Runs the OCR pipeline with a checkpoint that profiles its stages' memory and
+    checks the request's deadline."""
     logger.debug("started computing results...")
+    # The request may have waited for a worker thread past its deadline
+    if deadline is not None:
+        deadline.check("queue")
+
+    profile = RequestMemoryProfile()
+
+    def checkpoint(stage: str) -> None:
+        profile.mark(stage)
+        if deadline is not None:
+            deadline.check(stage)
+
+    try:
+        return pipeline(checkpoint)
+    finally:
+        memory_monitor.record(profile)
+
+
+def run_upload_pipeline(
+    p: Path, checkpoint: Callable[[str], None], preset: Optional[str] = None
+) -> UploadHandlerResponse:
+    """Runs the OCR pipeline on an uploaded image, with the OCR engine of a preset.
+
+    The checkpoint is called with the name of each stage that ended: it records the
+    memory used by the stage, and abandons the remaining stages (by raising
+    `RequestCancelled`) once the request's deadline passed or its client is gone.
+    """
     # Load the image
-    image = cv2.imread(str(p), cv2.IMREAD_UNCHANGED)
+    image = load_image(str(p))
+    checkpoint("decode")
+
+    return run_image_pipeline(image, checkpoint, preset)
+
+
+def run_image_pipeline(
+    image: np.ndarray, checkpoint: Callable[[str], None], preset: Optional[str] = None
+) -> UploadHandlerResponse:
+    """Runs the OCR pipeline on a decoded image, see `run_upload_pipeline`."""
+    preset = preset or settings.ocr_preset
+
+    # Reject (or flag) the unreadable photos before spending an OCR pass on them
+    quality = None
+    if settings.quality_gate != "off":
+        report = assess_image_quality(image, quality_thresholds)
+        quality = report._asdict()
+        checkpoint("quality")
+        if not report.passed:
+            logger.info(f"Image quality gate: {'; '.join(report.reasons)}")
+            if settings.quality_gate == "reject":
+                raise HTTPException(
+                    status_code=422,
+                    detail={"reasons": report.reasons, "quality": quality},
+                )
+
+    # Return the results of a previously processed photo of the same sheet, the cache
+    # only holds the results of the deployment's preset
+    image_hash = None
+    if dedup_cache is not None and preset == settings.ocr_preset:
+        image_hash = document_phash(image)
+        cached_response = dedup_cache.get(image_hash)
+        checkpoint("dedup")
+        if cached_response is not None:
+            logger.info("Near-duplicate sheet, returning the cached results")
+            return cached_response._replace(quality=quality)
+
+    # The table-grid layout engine needs the rulings of the document straight, so the
+    # OCR runs on the rectified document
+    if settings.layout_engine == "grid":
+        image = rectify_document(image)
+        checkpoint("rectify")
+
     # Obtain the OCR results
-    bboxes, texts, scores = extract_text(str(p))
+    engine = get_engine(preset)
+    bboxes, texts, scores = extract_text(image, engine=engine, checkpoint=checkpoint)
     filtered_bboxes, filtered_texts = filter_text_predictions(bboxes, texts, scores)
+    checkpoint("recognize")
 
-    # Cluster the OCR results
-    final_cols = cluster_ocr_results(filtered_bboxes, filtered_texts)
+    # Cluster the OCR results into columns
+    if settings.layout_engine == "grid":
+        final_cols = grid_ocr_results(image, filtered_bboxes, filtered_texts)
+    else:
+        final_cols = cluster_ocr_results(filtered_bboxes, filtered_texts)
+    checkpoint("cluster")
 
     # Obtain the results
     (
@@ -80,49 +406,528 @@ def upload_handler(p: Path) -> UploadHandlerResponse:
         election_type,
         pu_reg_info_results,
     ) = get_document_data(final_cols)
+    checkpoint("parse")
 
-    # Handle saving the annotated image to cloudinary
-    annotated_img = draw_ocr(image, bboxes)
+    # Re-read the vote and PU data values cells with the digits-only recognizer
+    if settings.ocr_numeric_cells:
+        pol_parties_results, pu_data_results = recognize_numeric_cells(
+            image,
+            final_cols,
+            pol_parties_results,
+            pu_data_results,
+            engine,
+            min_score=settings.ocr_numeric_cells_min_score,
+        )
+        checkpoint("numeric_cells")
+
+    # Re-recognize the vote cells that do not add up to the total valid votes
+    validation = None
+    if settings.validate_results:
+        pol_parties_results, pu_data_results, report = validate_document_data(
+            image,
+            final_cols,
+            pol_parties_results,
+            pu_data_results,
+            engine,
+            min_score=settings.validation_min_score,
+        )
+        validation = report._asdict()
+        checkpoint("validate")
 
-    # Write the annotated image to a tmp path
-    tmp_path = write_img_to_tmp(annotated_img)
+    # Draw the annotated image
+    annotated_img = draw_ocr(image, bboxes)
+    checkpoint("annotate")
 
-    # Save the image to cloudinary
-    upload_url = upload_img_to_cloudinary(tmp_path)
+    # Encode the annotated image in memory, it is uploaded to the storage asynchronously
+    buffer = encode_img(annotated_img)
+    checkpoint("encode")
 
-    return (
-        upload_url,
+    return UploadHandlerResponse(
+        buffer,
         pol_parties_results,
         pu_data_results,
         election_type,
         pu_reg_info_results,
         (bboxes, texts, scores),
+        image_hash,
+        validation=validation,
+        quality=quality,
     )
 
 
-@app.post("/inec-ocr")
-async def inec_ocr(file: UploadFile = File(...), full: bool = True):
-    # Obtain the response
-    response = handle_file_upload(file, upload_handler)
+async def upload_annotated_img(buffer: bytes) -> Union[str, None]:
+    """Uploads the annotated image to the storage backend and returns its URL."""
+    ext = IMAGE_ENCODINGS[settings.annotated_img_format][0]
+    try:
+        return await get_storage().upload_async(buffer, ext)
+    except Exception as e:
+        logger.error(f"Failed to upload the annotated image: {str(e)}")
+        return None
 
+
+async def build_ocr_response(
+    response: dict,
+    raw_encoding: Optional[str],
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    """Builds the OCR endpoints' response from the upload handler's response."""
     if not response["status"]:
         raise HTTPException(status_code=400, detail=response["error"])
 
-    data = response["data"]
+    results = await build_ocr_results(response["data"], raw_encoding, deadline)
+    return {"status": True, "data": results}
+
+
+async def build_ocr_results(
+    data: UploadHandlerResponse,
+    raw_encoding: Optional[str],
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    """Uploads the annotated image and records the results of a processed image.
+
+    The raw OCR results are included in the `raw_encoding` encoding (one of
+    `RAW_OCR_RESULTS_ENCODINGS`), unless it is None.
+    """
+    upload_url = data.upload_url
+    if data.annotated_img is not None:
+        # Do not upload an annotated image nobody will see
+        if deadline is not None:
+            deadline.check("encode")
+        upload_url = await upload_annotated_img(data.annotated_img)
+        # Cache the results (without the image itself) for the near-duplicate uploads
+        if data.image_hash is not None:
+            dedup_cache.put(
+                data.image_hash,
+                data._replace(annotated_img=None, upload_url=upload_url),
+            )
+
     results = {
-        "output_image_url": data[0],
-        "political_parties_vote_results": data[1],
-        "pu_data_results": data[2],
-        "pu_reg_info_results": data[4],
-        "election_type": data[3],
+        "output_image_url": upload_url,
+        "political_parties_vote_results": data.pol_parties_results,
+        "pu_data_results": data.pu_data_results,
+        "pu_reg_info_results": data.pu_reg_info_results,
+        "election_type": data.election_type,
     }
 
-    if full:
-        results["raw_ocr_results"] = {
-            "bboxes": data[5][0],
-            "scores": data[5][1],
-            "texts": data[5][2],
-        }
+    if data.validation is not None:
+        results["validation"] = data.validation
+
+    if data.quality is not None:
+        results["quality"] = data.quality
+
+    # Record the freshly parsed sheets, the cached ones were recorded already
+    results_store = get_results_store()
+    if results_store is not None and data.annotated_img is not None:
+        try:
+            await run_in_threadpool(
+                results_store.record,
+                data.election_type,
+                data.pu_reg_info_results,
+                data.pol_parties_results,
+                data.pu_data_results,
+                upload_url,
+            )
+        except Exception as e:
+            logger.error(f"Failed to record the results: {str(e)}")
 
     logger.info(f"Successfully computed results: {results}")
+
+    if raw_encoding is not None:
+        results["raw_ocr_results"] = encode_raw_ocr_results(
+            *data.raw_ocr_results, raw_encoding
+        )
+
+    return results
+
+
+@app.exception_handler(RequestCancelled)
+async def request_cancelled_handler(request: Request, exc: RequestCancelled):
+    logger.warning(f"{request.url.path}: {str(exc)}")
+    # 499 is the (nginx) status code of the requests closed by their client
+    status_code = 504 if exc.reason == Deadline.DEADLINE_EXCEEDED else 499
+    return JSONResponse(status_code=status_code, content={"detail": str(exc)})
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    logger.warning(f"{request.url.path}: request shed, {exc.reason}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+async def process_upload(
+    request: Request,
+    tmp_path: Path,
+    info: ImageInfo,
+    raw_encoding: Optional[str],
+    deadline: Deadline,
+    preset: str,
+    client: ClientIdentity,
+) -> Response:
+    """Runs the OCR pipeline on an uploaded image, if the admission controller admits
+    it, once the scheduler grants it a slot of the pipeline.
+
+    The request's cost and slot are released once the pipeline is done, before the
+    upload of the annotated image, which does not occupy the pipeline.
+    """
+    try:
+        ticket = admission_controller.admit(
+            info.width * info.height, deadline.remaining(), client.lane
+        )
+    except AdmissionRejected:
+        tmp_path.unlink()
+        raise
+
+    try:
+        async with watch_disconnect(request, deadline):
+            try:
+                async with scheduler.slot(client, ticket.cost, deadline):
+                    # The pipeline is run in the threadpool so that requests can be
+                    # batched
+                    response = await run_in_threadpool(
+                        ticket.run,
+                        handle_tmp_file,
+                        tmp_path,
+                        partial(upload_handler, deadline=deadline, preset=preset),
+                    )
+            finally:
+                # The request may have been cancelled in the queue, before its file was
+                # handled
+                tmp_path.unlink(missing_ok=True)
+            ticket.release()
+            results = await build_ocr_response(response, raw_encoding, deadline)
+            return build_json_response(results, request)
+    finally:
+        ticket.release()
+
+
+@app.post("/inec-ocr")
+async def inec_ocr(
+    request: Request,
+    file: UploadFile = File(...),
+    raw_encoding: Optional[str] = Depends(get_raw_ocr_results_encoding),
+    deadline: Deadline = Depends(get_request_deadline),
+    preset: str = Depends(get_engine_preset),
+    client: ClientIdentity = Depends(get_client_identity),
+):
+    tmp_path, info = await run_in_threadpool(save_upload_file_to_tmp, file)
+    return await process_upload(
+        request, tmp_path, info, raw_encoding, deadline, preset, client
+    )
+
+
+@app.post("/inec-ocr/preview")
+async def inec_ocr_preview(
+    file: UploadFile = File(...), preset: str = Depends(get_engine_preset)
+):
+    """Previews the layout of a photo (text boxes, page quad and quality) by running the
+    text detector only, on a downscaled copy, so the framing can be confirmed (or the
+    photo retaken) before the full OCR."""
+    tmp_path, _ = await run_in_threadpool(save_upload_file_to_tmp, file)
+    try:
+        # The preset's engine is loaded on its first request, off the event loop
+        preview = await run_in_threadpool(
+            lambda: preview_layout(
+                str(tmp_path),
+                get_engine(preset),
+                settings.preview_max_side,
+                quality_thresholds,
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        tmp_path.unlink()
+
+    data = preview._asdict()
+    data["quality"] = preview.quality._asdict()
+    return {"status": True, "data": data}
+
+
+@app.post("/inec-ocr/raw")
+async def inec_ocr_raw(
+    request: Request,
+    raw_encoding: Optional[str] = Depends(get_raw_ocr_results_encoding),
+    deadline: Deadline = Depends(get_request_deadline),
+    preset: str = Depends(get_engine_preset),
+    client: ClientIdentity = Depends(get_client_identity),
+):
+    """OCR endpoint that accepts the image as the raw request body (no multipart parsing)."""
+    content_type = request.headers.get("content-type", "")
+    if not (
+        content_type.startswith("application/octet-stream")
+        or content_type.startswith("image/")
+    ):
+        raise HTTPException(
+            status_code=415,
+            detail="Expected an application/octet-stream or image/* request body",
+        )
+
+    tmp_path, info = await save_request_body_to_tmp(request)
+    return await process_upload(
+        request, tmp_path, info, raw_encoding, deadline, preset, client
+    )
+
+
+async def admit_pdf_page(image: np.ndarray, deadline: Deadline, wait: bool):
+    """Admits a PDF page in the bulk lane, waiting for the pipeline to drain (if `wait`)
+    when it is shed."""
+    while True:
+        try:
+            return admission_controller.admit(
+                image.shape[0] * image.shape[1], deadline.remaining(), BULK_LANE
+            )
+        except AdmissionRejected as e:
+            if not wait or e.retry_after >= deadline.remaining():
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+async def stream_pdf_results(
+    tmp_path: Path,
+    pages: Iterator[np.ndarray],
+    image: np.ndarray,
+    ticket: Optional[AdmissionTicket],
+    raw_encoding: Optional[str],
+    deadline: Deadline,
+    preset: str,
+    client: ClientIdentity,
+) -> AsyncIterator[bytes]:
+    """Runs the OCR pipeline on the pages of a PDF one at a time, and streams the results
+    of each page as a line of JSON, followed by a summary line.
+
+    The pages are scheduled in the bulk lane, so that a long PDF does not hold back the
+    interactive requests.
+    """
+    page = failed = 0
+    try:
+        while image is not None:
+            page += 1
+            try:
+                if ticket is None:
+                    ticket = await admit_pdf_page(image, deadline, wait=True)
+                try:
+                    async with scheduler.slot(client, ticket.cost, deadline):
+                        data = await run_in_threadpool(
+                            ticket.run, page_handler, image, deadline, preset
+                        )
+                finally:
+                    ticket.release()
+                    ticket = None
+                line = {
+                    "page": page,
+                    "status": True,
+                    "data": await build_ocr_results(data, raw_encoding, deadline),
+                }
+            except (RequestCancelled, AdmissionRejected) as e:
+                # The remaining pages would be cancelled or shed as well
+                line = {"page": page, "status": False, "error": str(e)}
+                yield encode_ndjson_line(line)
+                break
+            except HTTPException as e:
+                failed += 1
+                line = {"page": page, "status": False, "error": e.detail}
+            except Exception as e:
+                failed += 1
+                line = {"page": page, "status": False, "error": str(e)}
+
+            yield encode_ndjson_line(line)
+
+            # Release the page before rendering the next one
+            image = data = None
+            try:
+                image = await run_in_threadpool(next, pages, None)
+            except ValueError as e:
+                failed += 1
+                line = {"page": page + 1, "status": False, "error": str(e)}
+                yield encode_ndjson_line(line)
+                break
+        else:
+            summary = {"status": True, "pages": page, "failed": failed}
+            yield encode_ndjson_line(summary)
+    finally:
+        if ticket is not None:
+            ticket.release()
+        # Abandon the page in progress if the client is gone (the stream was cancelled)
+        deadline.disconnected.set()
+        try:
+            pages.close()
+        except ValueError:
+            # The page is still being rendered, the PDF is closed with the generator
+            pass
+        tmp_path.unlink(missing_ok=True)
+
+
+@app.post("/inec-ocr/pdf")
+async def inec_ocr_pdf(
+    file: UploadFile = File(...),
+    raw_encoding: Optional[str] = Depends(get_raw_ocr_results_encoding),
+    deadline: Deadline = Depends(get_request_deadline),
+    preset: str = Depends(get_engine_preset),
+    client: ClientIdentity = Depends(get_client_identity),
+):
+    """OCR endpoint for multi-page PDFs of result sheets.
+
+    The pages are rasterized and processed one at a time, and the results are streamed
+    back as newline-delimited JSON: one line per page, then a summary line.
+    """
+    tmp_path = await run_in_threadpool(save_pdf_upload_file_to_tmp, file)
+    pages = iter_pdf_pages(
+        str(tmp_path),
+        dpi=settings.pdf_dpi,
+        max_pixels=settings.max_image_pixels,
+        max_pages=settings.pdf_max_pages,
+    )
+
+    # Shed the PDF before streaming if the pipeline is overloaded
+    try:
+        image = await run_in_threadpool(next, pages, None)
+        if image is None:
+            raise HTTPException(status_code=422, detail="The PDF has no pages")
+        ticket = await admit_pdf_page(image, deadline, wait=False)
+    except ValueError as e:
+        pages.close()
+        tmp_path.unlink()
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception:
+        pages.close()
+        tmp_path.unlink()
+        raise
+
+    return StreamingResponse(
+        stream_pdf_results(
+            tmp_path,
+            pages,
+            image,
+            ticket,
+            raw_encoding,
+            deadline,
+            preset,
+            client._replace(lane=BULK_LANE),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+class RawOCRResults(BaseModel):
+    bboxes: List[List[List[float]]]
+    texts: List[Any]
+    scores: List[Any]
+
+
+class ReparseRequest(BaseModel):
+    raw_ocr_results: RawOCRResults
+    conf_thresh: Optional[float] = None
+    distance_threshold: Optional[float] = None
+    pol_parties_thresh: Optional[int] = None
+    pol_parties_results_thresh: Optional[int] = None
+    fields_values_thresh: Optional[int] = None
+    values_thresh: Optional[int] = None
+    fields_similarity_thresh: Optional[float] = None
+    election_type_similarity_thresh: Optional[float] = None
+    row_tolerance: Optional[int] = None
+    pol_parties_row_tolerance: Optional[int] = None
+    pol_parties_col_tolerance: Optional[int] = None
+    fields_col_tolerance: Optional[int] = None
+
+
+@app.post("/inec-ocr/reparse")
+async def inec_ocr_reparse(body: ReparseRequest):
+    """Re-runs the parsing stages on raw OCR results (as returned by `/inec-ocr?full=1`).
+
+    The parser's thresholds default to the values used by the OCR endpoint, and any of
+    them can be overridden in the request body.
+    """
+    raw = body.raw_ocr_results
+    texts, scores = raw.texts, raw.scores
+    # The OCR endpoint used to return the texts under "scores" and the scores under "texts",
+    # so the archived results may have them swapped
+    if any(isinstance(score, str) for score in scores):
+        texts, scores = scores, texts
+
+    if not len(raw.bboxes) == len(texts) == len(scores):
+        raise HTTPException(
+            status_code=422,
+            detail="The bboxes, texts and scores must have the same length",
+        )
+
+    overrides = body.dict(exclude={"raw_ocr_results"}, exclude_none=True)
+    config = DocumentParserConfig(**overrides)
+    (
+        pol_parties_results,
+        pu_data_results,
+        election_type,
+        pu_reg_info_results,
+    ) = await run_in_threadpool(
+        parse_ocr_results,
+        raw.bboxes,
+        [str(text) for text in texts],
+        [float(score) for score in scores],
+        config,
+    )
+
+    results = {
+        "political_parties_vote_results": pol_parties_results,
+        "pu_data_results": pu_data_results,
+        "pu_reg_info_results": pu_reg_info_results,
+        "election_type": election_type,
+        "config": config._asdict(),
+    }
     return {"status": True, "data": results}
+
+
+@app.get("/results/rollups")
+async def results_rollups(
+    election_type: str,
+    level: str = "state",
+    state: Optional[str] = None,
+    lga: Optional[str] = None,
+    registration_area: Optional[str] = None,
+    polling_unit: Optional[str] = None,
+):
+    """Returns the per-party vote totals of the areas at a level (one of `AREA_LEVELS`),
+    optionally within a larger area, e.g. `?level=lga&state=LAGOS`."""
+    results_store = get_results_store()
+    if results_store is None:
+        raise HTTPException(status_code=404, detail="The results store is disabled")
+    if level not in AREA_LEVELS:
+        raise HTTPException(
+            status_code=422, detail=f"The level must be one of {AREA_LEVELS}"
+        )
+
+    try:
+        rollups = await run_in_threadpool(
+            results_store.get_rollups,
+            election_type,
+            level,
+            state,
+            lga,
+            registration_area,
+            polling_unit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"status": True, "data": rollups}
+
+
+@app.get("/results/sheet")
+async def results_sheet(
+    election_type: str,
+    state: str,
+    lga: str,
+    registration_area: str,
+    polling_unit: str,
+):
+    """Returns the latest recorded results of a polling unit."""
+    results_store = get_results_store()
+    if results_store is None:
+        raise HTTPException(status_code=404, detail="The results store is disabled")
+
+    key = SheetKey(election_type, state, lga, registration_area, polling_unit)
+    sheet = await run_in_threadpool(results_store.get_sheet, key)
+    if sheet is None:
+        raise HTTPException(status_code=404, detail="No results for this polling unit")
+    return {"status": True, "data": sheet}
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""memory.py: Contains the per-request memory instrumentation and the memory-based worker recycling"""
+
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Dict, NamedTuple, Optional
+
+from .logger import logger
+
+MB = 1024 * 1024
+
+
+def get_rss_bytes() -> int:
+    """Returns the current resident set size (RSS) of the process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return get_peak_rss_bytes()
+
+
+def get_peak_rss_bytes() -> int:
+    """Returns the peak resident set size (RSS) of the process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMemory(NamedTuple):
+    rss_delta_mb: float
+    traced_delta_mb: Optional[float]
+    traced_peak_mb: Optional[float]
+    duration_s: float
+
+
+class RequestMemoryProfile:
+    """Records the RSS and the traced Python allocations of each stage of a request.
+
+    The Python allocations are only recorded if tracemalloc is tracing. A stage is recorded when it ends, by marking it with its name: it spans the time since
+    the previous mark (or the creation of the profile). The RSS and the traced allocations
+    are process-wide, so the stages of concurrent requests include each other's
+    allocations. They are exact when a worker serves one request at a time.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, StageMemory] = {}
+        self.rss_start = self._rss = get_rss_bytes()
+        self._traced = self._reset_traced_peak()
+        self._time = time.perf_counter()
+
+    @staticmethod
+    def _reset_traced_peak() -> Optional[int]:
+        if not tracemalloc.is_tracing():
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def mark(self, name: str) -> None:
+        """Records the memory used by the stage that just ended."""
+        rss = get_rss_bytes()
+        traced_delta = traced_peak = None
+        if self._traced is not None and tracemalloc.is_tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            traced_delta = (traced - self._traced) / MB
+            traced_peak = (peak - self._traced) / MB
+
+        now = time.perf_counter()
+        self.stages[name] = StageMemory(
+            (rss - self._rss) / MB, traced_delta, traced_peak, now - self._time
+        )
+        self._rss = rss
+        self._traced = self._reset_traced_peak()
+        self._time = now
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "rss_start_mb": self.rss_start / MB,
+            "rss_end_mb": self._rss / MB,
+            "rss_delta_mb": (self._rss - self.rss_start) / MB,
+            "peak_rss_mb": get_peak_rss_bytes() / MB,
+            "stages": {name: stage._asdict() for name, stage in self.stages.items()},
+        }
+
+
+class MemoryMonitor:
+    """Collects the request memory profiles and recycles the worker over an RSS ceiling.
+
+    The worker is recycled by sending it SIGTERM: the server stops accepting connections,
+    finishes the in-flight requests, and exits, and the process manager (gunicorn) starts
+    a fresh worker in its place.
+    """
+
+    def __init__(
+        self,
+        max_rss_mb: Optional[float] = 0,
+        history_size: Optional[int] = 20,
+        top_allocations: Optional[int] = 10,
+    ):
+        self.max_rss_mb = max_rss_mb
+        self.top_allocations = top_allocations
+        self.requests = 0
+        self.max_request_rss_delta_mb = 0.0
+        self.recent = deque(maxlen=history_size)
+        self.recycling = False
+        self._lock = threading.Lock()
+
+    def record(self, profile: RequestMemoryProfile) -> Dict[str, Any]:
+        """Records and logs the memory profile of a request."""
+        summary = profile.summary()
+        with self._lock:
+            self.recent.append(summary)
+            self.max_request_rss_delta_mb = max(
+                self.max_request_rss_delta_mb, summary["rss_delta_mb"]
+            )
+        stages = ", ".join(
+            f"{name}: {stage['rss_delta_mb']:+.1f}MB"
+            for name, stage in summary["stages"].items()
+        )
+        logger.info(
+            f"Request memory: RSS {summary['rss_end_mb']:.1f}MB "
+            f"({summary['rss_delta_mb']:+.1f}MB), peak {summary['peak_rss_mb']:.1f}MB, "
+            f"stages: {stages}"
+        )
+        return summary
+
+    def after_request(self) -> None:
+        """Counts a served request, and recycles the worker if it is over the RSS ceiling."""
+        with self._lock:
+            self.requests += 1
+            if self.recycling or not self.max_rss_mb:
+                return
+            rss_mb = get_rss_bytes() / MB
+            if rss_mb < self.max_rss_mb:
+                return
+            self.recycling = True
+
+        logger.warning(
+            f"Worker {os.getpid()} RSS {rss_mb:.1f}MB is over the {self.max_rss_mb}MB "
+            f"ceiling after {self.requests} requests, recycling it"
+        )
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the worker's memory statistics and its recent request profiles."""
+        stats = {
+            "pid": os.getpid(),
+            "rss_mb": get_rss_bytes() / MB,
+            "peak_rss_mb": get_peak_rss_bytes() / MB,
+            "max_rss_mb": self.max_rss_mb or None,
+            "requests": self.requests,
+            "max_request_rss_delta_mb": self.max_request_rss_delta_mb,
+            "recycling": self.recycling,
+            "recent_requests": list(self.recent),
+        }
+
+        if tracemalloc.is_tracing():
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            stats["traced_mb"] = traced / MB
+            stats["traced_peak_mb"] = traced_peak / MB
+            stats["top_allocations"] = [
+                {"location": str(stat.traceback), "size_mb": stat.size / MB}
+                for stat in snapshot.statistics("lineno")[: self.top_allocations]
+            ]
+
+        return stats
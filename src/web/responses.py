@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""responses.py: Contains the fast JSON serialization and the compression of the OCR responses"""
+
+import base64
+import gzip
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import orjson
+from fastapi import Request, Response
+from fastapi.exceptions import HTTPException
+
+from .settings import get_settings
+
+settings = get_settings()
+
+try:
+    # brotli is optional, the responses are gzip-compressed without it
+    import brotli
+except ImportError:
+    brotli = None
+
+# The encodings of the raw OCR results:
+# - nested: the boxes as lists of four [x, y] float points (the default)
+# - flat: the boxes as one flat list of int coordinates, 8 per box
+# - int32: the flat int coordinates as base64-encoded little-endian int32s
+RAW_OCR_RESULTS_ENCODINGS = ["nested", "flat", "int32"]
+
+# The decimals the scores are rounded to by the compact encodings
+COMPACT_SCORE_DECIMALS = 3
+
+
+# The orjson serialization options of the responses
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+class ORJSONResponse(Response):
+    """A JSON response serialized by orjson, which also serializes the numpy arrays.
+
+    The endpoints return it directly, which skips FastAPI's generic `jsonable_encoder`.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def encode_ndjson_line(content: Any) -> bytes:
+    """Serializes a line of a newline-delimited JSON stream with orjson."""
+    return orjson.dumps(content, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+
+def encode_raw_ocr_results(
+    bboxes: List, texts: List[str], scores: List[float], encoding: str = "nested"
+) -> Dict[str, Any]:
+    """Encodes the raw OCR results of a response.
+
+    Args:
+        bboxes (list): The bounding boxes, each with four [x, y] points
+        texts (list): The extracted texts
+        scores (list): The confidence scores
+        encoding (str): One of `RAW_OCR_RESULTS_ENCODINGS`
+
+    Returns:
+        dict: The encoded raw OCR results
+    """
+    if encoding == "nested":
+        return {"bboxes": bboxes, "texts": texts, "scores": scores}
+    if encoding not in RAW_OCR_RESULTS_ENCODINGS:
+        raise ValueError(
+            f"Unknown raw OCR results encoding: {encoding}, "
+            f"expected one of {RAW_OCR_RESULTS_ENCODINGS}"
+        )
+
+    coords = np.asarray(bboxes, dtype="float32").reshape(-1).round().astype("<i4")
+    return {
+        "encoding": encoding,
+        "bboxes": coords
+        if encoding == "flat"
+        else base64.b64encode(coords.tobytes()).decode("ascii"),
+        "texts": texts,
+        "scores": np.round(scores, COMPACT_SCORE_DECIMALS),
+    }
+
+
+def get_raw_ocr_results_encoding(
+    full: bool = True, raw_encoding: str = "nested"
+) -> Optional[str]:
+    """Returns the encoding of the raw OCR results of an OCR request, or None if they are
+    not returned (`full=0`)."""
+    if raw_encoding not in RAW_OCR_RESULTS_ENCODINGS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"The raw_encoding must be one of {RAW_OCR_RESULTS_ENCODINGS}",
+        )
+    return raw_encoding if full else None
+
+
+def get_accepted_encodings(accept_encoding: str) -> List[str]:
+    """Returns the content codings of an Accept-Encoding header, without the refused ones."""
+    accepted = []
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        try:
+            if q.startswith("q=") and float(q[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        if coding:
+            accepted.append(coding.strip().lower())
+    return accepted
+
+
+def build_json_response(
+    content: Any, request: Request, min_compress_bytes: Optional[int] = None
+) -> Response:
+    """Serializes a response with orjson, and compresses it with the best coding the
+    client accepts (brotli, then gzip) if it is large enough.
+
+    Args:
+        content (Any): The response's content
+        request (Request): The request, for its Accept-Encoding header
+        min_compress_bytes (Optional[int]): The size under which the response is not compressed, defaults to the `response_compression_min_bytes` setting (0 disables the compression)
+
+    Returns:
+        Response: The response
+    """
+    if min_compress_bytes is None:
+        min_compress_bytes = settings.response_compression_min_bytes
+
+    response = ORJSONResponse(content)
+    if not min_compress_bytes or len(response.body) < min_compress_bytes:
+        return response
+
+    response.headers["Vary"] = "Accept-Encoding"
+    accepted = get_accepted_encodings(request.headers.get("accept-encoding", ""))
+    if brotli is not None and "br" in accepted:
+        body, coding = brotli.compress(response.body, quality=4), "br"
+    elif "gzip" in accepted or "*" in accepted:
+        body, coding = gzip.compress(response.body, compresslevel=6), "gzip"
+    else:
+        return response
+
+    return Response(
+        body,
+        media_type=response.media_type,
+        headers={"Content-Encoding": coding, "Vary": "Accept-Encoding"},
+    )
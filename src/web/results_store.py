@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+"""results_store.py: Contains the persistent store of the parsed sheets and their per-area rollups"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from ..inec_ocr.constants import POLLING_UNIT_REGISTRATION_INFO_FIELDS
+from ..inec_ocr.types import ResultsMap
+from .settings import get_settings
+
+# The area levels the votes are rolled up at, from the largest to the smallest
+AREA_LEVELS = ["state", "lga", "registration_area", "polling_unit"]
+
+# Map of the PU registration info fields to the area levels
+AREA_FIELDS = dict(zip(POLLING_UNIT_REGISTRATION_INFO_FIELDS, AREA_LEVELS))
+
+# The columns that key an area's rollup rows
+AREA_KEY_COLUMNS = "election_type, level, state, lga, registration_area, polling_unit"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    election_type TEXT NOT NULL,
+    state TEXT NOT NULL,
+    lga TEXT NOT NULL,
+    registration_area TEXT NOT NULL,
+    polling_unit TEXT NOT NULL,
+    pol_parties_results TEXT,
+    pu_data_results TEXT,
+    image_url TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (election_type, state, lga, registration_area, polling_unit)
+);
+CREATE TABLE IF NOT EXISTS area_totals (
+    election_type TEXT NOT NULL,
+    level TEXT NOT NULL,
+    state TEXT NOT NULL,
+    lga TEXT NOT NULL,
+    registration_area TEXT NOT NULL,
+    polling_unit TEXT NOT NULL,
+    sheets INTEGER NOT NULL,
+    PRIMARY KEY (election_type, level, state, lga, registration_area, polling_unit)
+);
+CREATE TABLE IF NOT EXISTS party_totals (
+    election_type TEXT NOT NULL,
+    level TEXT NOT NULL,
+    state TEXT NOT NULL,
+    lga TEXT NOT NULL,
+    registration_area TEXT NOT NULL,
+    polling_unit TEXT NOT NULL,
+    party TEXT NOT NULL,
+    votes INTEGER NOT NULL,
+    PRIMARY KEY (
+        election_type, level, state, lga, registration_area, polling_unit, party
+    )
+);
+"""
+
+
+class SheetKey(NamedTuple):
+    election_type: str
+    state: str
+    lga: str
+    registration_area: str
+    polling_unit: str
+
+
+def normalize_area_name(name: Any) -> str:
+    """Normalizes an OCR'd area name, so that the re-uploads of a sheet map to the same key."""
+    return " ".join(str(name).split()).upper()
+
+
+def get_sheet_key(
+    election_type: Union[str, None], pu_reg_info_results: Union[ResultsMap, None]
+) -> Union[SheetKey, None]:
+    """Returns the key of a sheet from its election type and PU registration info.
+
+    Args:
+        election_type (str): The election type
+        pu_reg_info_results (ResultsMap): The PU registration info results
+
+    Returns:
+        SheetKey: The key of the sheet, or None if any of the PU registration info is missing
+    """
+    pu_reg_info_results = pu_reg_info_results or {}
+    areas = [pu_reg_info_results.get(field) for field in AREA_FIELDS]
+    if not election_type or any(area is None for area in areas):
+        return None
+    return SheetKey(
+        normalize_area_name(election_type), *(normalize_area_name(a) for a in areas)
+    )
+
+
+def _get_votes(results: Union[ResultsMap, None]) -> Dict[str, int]:
+    """Returns the parties with a parsed vote count and their votes."""
+    return {
+        party: value
+        for party, value in (results or {}).items()
+        if isinstance(value, int)
+    }
+
+
+def _get_area_path(key: SheetKey, level: str) -> List[str]:
+    """Returns the path of a sheet's area at a level, padded with empty components."""
+    depth = AREA_LEVELS.index(level) + 1
+    return list(key[1 : depth + 1]) + [""] * (len(AREA_LEVELS) - depth)
+
+
+class ResultsStore:
+    """A SQLite store of the parsed sheets, with incremental per-party rollups.
+
+    Every area (polling unit, registration area, LGA and state) has its rows in the
+    `area_totals` (number of sheets) and `party_totals` (votes per party) tables, which
+    are updated in the same transaction as the sheet. A re-upload of a sheet only applies
+    the difference with the previously recorded votes, so the rollups are always the sum
+    of the latest sheets. The tables' primary keys start with the election type and the
+    area level, so a rollup query is a single index range scan.
+
+    The connection is created lazily in the process that uses it, so the store can be
+    created before the server forks its workers.
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._connection = None
+        self._connection_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection_pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def record(
+        self,
+        election_type: Union[str, None],
+        pu_reg_info_results: Union[ResultsMap, None],
+        pol_parties_results: Union[ResultsMap, None],
+        pu_data_results: Union[ResultsMap, None] = None,
+        image_url: Optional[str] = None,
+    ) -> Union[SheetKey, None]:
+        """Records (or replaces) a parsed sheet and updates the rollups of its areas.
+
+        Args:
+            election_type (str): The election type
+            pu_reg_info_results (ResultsMap): The PU registration info results
+            pol_parties_results (ResultsMap): The political parties vote results
+            pu_data_results (Optional[ResultsMap]): The polling unit data results
+            image_url (Optional[str]): The URL of the annotated image
+
+        Returns:
+            SheetKey: The key of the recorded sheet, or None if the sheet could not be keyed
+        """
+        key = get_sheet_key(election_type, pu_reg_info_results)
+        if key is None:
+            return None
+        votes = _get_votes(pol_parties_results)
+
+        with self._lock:
+            connection = self.connection
+            # Take the write lock upfront, the workers may record the same sheet concurrently
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT pol_parties_results FROM sheets WHERE election_type = ? "
+                    "AND state = ? AND lga = ? AND registration_area = ? "
+                    "AND polling_unit = ?",
+                    key,
+                ).fetchone()
+                previous_votes = _get_votes(json.loads(row[0]) if row else None)
+
+                connection.execute(
+                    "INSERT OR REPLACE INTO sheets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        *key,
+                        json.dumps(pol_parties_results),
+                        json.dumps(pu_data_results),
+                        image_url,
+                        time.time(),
+                    ),
+                )
+
+                deltas = {
+                    party: votes.get(party, 0) - previous_votes.get(party, 0)
+                    for party in {**previous_votes, **votes}
+                }
+                for level in AREA_LEVELS:
+                    area = (key.election_type, level, *_get_area_path(key, level))
+                    if row is None:
+                        connection.execute(
+                            "INSERT INTO area_totals VALUES (?, ?, ?, ?, ?, ?, 1) "
+                            f"ON CONFLICT ({AREA_KEY_COLUMNS}) "
+                            "DO UPDATE SET sheets = sheets + 1",
+                            area,
+                        )
+                    for party, delta in deltas.items():
+                        if delta:
+                            connection.execute(
+                                "INSERT INTO party_totals VALUES "
+                                "(?, ?, ?, ?, ?, ?, ?, ?) "
+                                f"ON CONFLICT ({AREA_KEY_COLUMNS}, party) "
+                                "DO UPDATE SET votes = votes + excluded.votes",
+                                (*area, party, delta),
+                            )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        return key
+
+    def get_sheet(self, key: SheetKey) -> Union[Dict[str, Any], None]:
+        """Returns the recorded sheet with the given key, or None if there is none."""
+        key = SheetKey(*(normalize_area_name(value) for value in key))
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT pol_parties_results, pu_data_results, image_url, updated_at "
+                "FROM sheets WHERE election_type = ? AND state = ? AND lga = ? "
+                "AND registration_area = ? AND polling_unit = ?",
+                key,
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            **key._asdict(),
+            "political_parties_vote_results": json.loads(row[0]),
+            "pu_data_results": json.loads(row[1]),
+            "output_image_url": row[2],
+            "updated_at": row[3],
+        }
+
+    def get_rollups(
+        self,
+        election_type: str,
+        level: str,
+        state: Optional[str] = None,
+        lga: Optional[str] = None,
+        registration_area: Optional[str] = None,
+        polling_unit: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Returns the per-party vote totals of the areas at a level, within the given areas.
+
+        E.g. `get_rollups(election_type, "lga", state="LAGOS")` returns the totals of all
+        the LGAs of Lagos state.
+
+        Args:
+            election_type (str): The election type
+            level (str): The area level, one of `AREA_LEVELS`
+            state (Optional[str]): Only return the areas within this state
+            lga (Optional[str]): Only return the areas within this LGA
+            registration_area (Optional[str]): Only return the areas within this registration area
+            polling_unit (Optional[str]): Only return this polling unit
+
+        Returns:
+            list: The areas, with their number of sheets and their votes per party
+        """
+        if level not in AREA_LEVELS:
+            raise ValueError(
+                f"Unknown area level: {level}, expected one of {AREA_LEVELS}"
+            )
+
+        depth = AREA_LEVELS.index(level) + 1
+        filters = dict(zip(AREA_LEVELS, [state, lga, registration_area, polling_unit]))
+        if any(filters[name] is not None for name in AREA_LEVELS[depth:]):
+            raise ValueError(f"The {level} areas can only be filtered by larger areas")
+
+        query = (
+            "SELECT a.state, a.lga, a.registration_area, a.polling_unit, a.sheets, "
+            "p.party, p.votes FROM area_totals a LEFT JOIN party_totals p "
+            f"USING ({AREA_KEY_COLUMNS}) WHERE a.election_type = ? AND a.level = ?"
+        )
+        params = [normalize_area_name(election_type), level]
+        for name in AREA_LEVELS[:depth]:
+            if filters[name] is not None:
+                query += f" AND a.{name} = ?"
+                params.append(normalize_area_name(filters[name]))
+
+        with self._lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        areas: Dict[tuple, Dict[str, Any]] = {}
+        for *path, sheets, party, votes in rows:
+            path = tuple(path[:depth])
+            if path not in areas:
+                areas[path] = {
+                    **dict(zip(AREA_LEVELS, path)),
+                    "sheets": sheets,
+                    "votes": {},
+                }
+            if party is not None:
+                areas[path]["votes"][party] = votes
+
+        return list(areas.values())
+
+
+@lru_cache
+def get_results_store() -> Union[ResultsStore, None]:
+    """Returns the results store configured in the settings, or None if it is disabled."""
+    settings = get_settings()
+    if not settings.store_results:
+        return None
+    return ResultsStore(settings.results_store_path)
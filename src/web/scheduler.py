@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""scheduler.py: Contains the priority lanes and the weighted fair queuing of the OCR requests"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, NamedTuple, Optional
+
+from fastapi import Depends, Header, Request
+
+from .deadline import Deadline
+from .settings import Settings, get_settings
+from .utils import get_bearer_token
+
+# The priority lanes of the requests, from the highest priority to the lowest
+INTERACTIVE_LANE = "interactive"
+BULK_LANE = "bulk"
+LANES = [INTERACTIVE_LANE, BULK_LANE]
+
+# The interval at which the queued requests check their deadline, in seconds
+QUEUE_POLL_INTERVAL = 0.25
+
+
+class ClientIdentity(NamedTuple):
+    name: str
+    lane: str
+    weight: float
+
+
+def get_client_identity(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    settings: Settings = Depends(get_settings),
+) -> ClientIdentity:
+    """Returns the identity of the client of a request, and the lane of the request.
+
+    The clients are identified by the bearer token of their `Authorization` header
+    (hashed, so that the tokens do not leak in the metrics), or by their address when
+    they send none. The requests without a token (those of the web UI) and those of
+    the `scheduler_interactive_tokens` are interactive, the other requests are bulk. A
+    client may demote its requests to the bulk lane with an `X-Priority: bulk` header.
+    """
+    try:
+        token = get_bearer_token(authorization)
+    except ValueError:
+        token = None
+
+    if token is None:
+        host = request.client.host if request.client else "unknown"
+        client = ClientIdentity(f"ip:{host}", INTERACTIVE_LANE, 1.0)
+    else:
+        client = ClientIdentity(
+            f"token:{hashlib.sha256(token.encode()).hexdigest()[:12]}",
+            INTERACTIVE_LANE
+            if token in settings.scheduler_interactive_tokens
+            else BULK_LANE,
+            settings.scheduler_client_weights.get(token, 1.0),
+        )
+
+    if x_priority is not None and x_priority.lower() == BULK_LANE:
+        client = client._replace(lane=BULK_LANE)
+    return client
+
+
+class LatencyWindow:
+    """The latencies of the most recent requests, for their percentiles."""
+
+    def __init__(self, size: Optional[int] = 1000):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        """Returns the p50, p95 and p99 latencies (nearest rank), in seconds."""
+        samples = sorted(self.samples)
+        return {
+            f"p{q}": samples[max(math.ceil(q / 100 * len(samples)) - 1, 0)]
+            if samples
+            else None
+            for q in (50, 95, 99)
+        }
+
+
+class LaneStats:
+    """The queue state and the latency metrics of a lane."""
+
+    def __init__(self, window_size: int):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.queue_wait = LatencyWindow(window_size)
+        self.latency = LatencyWindow(window_size)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "queue_wait_s": self.queue_wait.percentiles(),
+            "latency_s": self.latency.percentiles(),
+        }
+
+
+class FairScheduler:
+    """Schedules the OCR requests on the pipeline's concurrent slots, by priority lane
+    and by weighted fair queuing of the clients within a lane.
+
+    A free slot goes to the highest priority lane with queued requests, so the
+    interactive requests only wait for the requests in progress, however many bulk
+    requests are queued. Within a lane, the clients share the slots in proportion to
+    their weights, whatever their request rates: each request is tagged with a virtual
+    finish time, its client's previous finish time (or the lane's virtual time, if
+    later) plus its estimated cost divided by the client's weight, and the lowest tag is
+    served first (self-clocked fair queuing, where the virtual time is the tag of the
+    last served request).
+
+    The scheduler runs in the event loop, and is not thread-safe.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = 1,
+        lanes: Optional[List[str]] = None,
+        window_size: Optional[int] = 1000,
+        max_clients: Optional[int] = 1024,
+    ):
+        self.concurrency = max(concurrency, 1)
+        self.lanes = list(lanes or LANES)
+        self.max_clients = max_clients
+        self.running = 0
+
+        self._queues: Dict[str, List] = {lane: [] for lane in self.lanes}
+        self._virtual_time = {lane: 0.0 for lane in self.lanes}
+        self._finish_tags: Dict[str, Dict[str, float]] = {
+            lane: {} for lane in self.lanes
+        }
+        self._sequence = itertools.count()
+        self._stats = {lane: LaneStats(window_size) for lane in self.lanes}
+
+    def _tag(self, client: ClientIdentity, cost: float) -> float:
+        tags = self._finish_tags[client.lane]
+        virtual_time = self._virtual_time[client.lane]
+        if len(tags) >= self.max_clients:
+            # The tags behind the virtual time no longer delay their client
+            for name in [name for name, tag in tags.items() if tag <= virtual_time]:
+                del tags[name]
+
+        start = max(tags.get(client.name, 0.0), virtual_time)
+        tags[client.name] = start + cost / client.weight
+        return tags[client.name]
+
+    def _dispatch(self) -> None:
+        """Grants the free slots to the queued requests, by lane priority then tag."""
+        for lane in self.lanes:
+            queue = self._queues[lane]
+            while queue and self.running < self.concurrency:
+                tag, _, future = heapq.heappop(queue)
+                if future.cancelled():
+                    continue
+                self._virtual_time[lane] = tag
+                self._stats[lane].queued -= 1
+                self._stats[lane].running += 1
+                self.running += 1
+                future.set_result(None)
+
+    def _release(self, lane: str) -> None:
+        self._stats[lane].running -= 1
+        self.running -= 1
+        self._dispatch()
+
+    async def _acquire(
+        self, client: ClientIdentity, cost: float, deadline: Optional[Deadline]
+    ) -> None:
+        stats = self._stats[client.lane]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queues[client.lane],
+            (self._tag(client, cost), next(self._sequence), future),
+        )
+        stats.queued += 1
+        self._dispatch()
+
+        try:
+            while not future.done():
+                timeout = None
+                if deadline is not None:
+                    timeout = max(min(QUEUE_POLL_INTERVAL, deadline.remaining()), 0)
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    deadline.check("queue")
+        except BaseException:
+            if future.done():
+                # The slot was granted as the request was being cancelled
+                self._release(client.lane)
+            else:
+                future.cancel()
+                stats.queued -= 1
+            stats.cancelled += 1
+            raise
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        client: ClientIdentity,
+        cost: float,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[None]:
+        """Waits for a slot of the pipeline, and holds it for the duration of the block.
+
+        Args:
+            client (ClientIdentity): The client of the request, and the request's lane
+            cost (float): The estimated service time of the request, in seconds
+            deadline (Optional[Deadline]): The deadline of the request, whose expiry or client disconnect abandons the wait
+
+        Raises:
+            RequestCancelled: If the deadline passes, or the client disconnects, during the wait
+        """
+        stats = self._stats[client.lane]
+        enqueued = time.perf_counter()
+        await self._acquire(client, cost, deadline)
+        stats.queue_wait.add(time.perf_counter() - enqueued)
+        try:
+            yield
+        finally:
+            self._release(client.lane)
+            stats.completed += 1
+            stats.latency.add(time.perf_counter() - enqueued)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "lanes": {lane: self._stats[lane].stats() for lane in self.lanes},
+        }
@@ -1,13 +1,83 @@
 from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
 
 from pydantic import BaseSettings
 
 
 class Settings(BaseSettings):
     debug: bool = False
-    cloudinary_cloud_name: str
-    cloudinary_api_key: str
-    cloudinary_secret_key: str
+    skip_auth: bool = True
+    app_auth_token: Optional[str] = None
+    storage_backend: str = "cloudinary"
+    storage_local_dir: str = str(Path(__file__).parent / "uploads")
+    storage_public_url: Optional[str] = None
+    storage_pool_size: int = 10
+    storage_timeout: float = 30.0
+    storage_max_retries: int = 2
+    cloudinary_cloud_name: Optional[str] = None
+    cloudinary_api_key: Optional[str] = None
+    cloudinary_secret_key: Optional[str] = None
+    s3_bucket: Optional[str] = None
+    s3_endpoint_url: Optional[str] = None
+    s3_region: Optional[str] = None
+    s3_access_key_id: Optional[str] = None
+    s3_secret_access_key: Optional[str] = None
+    max_upload_bytes: int = 20 * 1024 * 1024
+    max_image_pixels: int = 50_000_000
+    annotated_img_format: str = "jpeg"
+    annotated_img_quality: int = 80
+    annotated_img_max_side: int = 0
+    ocr_engine: str = "paddle"
+    ocr_preset: str = "balanced"
+    ocr_cpu_threads: Optional[int] = None
+    preload_models: bool = False
+    validate_results: bool = True
+    validation_min_score: Optional[float] = None
+    dedup_cache_size: int = 0
+    dedup_max_distance: int = 6
+    dedup_ttl: float = 3600.0
+    ocr_quantized: bool = False
+    ocr_quantization_min_accuracy: float = 0.98
+    ocr_rec_batching: bool = False
+    ocr_rec_batch_max_size: int = 128
+    ocr_rec_batch_max_wait_ms: float = 5.0
+    ocr_tiled_detection: bool = False
+    ocr_det_tile_size: int = 960
+    ocr_det_tile_overlap: int = 160
+    ocr_det_tile_min_side: int = 2000
+    ocr_det_tile_workers: int = 2
+    layout_engine: str = "clustering"
+    ocr_numeric_cells: bool = False
+    ocr_numeric_cells_min_score: float = 0.9
+    ocr_numeric_rec_model_path: Optional[str] = None
+    ocr_numeric_rec_char_dict_path: Optional[str] = None
+    admission_max_queue_wait: float = 30.0
+    admission_max_queue_depth: int = 16
+    admission_concurrency: int = 1
+    admission_base_cost: float = 0.5
+    admission_cost_per_mpixel: float = 0.5
+    scheduler_interactive_tokens: List[str] = []
+    scheduler_client_weights: Dict[str, float] = {}
+    request_timeout: float = 120.0
+    request_max_timeout: float = 300.0
+    memory_tracemalloc: bool = False
+    memory_tracemalloc_frames: int = 1
+    worker_max_rss_mb: int = 0
+    store_results: bool = True
+    results_store_path: str = str(Path(__file__).parent / "results.sqlite3")
+    quality_gate: str = "warn"
+    quality_min_blur_variance: float = 60.0
+    quality_max_glare_ratio: float = 0.25
+    quality_max_dark_ratio: float = 0.5
+    quality_min_contrast: float = 25.0
+    quality_min_side: int = 480
+    quality_min_coverage: float = 0.25
+    preview_max_side: int = 960
+    response_compression_min_bytes: int = 1024
+    max_pdf_upload_bytes: int = 100 * 1024 * 1024
+    pdf_dpi: int = 200
+    pdf_max_pages: int = 200
 
     class Config:
         env_file = ".env"
@@ -3,6 +3,7 @@ const fileUploadButton = document.querySelector(".upload-image__button");
 const processImageButton = document.querySelector(".process-image__button");
 const resultsPlaceholder = document.querySelector(".results__placeholder");
 const resultsWrapper = document.querySelector(".results__wrapper");
+const previewContainer = document.querySelector(".preview__container");
 const emptyResultsWrapperContent = resultsWrapper.innerHTML;
 
 fileUploadInput.addEventListener("change", function(e){
@@ -13,9 +14,88 @@ fileUploadInput.addEventListener("change", function(e){
         fileUploadButton.style.fontSize = '16px';
         const fileName = uploadedFile.replace("C:\\fakepath\\","");
         fileUploadButton.querySelector("span").innerHTML = `${fileName.slice(0, 40)} ${fileName.length>40 ? '...' : ''}`;
+
+        // Preview the layout, so that a badly framed photo is retaken before the full OCR
+        previewImage(e.target.files[0]);
     }
 })
 
+/**
+ * Preview the text boxes, page outline and quality of an image before processing it
+ * @param {*} file
+ */
+const previewImage = (file) => {
+    previewContainer.innerHTML = "";
+    if(!file){
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append("file", file);
+
+    fetch("/inec-ocr/preview", {method: "POST", body: formData})
+        .then(response => response.json())
+        .then(response => {
+            if(!response.status){
+                previewContainer.appendChild(createErrorCard("Ooops! Failed to preview the image."));
+                return;
+            }
+            const preview = response.data;
+            const image = new Image();
+            image.onload = () => {
+                previewContainer.prepend(createPreviewCanvas(image, preview));
+                URL.revokeObjectURL(image.src);
+            }
+            image.src = URL.createObjectURL(file);
+
+            const score = document.createElement("p");
+            score.className = "preview__score";
+            score.textContent = `Image quality: ${Math.round(preview.quality.score * 100)}% (${preview.boxes.length} text boxes)`;
+            previewContainer.appendChild(score);
+
+            // Ask for a retake before the OCR is paid for
+            const issues = preview.quality.reasons.concat(preview.quality.warnings);
+            if(issues.length){
+                previewContainer.appendChild(createErrorCard(`${issues.join(". ")}. Consider retaking the photo.`));
+            }
+        })
+        .catch(() => {
+            previewContainer.appendChild(createErrorCard("Ooops! Failed to preview the image."));
+        });
+}
+
+/**
+ * Create a canvas with the image, its detected text boxes and its page outline
+ * @param {*} image
+ * @param {*} preview
+ * @returns
+ */
+const createPreviewCanvas = (image, preview) => {
+    const canvas = document.createElement("canvas");
+    const scale = Math.min(1, 800 / Math.max(preview.width, preview.height));
+    canvas.width = preview.width * scale;
+    canvas.height = preview.height * scale;
+
+    const ctx = canvas.getContext("2d");
+    ctx.drawImage(image, 0, 0, canvas.width, canvas.height);
+
+    const drawPolygon = (points, color, lineWidth) => {
+        ctx.strokeStyle = color;
+        ctx.lineWidth = lineWidth;
+        ctx.beginPath();
+        points.forEach(([x, y], i) => i ? ctx.lineTo(x * scale, y * scale) : ctx.moveTo(x * scale, y * scale));
+        ctx.closePath();
+        ctx.stroke();
+    }
+
+    preview.boxes.forEach(box => drawPolygon(box, "#65DA94", 1));
+    if(preview.page_quad){
+        drawPolygon(preview.page_quad, "#1E90FF", 3);
+    }
+
+    return canvas;
+}
+
 processImageButton.addEventListener("click", function(){
     // Clear the results container 
     resultsWrapper.innerHTML = emptyResultsWrapperContent;
@@ -54,6 +134,19 @@ processImageButton.addEventListener("click", function(){
         xhr.onload = function() { 
             const response = JSON.parse(this.responseText) 
 
+            // Render the rejection reasons (e.g. the image quality gate's)
+            if(this.status !== 200){
+                let detail = response.detail;
+                if(detail && detail.reasons){
+                    detail = detail.reasons.join(". ");
+                }else if(typeof(detail) != "string"){
+                    detail = JSON.stringify(detail);
+                }
+                resultsWrapper.style.visibility = "visible";
+                resultsWrapper.querySelector(".results-data__container").appendChild(createErrorCard(`Ooops! ${detail}`));
+                return;
+            }
+
             // Render the results 
             if(response.status){
                 resultsWrapper.innerHTML = emptyResultsWrapperContent;
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""storage.py: Contains the storage backends for the annotated images"""
+
+import asyncio
+import hashlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+
+from .logger import logger
+from .settings import get_settings
+
+T = TypeVar("T")
+
+# The major versions of the Cloudinary SDK whose uploader's connection pool is known
+# to be resizable, see `CloudinaryStorage`
+CLOUDINARY_POOLED_MAJOR_VERSIONS = ("1",)
+
+# Map of the image extensions to their content types
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".webp": "image/webp",
+    ".png": "image/png",
+}
+
+
+def get_content_key(buffer: bytes, ext: str) -> str:
+    """Returns the content-addressed key of an object.
+
+    The same content always maps to the same key, so concurrent uploads never collide
+    and re-uploads of identical images are idempotent.
+
+    Args:
+        buffer (bytes): The object's content
+        ext (str): The object's file extension, e.g. ".jpg"
+
+    Returns:
+        str: The object key
+    """
+    return f"{hashlib.sha256(buffer).hexdigest()}{ext}"
+
+
+class StorageBackend:
+    """Base class for the storage backends.
+
+    The blocking uploads are run on a bounded thread pool (sized to the backend's
+    connection pool), so `upload_async` never blocks the event loop and never opens
+    more concurrent connections than the pool holds.
+    """
+
+    def __init__(
+        self, pool_size: int = 10, timeout: float = 30.0, max_retries: int = 2
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="storage"
+        )
+
+    def put(self, key: str, buffer: bytes, content_type: str) -> str:
+        """Stores an object and returns its URL."""
+        raise NotImplementedError
+
+    def upload(self, buffer: bytes, ext: str) -> str:
+        """Stores an object under its content-addressed key and returns its URL.
+
+        Args:
+            buffer (bytes): The object's content
+            ext (str): The object's file extension, e.g. ".jpg"
+
+        Returns:
+            str: The URL of the stored object
+        """
+        key = get_content_key(buffer, ext)
+        content_type = CONTENT_TYPES.get(ext, "application/octet-stream")
+        return self.put(key, buffer, content_type)
+
+    async def upload_async(self, buffer: bytes, ext: str) -> str:
+        """Asynchronous version of `upload`."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.upload, buffer, ext)
+
+    def _with_retries(self, fn: Callable[[], T]) -> T:
+        """Calls a function, retrying with exponential backoff on failure."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(0.1 * 2**attempt)
+
+
+class LocalStorage(StorageBackend):
+    """Stores the objects on the local filesystem, served by the app under `url_prefix`."""
+
+    def __init__(self, root_dir: Path, url_prefix: str = "/uploads", **kwargs):
+        super().__init__(**kwargs)
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def put(self, key: str, buffer: bytes, content_type: str) -> str:
+        path = self.root_dir / key
+        # Objects are content-addressed, so an existing object never needs rewriting
+        if not path.exists():
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_bytes(buffer)
+            tmp_path.replace(path)
+        return f"{self.url_prefix}/{key}"
+
+
+class S3Storage(StorageBackend):
+    """Stores the objects in an S3-compatible bucket (AWS S3, MinIO, or a local stand-in)."""
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        public_url: Optional[str] = None,
+        **kwargs,
+    ):
+        # boto3 is imported lazily so that it is only required by this backend
+        import boto3
+        from botocore.config import Config
+
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.public_url = (public_url or f"{endpoint_url}/{bucket}").rstrip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region_name,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(
+                max_pool_connections=self.pool_size,
+                connect_timeout=self.timeout,
+                read_timeout=self.timeout,
+                retries={"max_attempts": self.max_retries + 1, "mode": "standard"},
+            ),
+        )
+
+    def put(self, key: str, buffer: bytes, content_type: str) -> str:
+        # botocore already retries with backoff according to the client config
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=buffer, ContentType=content_type
+        )
+        return f"{self.public_url}/{key}"
+
+
+class CloudinaryStorage(StorageBackend):
+    """Stores the objects on Cloudinary."""
+
+    def __init__(
+        self,
+        cloud_name: str,
+        api_key: str,
+        api_secret: str,
+        folder: str = "inec-ocr-images",
+        **kwargs,
+    ):
+        # cloudinary is imported lazily so that it is only required by this backend
+        import cloudinary
+        import cloudinary.uploader
+        import cloudinary.utils
+
+        super().__init__(**kwargs)
+        self.folder = folder
+        cloudinary.config(
+            cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True
+        )
+        self._uploader = cloudinary.uploader
+
+        # The SDK's public API does not take a connection pool, and its uploader's
+        # module-level pool keeps a single connection, so it is replaced with one sized
+        # for the concurrent uploads, on the SDK versions it is known to exist in. The
+        # other versions keep their default pool, which only limits connection reuse
+        if cloudinary.VERSION.split(".")[0] in CLOUDINARY_POOLED_MAJOR_VERSIONS and (
+            hasattr(cloudinary.uploader, "_http")
+            and hasattr(cloudinary.utils, "get_http_connector")
+        ):
+            cloudinary.uploader._http = cloudinary.utils.get_http_connector(
+                cloudinary.config(),
+                dict(cloudinary.CERT_KWARGS, maxsize=self.pool_size),
+            )
+        else:
+            logger.warning(
+                f"Cloudinary SDK {cloudinary.VERSION}: keeping its default connection"
+                " pool for the uploads"
+            )
+
+    def put(self, key: str, buffer: bytes, content_type: str) -> str:
+        response = self._with_retries(
+            lambda: self._uploader.upload(
+                io.BytesIO(buffer),
+                folder=self.folder,
+                public_id=Path(key).stem,
+                overwrite=False,
+                resource_type="image",
+                timeout=self.timeout,
+            )
+        )
+        return response["secure_url"]
+
+
+@lru_cache
+def get_storage() -> StorageBackend:
+    """Returns the storage backend configured in the settings."""
+    settings = get_settings()
+    options = dict(
+        pool_size=settings.storage_pool_size,
+        timeout=settings.storage_timeout,
+        max_retries=settings.storage_max_retries,
+    )
+
+    if settings.storage_backend == "local":
+        return LocalStorage(
+            settings.storage_local_dir,
+            url_prefix=settings.storage_public_url or "/uploads",
+            **options,
+        )
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            settings.s3_bucket,
+            endpoint_url=settings.s3_endpoint_url,
+            region_name=settings.s3_region,
+            access_key_id=settings.s3_access_key_id,
+            secret_access_key=settings.s3_secret_access_key,
+            public_url=settings.storage_public_url,
+            **options,
+        )
+    if settings.storage_backend == "cloudinary":
+        return CloudinaryStorage(
+            settings.cloudinary_cloud_name,
+            settings.cloudinary_api_key,
+            settings.cloudinary_secret_key,
+            **options,
+        )
+
+    raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
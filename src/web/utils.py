@@ -4,30 +4,21 @@
 
 import shutil
 import socket
-from datetime import datetime
+import struct
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Callable, Tuple, Union
+from typing import Callable, NamedTuple, Optional, Tuple, Union
 
-import cloudinary
-import cloudinary.uploader
 import cv2
 import numpy as np
-from fastapi import Depends, Header, UploadFile
+from fastapi import Depends, Header, Request, UploadFile
 from fastapi.exceptions import HTTPException
 
+from .deadline import RequestCancelled
 from .settings import Settings, get_settings
 
 settings = get_settings()
 
-# Initialize cloudinary
-cloudinary.config(
-    cloud_name=settings.cloudinary_cloud_name,
-    api_key=settings.cloudinary_api_key,
-    api_secret=settings.cloudinary_secret_key,
-    secure=True,
-)
-
 
 def save_upload_file(upload_file: UploadFile, dest_path: Path) -> None:
     """Saves the uploaded file to a specific destination.
@@ -43,66 +34,371 @@ def save_upload_file(upload_file: UploadFile, dest_path: Path) -> None:
         upload_file.file.close()
 
 
-def save_upload_file_to_tmp(upload_file: UploadFile) -> Path:
-    """Save the uploaded file to a temporary file path.
+class ImageInfo(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+# Size of the chunks used for streaming the uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Maximum number of leading bytes read while looking for the image dimensions.
+# JPEG files can have large EXIF segments before the frame header.
+MAX_SNIFF_HEADER_BYTES = 512 * 1024
+
+# Image formats that can be decoded by the OCR pipeline
+SUPPORTED_IMAGE_FORMATS = ["jpeg", "png", "webp", "bmp"]
+
+# JPEG start-of-frame markers (0xC4, 0xC8 and 0xCC are not frame headers)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _sniff_jpeg_header(header: bytes) -> Union[ImageInfo, None]:
+    i = 2
+    while i + 4 <= len(header):
+        if header[i] != 0xFF:
+            raise ValueError("Corrupt JPEG header")
+        marker = header[i + 1]
+        # Skip the fill bytes and the standalone markers
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(header):
+                return None
+            height, width = struct.unpack(">HH", header[i + 5 : i + 9])
+            return ImageInfo("jpeg", width, height)
+        (length,) = struct.unpack(">H", header[i + 2 : i + 4])
+        i += 2 + length
+
+    return None
+
+
+def _sniff_webp_header(header: bytes) -> Union[ImageInfo, None]:
+    if len(header) < 30:
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return ImageInfo("webp", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L":
+        (bits,) = struct.unpack("<I", header[21:25])
+        return ImageInfo("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return ImageInfo("webp", width, height)
+    raise ValueError("Unsupported WebP encoding")
+
+
+def sniff_image_header(header: bytes) -> Union[ImageInfo, None]:
+    """Detects the image format and dimensions from the leading bytes of a file.
+
+    Args:
+        header (bytes): The leading bytes of the file
+
+    Returns:
+        ImageInfo: The image format and dimensions, or None if more bytes are needed
+
+    Raises:
+        ValueError: If the file is not a supported image
+    """
+    if len(header) < 30:
+        return None
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        width, height = struct.unpack(">II", header[16:24])
+        return ImageInfo("png", width, height)
+    if header.startswith(b"\xff\xd8"):
+        return _sniff_jpeg_header(header)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return _sniff_webp_header(header)
+    if header.startswith(b"BM"):
+        width, height = struct.unpack("<ii", header[18:26])
+        return ImageInfo("bmp", width, abs(height))
+    raise ValueError("Unsupported file format")
+
+
+class ImageUploadWriter:
+    """Streams an uploaded image to a temporary file.
+
+    The upload is rejected as soon as it exceeds the size limit, or as soon as its
+    leading bytes show that it is not a supported image or that it is too large, so
+    junk uploads are never fully copied (nor fully read, when the chunks are streamed
+    from the raw request body).
+    """
+
+    def __init__(
+        self,
+        suffix: str = "",
+        max_bytes: int = settings.max_upload_bytes,
+        max_pixels: int = settings.max_image_pixels,
+    ):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.num_bytes = 0
+        self.info: Union[ImageInfo, None] = None
+        self._header = b""
+        self._tmp = NamedTemporaryFile(delete=False, suffix=suffix)
+        self.path = Path(self._tmp.name)
+
+    def write(self, chunk: bytes) -> None:
+        self.num_bytes += len(chunk)
+        if self.num_bytes > self.max_bytes:
+            raise HTTPException(
+                detail=f"File too large, the maximum size is {self.max_bytes} bytes",
+                status_code=413,
+            )
+        if self.info is None:
+            self._header += chunk
+            self._sniff()
+        self._tmp.write(chunk)
+
+    def _sniff(self, final: bool = False) -> None:
+        try:
+            self.info = sniff_image_header(self._header)
+        except ValueError as e:
+            raise HTTPException(detail=f"Invalid image: {str(e)}", status_code=415)
+
+        if self.info is None:
+            if final or len(self._header) > MAX_SNIFF_HEADER_BYTES:
+                raise HTTPException(
+                    detail="Invalid image: unable to read the image header",
+                    status_code=415,
+                )
+            return
+
+        self._header = b""
+        if self.info.format not in SUPPORTED_IMAGE_FORMATS:
+            raise HTTPException(
+                detail=f"Unsupported image format: {self.info.format}", status_code=415
+            )
+        if self.info.width <= 0 or self.info.height <= 0:
+            raise HTTPException(
+                detail="Invalid image: empty image dimensions", status_code=415
+            )
+        if self.info.width * self.info.height > self.max_pixels:
+            raise HTTPException(
+                detail=f"Image too large, the maximum size is {self.max_pixels} pixels",
+                status_code=413,
+            )
+
+    def close(self) -> ImageInfo:
+        self._tmp.close()
+        if self.info is None:
+            self._sniff(final=True)
+        return self.info
+
+    def discard(self) -> None:
+        self._tmp.close()
+        self.path.unlink(missing_ok=True)
+
+
+def save_upload_file_to_tmp(upload_file: UploadFile) -> Tuple[Path, ImageInfo]:
+    """Stream the uploaded image to a temporary file path.
 
     Args:
         upload_file (UploadFile): Uploaded file (via the request form data)
 
     Returns:
-        tmp_path (Path): The temporary file path where the uploaded file was saved
+        tuple: A tuple containing
+        - tmp_path (Path): The temporary file path where the uploaded file was saved
+        - info (ImageInfo): The image format and dimensions
     """
+    writer = ImageUploadWriter(suffix=Path(upload_file.filename or "").suffix)
     try:
-        suffix = Path(upload_file.filename).suffix
-        with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(upload_file.file, tmp)
-            tmp_path = Path(tmp.name)
+        for chunk in iter(lambda: upload_file.file.read(UPLOAD_CHUNK_SIZE), b""):
+            writer.write(chunk)
+        info = writer.close()
+    except Exception:
+        writer.discard()
+        raise
     finally:
         upload_file.file.close()
 
     # Return the temporary file path
-    return tmp_path
+    return writer.path, info
 
 
-def write_img_to_tmp(img: np.ndarray) -> Path:
-    """Write an image to a temporary file path using cv2.
+def save_pdf_upload_file_to_tmp(
+    upload_file: UploadFile, max_bytes: int = settings.max_pdf_upload_bytes
+) -> Path:
+    """Stream the uploaded PDF to a temporary file path.
 
     Args:
-        img (np.ndarray): The input image
+        upload_file (UploadFile): Uploaded file (via the request form data)
+        max_bytes (int): The maximum size of the PDF
 
     Returns:
-        tmp_path (Path): The temporary file path where the image was written
+        Path: The temporary file path where the uploaded file was saved
     """
-    suffix = f"{datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}.png"
-    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        cv2.imwrite(tmp.name, img)
-        tmp_path = Path(tmp.name)
+    num_bytes = 0
+    tmp = NamedTemporaryFile(delete=False, suffix=".pdf")
+    tmp_path = Path(tmp.name)
+    try:
+        with tmp:
+            for chunk in iter(lambda: upload_file.file.read(UPLOAD_CHUNK_SIZE), b""):
+                if not num_bytes and not chunk.startswith(b"%PDF-"):
+                    raise HTTPException(
+                        detail="Invalid PDF: missing the PDF header", status_code=415
+                    )
+                num_bytes += len(chunk)
+                if num_bytes > max_bytes:
+                    raise HTTPException(
+                        detail=f"File too large, the maximum size is {max_bytes} bytes",
+                        status_code=413,
+                    )
+                tmp.write(chunk)
+        if not num_bytes:
+            raise HTTPException(detail="Invalid PDF: empty file", status_code=415)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        upload_file.file.close()
 
     return tmp_path
 
 
-def upload_img_to_cloudinary(tmp_path: Path) -> Union[str, None]:
-    """Upload an image to cloudinary using the cloudinary SDK.
+# Allowance for the multipart framing (the boundaries, the part headers and the other
+# form fields) on top of the size limit of an uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def get_content_length(request: Request) -> Union[int, None]:
+    """Returns the value of the `Content-Length` header of a request.
 
     Args:
-        tmp_path (Path): The temporary path to the input image
+        request (Request): The request
 
     Returns:
-        upload_url (str): The URL of the uploaded image on cloudinary
+        int: The length of the request body, or None if the header was not sent
+
+    Raises:
+        HTTPException: If the header is not a non-negative integer
     """
-    try:
-        response = cloudinary.uploader.upload(
-            str(tmp_path),
-            folder="inec-ocr-images",
-            public_id=datetime.now().strftime("%Y-%m-%d_%H:%M:%S"),
-            overwrite=True,
-            resource_type="image",
+    content_length = request.headers.get("content-length")
+    if content_length is None:
+        return None
+    if not (content_length.isascii() and content_length.isdigit()):
+        raise HTTPException(
+            detail="Invalid Content-Length header, expected a non-negative integer",
+            status_code=400,
         )
-        return response["url"]
+    return int(content_length)
+
+
+def check_upload_content_length(request: Request, max_bytes: int) -> None:
+    """Rejects a multipart upload larger than `max_bytes` from its `Content-Length`.
+
+    Starlette spools the whole multipart body before the endpoint runs, so the size
+    limit of the upload writers only applies once the body was received. This check runs
+    before the form is parsed (see the `reject_oversized_uploads` middleware), and the
+    uploads without a `Content-Length` (chunked requests) are refused, so an oversized
+    upload is rejected before its body is read.
+
+    Args:
+        request (Request): The request
+        max_bytes (int): The maximum size of the uploaded file
+
+    Raises:
+        HTTPException: If the header is missing (411), malformed (400) or over the limit (413)
+    """
+    num_bytes = get_content_length(request)
+    if num_bytes is None:
+        raise HTTPException(
+            detail="A Content-Length header is required for the uploads",
+            status_code=411,
+        )
+    if num_bytes > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(
+            detail=f"File too large, the maximum size is {max_bytes} bytes",
+            status_code=413,
+        )
+
+
+async def save_request_body_to_tmp(request: Request) -> Tuple[Path, ImageInfo]:
+    """Stream the raw request body (an image) to a temporary file path.
+
+    Args:
+        request (Request): The request
+
+    Returns:
+        tuple: A tuple containing
+        - tmp_path (Path): The temporary file path where the request body was saved
+        - info (ImageInfo): The image format and dimensions
+    """
+    # The body is streamed, so the requests without a Content-Length are limited as
+    # they are read
+    content_length = get_content_length(request)
+    if content_length is not None and content_length > settings.max_upload_bytes:
+        raise HTTPException(
+            detail=f"File too large, the maximum size is {settings.max_upload_bytes} bytes",
+            status_code=413,
+        )
+
+    writer = ImageUploadWriter()
+    try:
+        async for chunk in request.stream():
+            writer.write(chunk)
+        info = writer.close()
     except Exception:
-        return None
-    finally:
-        tmp_path.unlink()
+        writer.discard()
+        raise
+
+    return writer.path, info
+
+
+# Map of the supported annotated image formats to their file extension and cv2 quality flag
+IMAGE_ENCODINGS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", None),
+}
+
+
+def encode_img(
+    img: np.ndarray,
+    fmt: str = settings.annotated_img_format,
+    quality: int = settings.annotated_img_quality,
+    max_side: int = settings.annotated_img_max_side,
+) -> bytes:
+    """Encode an image in memory using cv2.
+
+    Args:
+        img (np.ndarray): The input image
+        fmt (str): The image format, one of "jpeg", "webp" or "png"
+        quality (int): The encoding quality (0-100) for the lossy formats
+        max_side (int): The maximum length of the longest side of the encoded image, 0 to keep the original size
+
+    Returns:
+        bytes: The encoded image
+    """
+    if fmt not in IMAGE_ENCODINGS:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    ext, quality_flag = IMAGE_ENCODINGS[fmt]
+
+    # Downscale the image to the preview size
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        img = cv2.resize(
+            img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+        )
+
+    # JPEG has no alpha channel
+    if fmt == "jpeg" and img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+
+    params = [quality_flag, quality] if quality_flag is not None else []
+    success, buffer = cv2.imencode(ext, img, params)
+    if not success:
+        raise ValueError("Unable to encode the image")
+
+    return buffer.tobytes()
 
 
 def handle_file_upload(
@@ -114,12 +410,24 @@ def handle_file_upload(
         upload_file (UploadFile): Uploaded file (via the request form data)
         handler (Callable): A callback handler for processing the uploaded file
     """
-    tmp_path = save_upload_file_to_tmp(upload_file)
+    tmp_path, _ = save_upload_file_to_tmp(upload_file)
+    return handle_tmp_file(tmp_path, handler)
+
+
+def handle_tmp_file(tmp_path: Path, handler: Callable[[Path], None]) -> None:
+    """A utility function for processing an uploaded file saved to a temporary path.
+
+    Args:
+        tmp_path (Path): The temporary path to the uploaded file
+        handler (Callable): A callback handler for processing the uploaded file
+    """
     callback_response = None
     try:
         # Process the file with the handler callback
         callback_response = handler(tmp_path)
         return {"status": True, "data": callback_response}
+    except (RequestCancelled, HTTPException):
+        raise
     except Exception as e:
         return {"status": False, "error": f"An error occurred: {str(e)}"}
     finally:
@@ -127,15 +435,30 @@ def handle_file_upload(
         tmp_path.unlink()
 
 
+def get_bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Returns the token of an `Authorization: Bearer <token>` header, None if it is missing.
+
+    Raises:
+        ValueError: If the header is not made of a scheme and a token
+    """
+    if authorization is None:
+        return None
+    token_split = authorization.split(" ")
+    if len(token_split) != 2:
+        raise ValueError("Invalid token header structure")
+    return token_split[1]
+
+
 def verify_auth(authorization=Header(None), settings: Settings = Depends(get_settings)):
     if settings.skip_auth:
         return
-    if authorization is None:
+    try:
+        token = get_bearer_token(authorization)
+    except ValueError as e:
+        raise HTTPException(detail=str(e), status_code=401)
+    if token is None:
         raise HTTPException(detail="Unauthorized", status_code=401)
-    token_split = authorization.split(" ")
-    if len(token_split) != 2:
-        raise HTTPException(detail="Invalid token header structure", status_code=401)
-    if token_split[1] != settings.app_auth_token:
+    if token != settings.app_auth_token:
         raise HTTPException(detail="Invalid token", status_code=401)
 
 
@@ -1,8 +1,4 @@
 #!/bin/bash 
 
-PORT=${PORT:-8000}
-
-gunicorn --worker-tmp-dir /dev/shm \
-  -k uvicorn.workers.UvicornWorker src.web.main:app \
-  --bind "0.0.0.0:${PORT}" \
-  -t 200
+# The workers, threads per worker and model preloading are configured in gunicorn.conf.py
+gunicorn -c gunicorn.conf.py src.web.main:app
@@ -0,0 +1,42 @@
+import pytest
+
+from src.web.admission import AdmissionController, AdmissionRejected
+
+
+def test_admission_sheds_expensive_requests_under_load():
+    controller = AdmissionController(max_queue_wait=10, max_queue_depth=4)
+    # An idle pipeline admits any request, however large
+    ticket = controller.admit(40_000_000)
+
+    with pytest.raises(AdmissionRejected) as exc_info:
+        controller.admit(12_000_000)
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after >= 1
+
+    ticket.release()
+    controller.admit(12_000_000)
+    assert controller.stats()["rejected_429"] == 1
+
+
+def test_admission_rejects_when_queue_is_full():
+    controller = AdmissionController(max_queue_wait=0, max_queue_depth=2)
+    controller.admit(1_000_000)
+    controller.admit(1_000_000)
+
+    with pytest.raises(AdmissionRejected) as exc_info:
+        controller.admit(1_000_000)
+    assert exc_info.value.status_code == 503
+
+
+def test_admission_does_not_count_queued_bulk_requests_against_interactive_ones():
+    controller = AdmissionController(
+        max_queue_wait=30, max_queue_depth=4, lanes=["interactive", "bulk"]
+    )
+    for _ in range(4):
+        controller.admit(6_000_000, lane="bulk")
+
+    with pytest.raises(AdmissionRejected) as exc_info:
+        controller.admit(6_000_000, lane="bulk")
+    assert exc_info.value.status_code == 503
+    # Only one bulk request per slot is ahead of an interactive request
+    controller.admit(6_000_000, lane="interactive")
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import numpy as np
+
+from src.inec_ocr.engine import OCREngine
+
+
+class FakeEngine(OCREngine):
+    """Records the recognition calls, and how many of them overlap."""
+
+    def __init__(self):
+        super().__init__(use_angle_cls=False)
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    def _recognize(self, crops, batch_size, prefix):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        self.calls.append((prefix, len(crops), batch_size))
+        self.running -= 1
+        return [(f"{prefix}{int(crop[0, 0])}", 0.9) for crop in crops]
+
+    def recognize(self, crops, batch_size=None):
+        return self._recognize(crops, batch_size, "")
+
+    def recognize_digits(self, crops, batch_size=None):
+        return self._recognize(crops, batch_size, "#")
+
+
+def make_crops(start, num_crops):
+    return [
+        np.full((8, 32), i, dtype=np.uint8) for i in range(start, start + num_crops)
+    ]
+
+
+def test_batched_crops_are_recognized_in_a_single_pass():
+    engine = FakeEngine()
+    engine.enable_recognition_batching(max_batch_size=128, max_wait_ms=100)
+
+    results = {}
+
+    def submit(i):
+        results[i] = engine.recognize_crops(make_crops(10 * i, 10))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert engine.calls == [("", 30, 30)]
+    for i in range(3):
+        assert [text for text, _ in results[i]] == [
+            str(v) for v in range(10 * i, 10 * i + 10)
+        ]
+
+
+def test_recognitions_are_serialized_on_non_concurrent_backends():
+    engine = FakeEngine()
+    engine.enable_recognition_batching(max_batch_size=1, max_wait_ms=0)
+
+    threads = [
+        threading.Thread(
+            target=engine.recognize_crops, args=(make_crops(0, 2),), kwargs=kwargs
+        )
+        for kwargs in [{}, {"digits": True}] * 4
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(engine.calls) == 8
+    assert engine.max_running == 1
@@ -0,0 +1,63 @@
+import random
+
+from src.inec_ocr import dedup
+from src.inec_ocr.dedup import BKTree, NearDuplicateCache, hamming_distance
+
+
+def test_bk_tree_search_matches_a_linear_scan():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    # Near duplicates of some of the hashes
+    hashes += [h ^ (1 << rng.randrange(64)) for h in hashes[:50]]
+    tree = BKTree()
+    for h in hashes:
+        tree.add(h)
+    tree.add(hashes[0])
+    assert tree.size == len(set(hashes))
+
+    for query in hashes[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        expected = sorted(
+            (hamming_distance(query, h), h)
+            for h in set(hashes)
+            if hamming_distance(query, h) <= 6
+        )
+        assert tree.search(query, 6) == expected
+
+
+def test_near_duplicate_cache_lookup_and_lru_eviction():
+    cache = NearDuplicateCache(max_size=2, max_distance=2, ttl=None)
+    cache.put(0b0000, "a")
+    cache.put(0b1111 << 8, "b")
+
+    # Within two bits of "a", which becomes the most recently used entry
+    assert cache.get(0b0011) == "a"
+    assert cache.get(0b0111) is None
+
+    cache.put(0b1111 << 16, "c")
+    assert len(cache) == 2
+    assert cache.get(0b1111 << 8) is None
+    assert cache.get(0b0000) == "a"
+    assert cache.get(0b1111 << 16) == "c"
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_near_duplicate_cache_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now[0])
+    cache = NearDuplicateCache(max_size=8, max_distance=2, ttl=60)
+    cache.put(0b0000, "a")
+
+    now[0] += 59
+    assert cache.get(0b0001) == "a"
+    now[0] += 2
+    assert cache.get(0b0001) is None
+    assert len(cache) == 0
+
+
+def test_near_duplicate_cache_rebuilds_the_tree_without_evicted_hashes():
+    cache = NearDuplicateCache(max_size=4, max_distance=0, ttl=None)
+    for i in range(64):
+        cache.put(1 << i, i)
+    assert len(cache) == 4
+    assert cache._tree.size <= 2 * len(cache)
+    assert [cache.get(1 << i) for i in range(60, 64)] == [60, 61, 62, 63]
@@ -1,4 +1,5 @@
 import io
+import json
 import os
 import pathlib
 import shutil
@@ -51,6 +52,167 @@ def test_ocr_endpoint_no_full_response():
     assert "raw_ocr_results" not in response_body["data"].keys()
 
 
+def test_ocr_endpoint_compact_raw_ocr_results():
+    valid_test_image = os.path.join(test_images_path, "1.jpeg")
+    response = client.post(
+        "/inec-ocr?raw_encoding=flat",
+        files={"file": open(valid_test_image, "rb")},
+        headers={"accept-encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    raw_ocr_results = response.json()["data"]["raw_ocr_results"]
+    assert raw_ocr_results["encoding"] == "flat"
+    assert len(raw_ocr_results["bboxes"]) == 8 * len(raw_ocr_results["texts"])
+    assert all(isinstance(text, str) for text in raw_ocr_results["texts"])
+    assert all(isinstance(score, float) for score in raw_ocr_results["scores"])
+
+
+def test_ocr_raw_endpoint():
+    valid_test_image = os.path.join(test_images_path, "1.jpeg")
+    with open(valid_test_image, "rb") as f:
+        response = client.post(
+            "/inec-ocr/raw?full=0",
+            content=f.read(),
+            headers={"content-type": "application/octet-stream"},
+        )
+    assert response.status_code == 200
+    response_body = response.json()
+    assert response_body["status"] == True
+    assert "raw_ocr_results" not in response_body["data"].keys()
+
+
+def test_ocr_raw_endpoint_deadline_exceeded():
+    valid_test_image = os.path.join(test_images_path, "1.jpeg")
+    with open(valid_test_image, "rb") as f:
+        response = client.post(
+            "/inec-ocr/raw",
+            content=f.read(),
+            headers={
+                "content-type": "application/octet-stream",
+                "x-request-timeout": "0.000001",
+            },
+        )
+    assert response.status_code == 504
+
+
+def test_ocr_endpoint_rejects_unknown_preset():
+    valid_test_image = os.path.join(test_images_path, "1.jpeg")
+    response = client.post(
+        "/inec-ocr?preset=fastest", files={"file": open(valid_test_image, "rb")}
+    )
+    assert response.status_code == 422
+
+
+def test_ocr_endpoint_rejects_non_image():
+    response = client.post(
+        "/inec-ocr", files={"file": ("junk.jpeg", io.BytesIO(b"not an image" * 10))}
+    )
+    assert response.status_code == 415
+
+
+def test_ocr_raw_endpoint_rejects_non_image():
+    response = client.post(
+        "/inec-ocr/raw",
+        content=b"not an image" * 10,
+        headers={"content-type": "application/octet-stream"},
+    )
+    assert response.status_code == 415
+
+
+def test_ocr_endpoint_checks_the_content_length():
+    files = {"file": ("sheet.jpeg", io.BytesIO(b"not an image" * 10))}
+    response = client.post(
+        "/inec-ocr", files=files, headers={"content-length": str(1 << 40)}
+    )
+    assert response.status_code == 413
+
+    for endpoint in ["/inec-ocr", "/inec-ocr/raw"]:
+        response = client.post(
+            endpoint,
+            content=b"not an image",
+            headers={
+                "content-type": "application/octet-stream",
+                "content-length": "12abc",
+            },
+        )
+        assert response.status_code == 400
+
+
+def test_ocr_preview_endpoint():
+    valid_test_image = os.path.join(test_images_path, "1.jpeg")
+    response = client.post(
+        "/inec-ocr/preview", files={"file": open(valid_test_image, "rb")}
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data["boxes"]) > 0
+    assert all(len(box) == 4 for box in data["boxes"])
+    assert 0 <= data["quality"]["score"] <= 1
+
+
+def test_ocr_pdf_endpoint_streams_pages():
+    image = Image.open(os.path.join(test_images_path, "1.jpeg")).convert("RGB")
+    pdf = io.BytesIO()
+    image.save(pdf, format="PDF", save_all=True, append_images=[image])
+    pdf.seek(0)
+
+    response = client.post("/inec-ocr/pdf?full=0", files={"file": ("sheets.pdf", pdf)})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["page"] for line in lines[:-1]] == [1, 2]
+    assert all(line["status"] for line in lines[:-1])
+    assert lines[-1] == {"status": True, "pages": 2, "failed": 0}
+
+
+def test_ocr_pdf_endpoint_rejects_non_pdf():
+    response = client.post(
+        "/inec-ocr/pdf", files={"file": ("junk.pdf", io.BytesIO(b"not a pdf" * 10))}
+    )
+    assert response.status_code == 415
+
+
+def make_raw_ocr_results():
+    from src.inec_ocr.constants import POLITICAL_PARTIES
+
+    bboxes, texts, scores = [], [], []
+    for i, party in enumerate(POLITICAL_PARTIES):
+        y = 100 + i * 40
+        # The party name and its vote count, on the same row
+        bboxes.append([[100, y], [140, y], [140, y + 20], [100, y + 20]])
+        texts.append(party)
+        scores.append(0.99)
+        bboxes.append([[180, y], [220, y], [220, y + 20], [180, y + 20]])
+        texts.append(str(i * 10))
+        scores.append(0.95)
+    return {"bboxes": bboxes, "texts": texts, "scores": scores}
+
+
+def test_reparse_endpoint():
+    raw_ocr_results = make_raw_ocr_results()
+    response = client.post(
+        "/inec-ocr/reparse", json={"raw_ocr_results": raw_ocr_results}
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["political_parties_vote_results"]["A"] == 0
+    assert data["political_parties_vote_results"]["ZLP"] == 150
+
+
+def test_reparse_endpoint_threshold_overrides():
+    raw_ocr_results = make_raw_ocr_results()
+    # No result is kept when the confidence threshold is above all the scores
+    response = client.post(
+        "/inec-ocr/reparse",
+        json={"raw_ocr_results": raw_ocr_results, "conf_thresh": 0.999},
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["political_parties_vote_results"] is None
+    assert data["config"]["conf_thresh"] == 0.999
+
+
 # def test_img_upload():
 # valid_image_extensions = ['png','jpeg','jpg']
 # test_images = pathlib.Path("./test-images")
@@ -0,0 +1,22 @@
+from src.inec_ocr.equivalence import diff_columns, diff_document_data
+from src.inec_ocr.types import BoundingBox, ColumnData
+
+
+def test_diff_columns():
+    column = [ColumnData("APC", BoundingBox(100, 10, 140, 30))]
+    moved = [ColumnData("APC", BoundingBox(100, 12, 140, 32))]
+    assert diff_columns([column], [column]) == []
+    assert diff_columns([column], [moved]) == [
+        "column 0, cell 0: ('APC', (100, 10, 140, 30)) != ('APC', (100, 12, 140, 32))"
+    ]
+    assert diff_columns([column], []) == ["columns: 1 != 0"]
+
+
+def test_diff_document_data():
+    reference = ({"APC": 10, "LP": 5}, None, "2023 PRESIDENTIAL ELECTION", None)
+    candidate = ({"APC": 10, "LP": 6}, None, None, None)
+    assert diff_document_data(reference, reference) == []
+    assert diff_document_data(reference, candidate) == [
+        "pol_parties_results.LP: 5 != 6",
+        "election_type: '2023 PRESIDENTIAL ELECTION' != None",
+    ]
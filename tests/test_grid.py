@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from src.inec_ocr.grid import detect_table_grid, grid_ocr_results
+
+
+def make_table(width=1200, height=1600):
+    # A two-column table of five rows, with the form's header above it
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(300, 301 + 5 * 60, 60):
+        cv2.line(image, (200, y), (800, y), (0, 0, 0), 3)
+    for x in (200, 500, 800):
+        cv2.line(image, (x, 300), (x, 600), (0, 0, 0), 3)
+    return image
+
+
+def test_table_grid_has_a_column_per_pair_of_rulings():
+    grid = detect_table_grid(make_table())
+    assert len(grid.columns) == 2
+    assert (grid.cell_columns >= 0).sum() == 10
+
+
+def test_misaligned_texts_are_assigned_to_their_cells_columns():
+    parties = ["A", "AA", "AAC", "ADC", "ADP"]
+    bboxes, texts = [], []
+    for row, (party, x) in enumerate(zip(parties, [210, 300, 230, 380, 260])):
+        y = 315 + row * 60
+        bboxes += [(x, y, x + 80, y + 30), (x + 320, y, x + 360, y + 30)]
+        texts += [party, str(row * 10)]
+    # The header's texts, outside of the table
+    bboxes += [(850, 100, 950, 130), (860, 150, 960, 180)]
+    texts += ["STATE:", "LGA:"]
+
+    cols = grid_ocr_results(make_table(), bboxes, texts)
+
+    assert [[text for text, _ in col] for col in cols] == [
+        parties,
+        ["0", "10", "20", "30", "40"],
+        ["STATE:", "LGA:"],
+    ]
@@ -0,0 +1,31 @@
+import tracemalloc
+
+from src.web.memory import MemoryMonitor, RequestMemoryProfile
+
+
+def test_request_memory_profile_stages():
+    tracemalloc.start()
+    try:
+        profile = RequestMemoryProfile()
+        buffer = bytearray(8 * 1024 * 1024)
+        profile.mark("allocate")
+        del buffer
+        profile.mark("free")
+    finally:
+        tracemalloc.stop()
+
+    assert list(profile.stages) == ["allocate", "free"]
+    assert profile.stages["allocate"].traced_delta_mb >= 7.9
+    assert profile.stages["free"].traced_delta_mb <= -7.9
+
+
+def test_memory_monitor_stats():
+    monitor = MemoryMonitor(max_rss_mb=0)
+    monitor.record(RequestMemoryProfile())
+    monitor.after_request()
+
+    stats = monitor.stats()
+    assert stats["requests"] == 1
+    assert stats["rss_mb"] > 0
+    assert len(stats["recent_requests"]) == 1
+    assert not stats["recycling"]
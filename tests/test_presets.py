@@ -0,0 +1,28 @@
+import pytest
+
+from src.inec_ocr.engine import get_det_input_size
+from src.inec_ocr.ocr import ENGINE_PRESETS
+
+
+def test_get_det_input_size():
+    assert get_det_input_size(720, 540, 960, "max") == (704, 544)
+    assert get_det_input_size(1280, 960, 960, "max") == (960, 704)
+    assert get_det_input_size(720, 540, 960, "min") == (1280, 960)
+    assert get_det_input_size(1280, 960, 960, "min") == (1280, 960)
+    with pytest.raises(ValueError):
+        get_det_input_size(720, 540, 960, "mean")
+
+
+def test_accurate_preset_upscales_phone_photos():
+    sizes = {
+        preset: get_det_input_size(
+            720, 540, params.det_limit_side_len, params.det_limit_type
+        )
+        for preset, params in ENGINE_PRESETS.items()
+    }
+    assert sizes["fast"] == sizes["balanced"] == (704, 544)
+    assert sizes["accurate"] == (1280, 960)
+    assert (
+        ENGINE_PRESETS["accurate"].det_db_unclip_ratio
+        > ENGINE_PRESETS["balanced"].det_db_unclip_ratio
+    )
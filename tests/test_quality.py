@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+from src.inec_ocr.quality import assess_image_quality
+
+
+def make_sheet(width=1200, height=1600, paper=235):
+    # A sheet of printed lines on a darker background
+    image = np.full((height, width, 3), 60, dtype=np.uint8)
+    cv2.rectangle(image, (100, 100), (width - 100, height - 100), (paper,) * 3, -1)
+    for y in range(200, height - 200, 40):
+        cv2.putText(
+            image,
+            "APC 123 PDP 456",
+            (150, y),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1,
+            (0, 0, 0),
+            2,
+        )
+    return image
+
+
+def test_sharp_sheet_passes():
+    report = assess_image_quality(make_sheet())
+    assert report.passed, report.reasons
+    assert report.coverage is not None and report.coverage > 0.5
+
+
+def test_blurry_sheet_is_rejected():
+    report = assess_image_quality(cv2.GaussianBlur(make_sheet(), (31, 31), 0))
+    assert not report.passed
+    assert any("blurry" in reason for reason in report.reasons)
+
+
+def test_small_photo_is_rejected():
+    report = assess_image_quality(cv2.resize(make_sheet(), (300, 400)))
+    assert not report.passed
+    assert any("resolution" in reason for reason in report.reasons)
+
+
+def test_glare_is_measured_against_the_sheets_paper():
+    # A white scan, whose paper is saturated, has no glare
+    scan = make_sheet()
+    scan[scan == 235] = 255
+    report = assess_image_quality(scan)
+    assert report.glare_ratio == 0.0 and report.passed, report.reasons
+
+    image = make_sheet()
+    cv2.ellipse(image, (600, 800), (400, 500), 0, 0, 360, (255, 255, 255), -1)
+    report = assess_image_quality(image)
+    assert not report.passed
+    assert any("glare" in reason for reason in report.reasons)
+
+
+def test_glare_over_most_of_the_sheet_is_rejected():
+    image = make_sheet()
+    cv2.ellipse(image, (600, 800), (480, 600), 0, 0, 360, (255, 255, 255), -1)
+    report = assess_image_quality(image)
+    assert report.glare_ratio > 0.5
+    assert any("glare" in reason for reason in report.reasons)
+
+
+def test_glare_on_bright_paper_is_rejected():
+    for paper in [242, 246]:
+        sheet = make_sheet(paper=paper)
+        report = assess_image_quality(sheet)
+        assert report.glare_ratio == 0.0 and report.passed, report.reasons
+
+        cv2.ellipse(sheet, (600, 800), (400, 500), 0, 0, 360, (255, 255, 255), -1)
+        report = assess_image_quality(sheet)
+        assert any("glare" in reason for reason in report.reasons)
@@ -0,0 +1,34 @@
+from src.web.results_store import ResultsStore
+
+ELECTION_TYPE = "2023 PRESIDENTIAL ELECTION"
+
+
+def make_pu_reg_info(polling_unit):
+    return {
+        "State": "Lagos",
+        "Local Government Area": "Ikeja",
+        "Registration Area": "Anifowoshe",
+        "Polling Unit": polling_unit,
+    }
+
+
+def test_results_store_incremental_rollups(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    store.record(ELECTION_TYPE, make_pu_reg_info("PU 001"), {"APC": 10, "LP": 5})
+    store.record(ELECTION_TYPE, make_pu_reg_info("PU 002"), {"APC": 1, "LP": 50})
+
+    # A re-upload of a sheet replaces its votes in the rollups
+    store.record(ELECTION_TYPE, make_pu_reg_info("PU 001"), {"APC": 12, "LP": 5})
+
+    (state,) = store.get_rollups(ELECTION_TYPE, "state")
+    assert state == {"state": "LAGOS", "sheets": 2, "votes": {"APC": 13, "LP": 55}}
+
+    polling_units = store.get_rollups(ELECTION_TYPE, "polling_unit", lga="ikeja")
+    assert [pu["votes"]["APC"] for pu in polling_units] == [12, 1]
+
+
+def test_results_store_skips_unkeyed_sheets(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    pu_reg_info = {**make_pu_reg_info("PU 001"), "Polling Unit": None}
+    assert store.record(ELECTION_TYPE, pu_reg_info, {"APC": 10}) is None
+    assert store.get_rollups(ELECTION_TYPE, "state") == []
@@ -0,0 +1,35 @@
+import asyncio
+
+from src.web.scheduler import BULK_LANE, INTERACTIVE_LANE, ClientIdentity, FairScheduler
+
+
+def test_scheduler_serves_interactive_first_and_bulk_clients_fairly():
+    async def run():
+        scheduler = FairScheduler(concurrency=1)
+        queued = asyncio.Event()
+        order = []
+
+        async def request(client: ClientIdentity, label: str):
+            async with scheduler.slot(client, 1.0):
+                order.append(label)
+                # The first request holds its slot until the others are queued
+                await queued.wait()
+
+        heavy = ClientIdentity("token:heavy", BULK_LANE, 1.0)
+        light = ClientIdentity("token:light", BULK_LANE, 1.0)
+        user = ClientIdentity("ip:phone", INTERACTIVE_LANE, 1.0)
+
+        # The heavy client queues a backlog before the others arrive
+        tasks = [asyncio.create_task(request(heavy, f"heavy{i}")) for i in range(4)]
+        tasks += [asyncio.create_task(request(light, f"light{i}")) for i in range(2)]
+        tasks.append(asyncio.create_task(request(user, "user")))
+        await asyncio.sleep(0)
+        queued.set()
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["heavy0", "user", "heavy1", "light0", "heavy2", "light1", "heavy3"]
+    assert stats["running"] == 0
+    assert stats["lanes"][BULK_LANE]["completed"] == 6
+    assert stats["lanes"][INTERACTIVE_LANE]["latency_s"]["p99"] is not None
@@ -0,0 +1,23 @@
+import asyncio
+
+from src.web.storage import LocalStorage, get_content_key
+
+
+def test_local_storage_content_addressed_keys(tmp_path):
+    storage = LocalStorage(tmp_path, url_prefix="/uploads")
+    buffer = b"annotated image bytes"
+
+    url = storage.upload(buffer, ".jpg")
+    assert url == f"/uploads/{get_content_key(buffer, '.jpg')}"
+    assert (tmp_path / get_content_key(buffer, ".jpg")).read_bytes() == buffer
+
+    # Identical content maps to the same object, different content never collides
+    assert storage.upload(buffer, ".jpg") == url
+    assert storage.upload(b"another image", ".jpg") != url
+
+
+def test_local_storage_upload_async(tmp_path):
+    storage = LocalStorage(tmp_path)
+    url = asyncio.run(storage.upload_async(b"annotated image bytes", ".webp"))
+    assert url.endswith(".webp")
+    assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,23 @@
+from src.inec_ocr.pipeline import parse_ocr_results
+from src.inec_ocr.synthetic import generate_sheet
+
+
+def test_synthetic_sheet_is_parsed_back_to_its_results():
+    sheet = generate_sheet(seed=0, extra_boxes=50)
+    assert len(sheet.raw_ocr_results.texts) == 73 + 50
+    assert sheet.image is None
+
+    pol_parties_results, _, election_type, pu_reg_info_results = parse_ocr_results(
+        *sheet.raw_ocr_results
+    )
+    assert pol_parties_results == sheet.pol_parties_results
+    assert election_type == sheet.election_type
+    assert pu_reg_info_results == sheet.pu_reg_info_results
+
+
+def test_synthetic_sheet_is_rendered_with_its_skewed_boxes():
+    sheet = generate_sheet(seed=1, skew=3, noise=0.5, render=True)
+    height, width = sheet.image.shape[:2]
+    for box in sheet.raw_ocr_results.bboxes:
+        for x, y in box:
+            assert 0 <= x < width and 0 <= y < height
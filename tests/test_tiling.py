@@ -0,0 +1,65 @@
+import numpy as np
+
+from src.inec_ocr.tiling import get_tiles, merge_tile_boxes
+
+
+def make_box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def test_tiles_cover_the_image_with_overlap():
+    tiles = get_tiles(2500, 3000, 960, 160)
+    assert max(x1 for _, _, x1, _ in tiles) == 3000
+    assert max(y1 for _, _, _, y1 in tiles) == 2500
+
+    x_starts = sorted({x0 for x0, _, _, _ in tiles})
+    assert all(b - a <= 960 - 160 for a, b in zip(x_starts, x_starts[1:]))
+
+
+def get_rects(boxes):
+    return sorted(
+        (box[:, 0].min(), box[:, 1].min(), box[:, 0].max(), box[:, 1].max())
+        for box in boxes
+    )
+
+
+# Two tiles, whose overlap band is 800 <= x < 960
+TILES = [(0, 0, 960, 960), (800, 0, 1760, 960)]
+
+
+def test_merge_tile_boxes_across_seams():
+    boxes = np.array(
+        [
+            # The same text, whole in one tile and truncated in the other
+            make_box(900, 100, 1000, 130),
+            make_box(900, 100, 960, 130),
+            # A long text detected in two overlapping pieces
+            make_box(500, 300, 960, 330),
+            make_box(800, 302, 1400, 331),
+            # A text on the next line
+            make_box(900, 132, 1000, 160),
+        ],
+        dtype="float32",
+    )
+    merged = merge_tile_boxes(boxes, np.array([1, 0, 0, 1, 1]), TILES)
+    assert get_rects(merged) == [
+        (500, 300, 1400, 331),
+        (900, 100, 1000, 130),
+        (900, 132, 1000, 160),
+    ]
+
+
+def test_merge_tile_boxes_keeps_the_boxes_of_a_single_tile():
+    boxes = np.array(
+        [
+            # A party name and its vote count, touching, far from the seam
+            make_box(100, 100, 300, 140),
+            make_box(297, 102, 400, 138),
+            # The same in the overlap band, but detected by the same tile
+            make_box(820, 200, 880, 240),
+            make_box(878, 202, 950, 238),
+        ],
+        dtype="float32",
+    )
+    merged = merge_tile_boxes(boxes, np.array([0, 0, 1, 1]), TILES)
+    assert get_rects(merged) == get_rects(boxes)
@@ -0,0 +1,239 @@
+import numpy as np
+import pytest
+
+from src.inec_ocr import validation
+from src.inec_ocr.clustering import cluster_ocr_results
+from src.inec_ocr.document import get_document_data
+from src.inec_ocr.ocr import filter_text_predictions
+from src.inec_ocr.synthetic import generate_sheet
+from src.inec_ocr.types import BoundingBox, DocumentParserConfig
+from src.inec_ocr.validation import (
+    TOTAL_VALID_VOTES_FIELD,
+    get_cell_crop,
+    get_political_parties_cells,
+    get_total_valid_votes_cell,
+    is_misread_number,
+    parse_number,
+    recognize_cells,
+    recognize_numeric_cells,
+    validate_document_data,
+)
+
+
+class FakeEngine:
+    def __init__(self, rec_res):
+        self.rec_res = rec_res
+        self.drop_score = 0.5
+        self.num_crops = 0
+
+    def recognize_crops(self, crops, digits=False):
+        assert digits
+        self.num_crops += len(crops)
+        return self.rec_res[: len(crops)]
+
+
+@pytest.fixture(scope="module")
+def sheet():
+    sheet = generate_sheet(seed=3)
+    all_cols = cluster_ocr_results(
+        *filter_text_predictions(*sheet.raw_ocr_results, 0.6), 30
+    )
+    pol_parties_results, pu_data_results, _, _ = get_document_data(all_cols)
+    assert pol_parties_results == sheet.pol_parties_results
+    return all_cols, pol_parties_results, pu_data_results
+
+
+def test_parse_number():
+    assert parse_number("1,204") == 1204
+    assert parse_number(" 12O ") == 120
+    assert parse_number("l5.") == 15
+    assert parse_number("1 2") == 12
+    assert parse_number("NIL") is None
+    assert parse_number("") is None
+
+
+def test_is_misread_number():
+    assert is_misread_number("1O")
+    assert is_misread_number("O")
+    assert is_misread_number("l2,")
+    assert not is_misread_number("12")
+    assert not is_misread_number("-")
+    assert not is_misread_number("")
+    assert not is_misread_number("NIL")
+
+
+def test_only_the_misread_numeric_cells_are_re_read(sheet):
+    all_cols, pol_parties_results, pu_data_results = sheet
+    cells = get_political_parties_cells(all_cols, DocumentParserConfig())
+    misread, dash, low_score = list(pol_parties_results)[:3]
+    texts = {cells[misread]: "1O", cells[dash]: "-", cells[low_score]: "S"}
+    all_cols = [
+        [(texts.get(bbox, text), bbox) for text, bbox in col] for col in all_cols
+    ]
+    results = {**pol_parties_results, misread: None, dash: None, low_score: None}
+    image = np.zeros(
+        (
+            max(bbox[3] for col in all_cols for _, bbox in col) + 10,
+            max(bbox[2] for col in all_cols for _, bbox in col) + 10,
+            3,
+        ),
+        dtype=np.uint8,
+    )
+
+    engine = FakeEngine([("10", 0.95), ("5", 0.6)])
+    new_results, new_pu_data_results = recognize_numeric_cells(
+        image, all_cols, results, pu_data_results, engine
+    )
+    assert engine.num_crops == 2
+    assert new_results == {**results, misread: 10}
+    assert new_pu_data_results == pu_data_results
+
+
+def test_get_cell_crop_pads_and_clips_to_the_image():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    assert get_cell_crop(image, BoundingBox(10, 10, 50, 30)).shape == (28, 48, 3)
+    assert get_cell_crop(image, BoundingBox(0, 90, 200, 100)).shape == (14, 200, 3)
+    assert get_cell_crop(image, BoundingBox(300, 10, 350, 30)) is None
+
+
+def test_cells_are_matched_or_estimated_opposite_their_names(sheet):
+    all_cols, pol_parties_results, _ = sheet
+    config = DocumentParserConfig()
+    cells = get_political_parties_cells(all_cols, config)
+    assert list(cells) == list(pol_parties_results)
+    rows = {
+        text: bbox
+        for col in all_cols
+        for text, bbox in col
+        if text in pol_parties_results
+    }
+    for party, bbox in cells.items():
+        assert abs(bbox[1] - rows[party][1]) <= config.pol_parties_row_tolerance
+        assert bbox[0] > rows[party][2]
+
+    # A vote cell that was not detected is estimated in the results column
+    party = next(iter(pol_parties_results))
+    all_cols = [[cell for cell in col if cell[1] != cells[party]] for col in all_cols]
+    estimated = get_political_parties_cells(all_cols, config)[party]
+    assert estimated[1] == rows[party][1]
+    assert abs(estimated[0] - cells[party][0]) <= 2
+
+    assert get_total_valid_votes_cell(all_cols, config) is not None
+
+
+def test_recognize_cells_keeps_the_most_confident_number():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    cells = {"A": BoundingBox(10, 10, 50, 30), "AA": BoundingBox(10, 50, 50, 70)}
+    engine = FakeEngine([("12", 0.7), ("13", 0.9), ("X", 0.99), ("1O", 0.6)])
+    assert recognize_cells(image, cells, engine) == {"A": 13, "AA": 10}
+
+
+def test_recognize_cells_rejects_the_unconfident_readings():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    cells = {"A": BoundingBox(10, 10, 50, 30), "AA": BoundingBox(10, 50, 50, 70)}
+    engine = FakeEngine([("12", 0.4), ("13", 0.01), ("X", 0.99), ("1O", 0.6)])
+    assert recognize_cells(image, cells, engine) == {"A": None, "AA": 10}
+    assert recognize_cells(image, cells, engine, min_score=0.7) == {
+        "A": None,
+        "AA": None,
+    }
+
+
+def test_consistent_results_are_not_re_recognized(sheet, monkeypatch):
+    all_cols, pol_parties_results, pu_data_results = sheet
+
+    def fail(*args):
+        raise AssertionError("re-recognized")
+
+    monkeypatch.setattr(validation, "recognize_cells", fail)
+    results, _, report = validate_document_data(
+        None, all_cols, pol_parties_results, pu_data_results, None
+    )
+    assert results == pol_parties_results
+    assert report.consistent and report.corrected == {}
+
+
+def test_corrections_are_only_merged_when_the_votes_add_up(sheet, monkeypatch):
+    all_cols, pol_parties_results, pu_data_results = sheet
+    party, other = list(pol_parties_results)[:2]
+    misread = {**pol_parties_results, party: pol_parties_results[party] + 100}
+    readings = {}
+    monkeypatch.setattr(
+        validation,
+        "recognize_cells",
+        lambda image, cells, engine, **kwargs: dict(readings),
+    )
+
+    # The other party's reading is wrong too, only the correction that makes the
+    # votes add up is merged
+    readings.update(pol_parties_results)
+    readings[other] += 7
+    readings[TOTAL_VALID_VOTES_FIELD] = pu_data_results[TOTAL_VALID_VOTES_FIELD]
+    results, _, report = validate_document_data(
+        None, all_cols, misread, pu_data_results, None
+    )
+    assert results == pol_parties_results
+    assert report.consistent
+    assert report.corrected == {party: (misread[party], pol_parties_results[party])}
+
+    # No reading makes the votes add up, the results are kept
+    readings[party] += 1
+    results, data, report = validate_document_data(
+        None, all_cols, misread, pu_data_results, None
+    )
+    assert results == misread and data == pu_data_results
+    assert not report.consistent and report.corrected == {}
+
+
+def test_missing_votes_are_only_filled_when_consistent(sheet, monkeypatch):
+    all_cols, pol_parties_results, pu_data_results = sheet
+    party = next(iter(pol_parties_results))
+    missing = {**pol_parties_results, party: None}
+    readings = {}
+    monkeypatch.setattr(
+        validation,
+        "recognize_cells",
+        lambda image, cells, engine, **kwargs: dict(readings),
+    )
+
+    readings[party] = pol_parties_results[party] + 1
+    results, _, report = validate_document_data(
+        None, all_cols, missing, pu_data_results, None
+    )
+    assert results[party] is None
+    assert not report.consistent and report.unresolved == [party]
+    assert report.corrected == {}
+    assert report.unconfirmed == {party: pol_parties_results[party] + 1}
+
+    readings[party] = pol_parties_results[party]
+    results, _, report = validate_document_data(
+        None, all_cols, missing, pu_data_results, None
+    )
+    assert results == pol_parties_results
+    assert report.consistent and report.unconfirmed == {}
+    assert report.corrected == {party: (None, pol_parties_results[party])}
+
+
+def test_a_zero_total_is_not_missing(sheet, monkeypatch):
+    all_cols, pol_parties_results, pu_data_results = sheet
+    zeros = {party: 0 for party in pol_parties_results}
+    party = next(iter(zeros))
+    readings = {**zeros, TOTAL_VALID_VOTES_FIELD: 0}
+    monkeypatch.setattr(
+        validation,
+        "recognize_cells",
+        lambda image, cells, engine, **kwargs: dict(readings),
+    )
+
+    # Both a vote and the total of an empty unit were misread, the re-read total of 0
+    # is kept
+    results, data, report = validate_document_data(
+        None,
+        all_cols,
+        {**zeros, party: 7},
+        {**pu_data_results, TOTAL_VALID_VOTES_FIELD: 5},
+        None,
+    )
+    assert results == zeros and data[TOTAL_VALID_VOTES_FIELD] == 0
+    assert report.consistent
+    assert report.corrected == {party: (7, 0), TOTAL_VALID_VOTES_FIELD: (5, 0)}